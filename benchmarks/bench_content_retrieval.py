@@ -0,0 +1,123 @@
+"""
+Benchmark for utils/content_retrieval.py against a local HTTP server
+
+The server answers every page after a fixed delay and supports ETag
+revalidation, so the numbers show the effect of concurrency, keep-alive,
+the conditional-GET cache and the parser without touching the network.
+Run from the project root:
+    python -m benchmarks.bench_content_retrieval --pages 200 --latency-ms 50
+"""
+import argparse
+import hashlib
+import json
+import random
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from utils import content_retrieval
+from utils.content_retrieval import HtmlCache, extract_text, fetch_html_many
+
+def make_page(n, paragraphs, seed=0):
+    rng = random.Random(seed * 100003 + n)
+    words = ["pocket", "flow", "graph", "node", "shared", "store", "agent", "batch", "retrieval"]
+    body = "".join(f"<p>{' '.join(rng.choice(words) for _ in range(60))}</p>\n" for _ in range(paragraphs))
+    return (f"<html><head><title>Page {n}</title><style>p {{ margin: 0 }}</style>"
+            f"<script>var n = {n};</script></head><body>{body}</body></html>").encode("utf-8")
+
+def start_server(pages, latency):
+    """Serve /page/<n> with ETags on 127.0.0.1; returns (server, base_url, request_counter)."""
+    etags = {n: '"' + hashlib.md5(page).hexdigest() + '"' for n, page in pages.items()}
+    counter = {"requests": 0, "not_modified": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+
+        def do_GET(self):
+            time.sleep(latency)
+            n = int(self.path.rsplit("/", 1)[-1])
+            with lock:
+                counter["requests"] += 1
+            if self.headers.get("If-None-Match") == etags[n]:
+                with lock:
+                    counter["not_modified"] += 1
+                self.send_response(304)
+                self.send_header("ETag", etags[n])
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("ETag", etags[n])
+            self.send_header("Content-Length", str(len(pages[n])))
+            self.end_headers()
+            self.wfile.write(pages[n])
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.request_queue_size = 512
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}", counter
+
+def serial_baseline(urls):
+    # The previous implementation: a new connection and html.parser for every URL
+    for url in urls:
+        response = requests.get(url, headers={"User-Agent": content_retrieval.USER_AGENT}, timeout=10)
+        response.raise_for_status()
+        extract_text(response.text, parser="html.parser")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk HTML fetch throughput against a local server")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--paragraphs", type=int, default=50, help="Paragraphs per page")
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--per-host", type=int, default=16)
+    parser.add_argument("--json", type=str, help="Also write results to this JSON file")
+    args = parser.parse_args()
+
+    pages = {n: make_page(n, args.paragraphs) for n in range(args.pages)}
+    server, base_url, counter = start_server(pages, args.latency_ms / 1000)
+    urls = [f"{base_url}/page/{n}" for n in range(args.pages)]
+
+    # Parser cost alone, on one page
+    page = pages[0]
+    for name in content_retrieval.PARSERS:
+        if name == "lxml" and content_retrieval.lxml is None:
+            continue
+        start = time.perf_counter()
+        for _ in range(20):
+            extract_text(page, parser=name)
+        print(f"parse {name:<12} {(time.perf_counter() - start) / 20 * 1000:>8.2f} ms/page")
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        content_retrieval._cache = HtmlCache(tmp)
+        runs = [
+            ("serial", lambda: serial_baseline(urls)),
+            ("bulk_cold", lambda: fetch_html_many(urls, max_workers=args.workers, per_host=args.per_host)),
+            ("bulk_revalidate", lambda: fetch_html_many(urls, max_workers=args.workers, per_host=args.per_host)),
+            ("bulk_max_age", lambda: fetch_html_many(urls, max_workers=args.workers, per_host=args.per_host,
+                                                     max_age=3600)),
+        ]
+        for name, run in runs:
+            counter["requests"] = counter["not_modified"] = 0
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            result = {"mode": name, "pages": args.pages, "seconds": elapsed, "pages_per_s": args.pages / elapsed,
+                      "requests": counter["requests"], "not_modified": counter["not_modified"]}
+            results.append(result)
+            print(f"{name:<16}{elapsed:>8.2f}s {result['pages_per_s']:>9.1f} pages/s  "
+                  f"requests={result['requests']} 304s={result['not_modified']}")
+    server.shutdown()
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,90 @@
+"""
+Benchmark for utils/html_generator.py on pages with thousands of bullets
+
+Compares the previous += renderer with html_generator() (list join) and
+write_html() (streamed to a file). Run from the project root:
+    python -m benchmarks.bench_html_generator --sections 50 --bullets 200
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from utils.html_generator import _HEAD, escape, html_generator, write_html
+
+def legacy_html_generator(title, image_url, sections):
+    # The previous renderer: the page is grown with += for every bullet
+    html_template = _HEAD + f"""<h1 class=\"text-4xl text-gray-800 mb-4\">{escape(title)}</h1>
+    <!-- Image below Title 1 -->
+    <img
+      src=\"{escape(image_url)}\"
+      alt=\"Placeholder image\"
+      class=\"rounded-xl mb-6\"
+    />"""
+    for section in sections:
+        html_template += f"""
+    <h2 class=\"text-2xl text-gray-800 mb-4\">{escape(section.get("title", ""))}</h2>
+    <ul class=\"text-gray-600\">"""
+        for bold_text, normal_text in section.get("bullets", []):
+            html_template += f"""
+      <li>
+        <strong>{escape(bold_text)}</strong><br />
+        <div class="bullet-content">{normal_text}</div>
+      </li>"""
+        html_template += "\n    </ul>"
+    html_template += """
+  </div>
+</body>
+</html>"""
+    return html_template
+
+def make_sections(num_sections, bullets_per_section):
+    return [
+        {
+            "title": f"Section {s} & notes",
+            "bullets": [(f"Point {s}.{b}", f"Detail for point {b}. <ol><li>one</li><li>two</li></ol>")
+                        for b in range(bullets_per_section)],
+        }
+        for s in range(num_sections)
+    ]
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTML rendering time for large pages")
+    parser.add_argument("--sections", type=int, default=50)
+    parser.add_argument("--bullets", type=int, default=200, help="Bullets per section")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", type=str, help="Also write results to this JSON file")
+    args = parser.parse_args()
+
+    sections = make_sections(args.sections, args.bullets)
+    args_ = ("Big page", "https://picsum.photos/600/300?grayscale", sections)
+    page = html_generator(*args_)
+    assert legacy_html_generator(*args_) == page
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "page.html")
+        runs = [
+            ("legacy_concat", lambda: legacy_html_generator(*args_)),
+            ("join", lambda: html_generator(*args_)),
+            ("stream_to_file", lambda: write_html(path, *args_)),
+        ]
+        results = []
+        for name, fn in runs:
+            seconds = best_of(fn, args.repeat)
+            result = {"mode": name, "bullets": args.sections * args.bullets, "bytes": len(page),
+                      "seconds": seconds, "mb_per_s": len(page) / seconds / 1e6}
+            results.append(result)
+            print(f"{name:<16}{seconds * 1000:>9.2f} ms {result['mb_per_s']:>8.1f} MB/s "
+                  f"({result['bullets']} bullets, {len(page) / 1e6:.1f} MB)")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
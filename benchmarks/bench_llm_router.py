@@ -0,0 +1,78 @@
+"""
+Tail latency of utils/llm_router.py against local fake LLM servers
+
+Three backends serve one model name: a fast one with a long tail, a slower
+steady one and a flaky one that fails a share of its calls. The same calls
+are routed with and without hedging. Run from the project root:
+    python -m benchmarks.bench_llm_router --calls 400 --workers 8
+"""
+import argparse
+import json
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.fake_llm_server import FakeLLMServer
+from utils.latency_stats import summarize_latencies, format_summary
+from utils.llm_router import Backend, LLMRouter
+
+MODEL = "deepseek-chat"
+
+def run(router, calls, workers):
+    used = Counter()
+    errors = 0
+
+    def one(i):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            _, backend = router.complete(MODEL, [{"role": "user", "content": f"question {i}"}])
+            used[backend.name] += 1
+        except Exception:
+            errors += 1
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        latencies = list(executor.map(one, range(calls)))
+    summary = summarize_latencies(latencies, elapsed=time.perf_counter() - start)
+    return summary, dict(used), errors
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Routed LLM call latency with and without hedging")
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--fast", type=str, default="lognormal:40:0.9", help="Latency spec of the fast backend")
+    parser.add_argument("--steady", type=str, default="uniform:80:120", help="Latency spec of the steady backend")
+    parser.add_argument("--flaky-error-rate", type=float, default=0.5)
+    parser.add_argument("--json", type=str, help="Also write results to this JSON file")
+    args = parser.parse_args()
+
+    servers = {
+        "fast": FakeLLMServer(latency=args.fast, seed=1),
+        "steady": FakeLLMServer(latency=args.steady, seed=2),
+        "flaky": FakeLLMServer(latency="fixed:20", error_rate=args.flaky_error_rate, error_status=503, seed=3),
+    }
+    for server in servers.values():
+        server.start()
+    results = []
+    try:
+        for hedge in (False, True):
+            backends = [Backend(name, server.base_url, MODEL, rate=10000) for name, server in servers.items()]
+            router = LLMRouter({MODEL: backends}, hedge=hedge)
+            run(router, 50, args.workers)  # warm up: learn latencies and trip the flaky backend's circuit
+            summary, used, errors = run(router, args.calls, args.workers)
+            stats = router.stats()
+            mode = "hedged" if hedge else "routed"
+            results.append({"mode": mode, **summary, "backends": used, "errors": errors,
+                            "hedges": stats["hedges"], "hedge_wins": stats["hedge_wins"],
+                            "fallbacks": stats["fallbacks"]})
+            print(f"{mode:<8}{format_summary(summary)} errors={errors}")
+            print(f"        backends {used}, hedges {stats['hedges']} (won {stats['hedge_wins']}), "
+                  f"fallbacks {stats['fallbacks']}")
+    finally:
+        for server in servers.values():
+            server.stop()
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,154 @@
+"""
+End-to-end benchmark for qa_flow against a local fake LLM server
+
+No API key or network is needed: utils/fake_llm_server.py answers every
+call with a configurable latency distribution and validation verdict. Each
+mode runs in a fresh subprocess (LLM response cache off) so peak memory is
+measured per mode. Run from the project root:
+    python -m benchmarks.bench_qa_flow --questions 200 --latency lognormal:100:0.5 --correct-ratio 0.7
+
+Save a baseline and check later runs against it (exit status 1 on regression):
+    python -m benchmarks.bench_qa_flow --save-baseline benchmarks/baselines/qa_flow.json
+    python -m benchmarks.bench_qa_flow --compare benchmarks/baselines/qa_flow.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+from utils.fake_llm_server import FakeLLMServer
+
+MODES = ["sync", "stream", "thread", "async"]
+
+def run_mode(mode, questions, workers, max_attempts):
+    # Imported here so the subprocess picks up DEEPSEEK_BASE_URL from its environment
+    from flow import get_validation_stats
+    from main import run_batch_async, run_batch_threaded, run_one
+    from utils.call_llm import get_pool_stats
+    from utils.latency_stats import summarize_latencies
+
+    items = [(i, f"Benchmark question {i}: what does node {i % 17} do?") for i in range(questions)]
+    options = {"max_attempts": max_attempts}
+    results = []
+    start = time.perf_counter()
+    if mode == "sync":
+        results = [run_one(item, options) for item in items]
+    elif mode == "stream":
+        options["on_token"] = lambda token: None
+        results = [run_one(item, options) for item in items]
+    elif mode == "thread":
+        run_batch_threaded(items, workers, results.append, options)
+    elif mode == "async":
+        asyncio.run(run_batch_async(items, workers, results.append, options))
+    else:
+        raise ValueError(f"Unknown mode {mode}")
+    elapsed = time.perf_counter() - start
+
+    attempts = [result.get("attempts") or 0 for result in results]
+    return {
+        "mode": mode,
+        "workers": 1 if mode in ("sync", "stream") else workers,
+        "errors": sum("error" in result for result in results),
+        "correct": sum(bool(result.get("is_correct")) for result in results),
+        "attempts_mean": sum(attempts) / len(attempts) if attempts else None,
+        "attempts_max": max(attempts, default=None),
+        "llm_requests": get_pool_stats()["requests"],
+        "escalations": get_validation_stats()["escalations"],
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        **summarize_latencies([result["latency"] for result in results], elapsed=elapsed),
+    }
+
+def compare(results, baseline, tolerance):
+    """Return a list of regressions: lower throughput or higher p95 than the baseline beyond tolerance."""
+    previous = {result["mode"]: result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = previous.get(result["mode"])
+        if old is None:
+            continue
+        if result["throughput"] < old["throughput"] * (1 - tolerance):
+            regressions.append(f"{result['mode']}: throughput {result['throughput']:.2f}/s "
+                               f"< baseline {old['throughput']:.2f}/s")
+        if result["p95"] > old["p95"] * (1 + tolerance):
+            regressions.append(f"{result['mode']}: p95 {result['p95'] * 1000:.1f}ms "
+                               f"> baseline {old['p95'] * 1000:.1f}ms")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="qa_flow throughput and latency against a fake LLM server")
+    parser.add_argument("--questions", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=16, help="Concurrent questions in thread and async modes")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--latency", type=str, default="lognormal:100:0.5",
+                        help='Server latency in ms: "fixed:50", "uniform:20:200" or "lognormal:MEDIAN:SIGMA"')
+    parser.add_argument("--correct-ratio", type=float, default=0.7,
+                        help="Probability that the fake validator accepts an answer")
+    parser.add_argument("--confidence", type=float, default=0.9,
+                        help="Confidence of JSON-mode verdicts (below the flow threshold escalates)")
+    parser.add_argument("--max-attempts", type=int, default=5)
+    parser.add_argument("--json", type=str, help="Also write results to this JSON file")
+    parser.add_argument("--rate-limit", type=float, default=1000.0,
+                        help="LLM calls/s allowed by the shared limiter (the production default would cap the run)")
+    parser.add_argument("--save-baseline", type=str, metavar="PATH", help="Write the run as a baseline")
+    parser.add_argument("--compare", type=str, metavar="PATH", help="Fail if the run regresses against a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    parser.add_argument("--run-mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_mode:
+        print(json.dumps(run_mode(args.run_mode, args.questions, args.workers, args.max_attempts)))
+        sys.exit(0)
+
+    results = []
+    with FakeLLMServer(latency=args.latency, correct_ratio=args.correct_ratio, confidence=args.confidence,
+                       seed=0) as server:
+        env = {**os.environ, "DEEPSEEK_BASE_URL": server.base_url, "DEEPSEEK_API_KEY": "fake",
+               "LLM_CACHE": "off", "LOG_LEVEL": "WARNING", "LLM_RATE_LIMIT": str(args.rate_limit)}
+        for mode in args.modes:
+            out = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_qa_flow", "--run-mode", mode,
+                 "--questions", str(args.questions), "--workers", str(args.workers),
+                 "--max-attempts", str(args.max_attempts)],
+                check=True, capture_output=True, text=True, env=env,
+            ).stdout
+            result = json.loads(out)
+            results.append(result)
+            print(f"{mode:<8}{result['throughput']:>8.2f} q/s  p50 {result['p50'] * 1000:>7.1f}ms  "
+                  f"p95 {result['p95'] * 1000:>7.1f}ms  p99 {result['p99'] * 1000:>7.1f}ms  "
+                  f"attempts {result['attempts_mean']:.2f} (max {result['attempts_max']})  "
+                  f"LLM calls {result['llm_requests']}  errors {result['errors']}  "
+                  f"max RSS {result['max_rss_mb']:.1f} MB")
+        print(f"Server: {server.stats}")
+
+    run = {
+        "benchmark": "qa_flow",
+        "created": time.time(),
+        "python": platform.python_version(),
+        "config": {key: getattr(args, key) for key in
+                   ("questions", "workers", "latency", "correct_ratio", "confidence", "max_attempts",
+                    "rate_limit")},
+        "results": results,
+    }
+    for path in (args.json, args.save_baseline):
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(path, "w") as f:
+                json.dump(run if path == args.save_baseline else results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != run["config"]:
+            print(f"Warning: baseline config differs: {baseline.get('config')}")
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.compare} (tolerance {args.tolerance:.0%})")
@@ -0,0 +1,94 @@
+"""
+Benchmark for utils/search_web.py against a local fake search server
+
+The server mimics the Custom Search JSON API with a fixed delay per
+request. Run from the project root:
+    python -m benchmarks.bench_search_web --queries 100 --unique 40 --latency-ms 100
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+from utils import search_web as search_module
+from utils.rate_limiter import configure_limiter
+from utils.search_web import GoogleSearchBackend, search_web_many
+
+def start_server(latency):
+    """Serve fake search results on 127.0.0.1; returns (server, url, request_counter)."""
+    counter = {"requests": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+
+        def do_GET(self):
+            time.sleep(latency)
+            with lock:
+                counter["requests"] += 1
+            params = parse_qs(urlsplit(self.path).query)
+            query, num = params["q"][0], int(params.get("num", ["10"])[0])
+            body = json.dumps({"items": [
+                {"title": f"{query} result {i}", "snippet": f"About {query}", "link": f"https://example.com/{i}"}
+                for i in range(num)
+            ]}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.request_queue_size = 512
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/customsearch/v1", counter
+
+def serial_baseline(url, queries):
+    # The previous implementation: one uncached request per query, no session
+    for query in queries:
+        requests.get(url, params={"key": "k", "cx": "c", "q": query, "num": 10}).json()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multi-query search throughput against a local fake server")
+    parser.add_argument("--queries", type=int, default=100, help="Queries per run")
+    parser.add_argument("--unique", type=int, default=40, help="Distinct queries among them")
+    parser.add_argument("--latency-ms", type=float, default=100)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=1000, help="Search limiter rate for the run (queries/s)")
+    parser.add_argument("--json", type=str, help="Also write results to this JSON file")
+    args = parser.parse_args()
+
+    server, url, counter = start_server(args.latency_ms / 1000)
+    rng = random.Random(0)
+    queries = [f"query {rng.randrange(args.unique)}" for _ in range(args.queries)]
+    search_module.set_backend(GoogleSearchBackend(url=url, api_key="k", cse_id="c"))
+    configure_limiter("google_search", rate=args.rate, max_concurrency=args.workers)
+
+    runs = [
+        ("serial", lambda: serial_baseline(url, queries)),
+        ("many_cold", lambda: search_web_many(queries, max_workers=args.workers)),
+        ("many_cached", lambda: search_web_many(queries, max_workers=args.workers)),
+    ]
+    results = []
+    for name, run in runs:
+        counter["requests"] = 0
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        result = {"mode": name, "queries": len(queries), "seconds": elapsed,
+                  "queries_per_s": len(queries) / elapsed, "requests": counter["requests"]}
+        results.append(result)
+        print(f"{name:<12}{elapsed:>8.2f}s {result['queries_per_s']:>9.1f} queries/s  requests={result['requests']}")
+    server.shutdown()
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
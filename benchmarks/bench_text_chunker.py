@@ -0,0 +1,103 @@
+"""
+Throughput benchmark for utils/text_chunker.py on large inputs
+
+Each mode runs in a fresh subprocess so peak memory (max RSS) is measured
+per mode. Run from the project root:
+    python -m benchmarks.bench_text_chunker --mb 300
+"""
+import argparse
+import json
+import mmap
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from utils.text_chunker import chunk_text, iter_chunk_spans
+
+MODES = ["chunk_text", "spans_str", "spans_mmap", "spans_stream", "spans_stream_tokens"]
+
+def write_corpus(path, megabytes, seed=0):
+    """Write a synthetic transcript-like text file of about `megabytes` MB."""
+    rng = random.Random(seed)
+    words = ["pocket", "flow", "graph", "node", "shared", "store", "agent", "batch", "retrieval",
+             "embedding", "latency", "throughput", "question", "answer", "validate", "index"]
+    target = megabytes * 1024 * 1024
+    with open(path, "w", encoding="utf-8") as f:
+        written = 0
+        while written < target:
+            sentences = []
+            for _ in range(rng.randint(3, 8)):
+                sentence = " ".join(rng.choice(words) for _ in range(rng.randint(6, 20)))
+                sentences.append(sentence.capitalize() + rng.choice([".", ".", "?", "!"]))
+            paragraph = " ".join(sentences) + "\n\n"
+            f.write(paragraph)
+            written += len(paragraph)
+
+def run_mode(mode, path, chunk_size, overlap):
+    start = time.perf_counter()
+    if mode == "chunk_text":
+        with open(path, encoding="utf-8") as f:
+            chunks = len(chunk_text(f.read(), chunk_size=chunk_size, overlap=overlap))
+    elif mode == "spans_str":
+        with open(path, encoding="utf-8") as f:
+            chunks = sum(1 for _ in iter_chunk_spans(f.read(), chunk_size, overlap))
+    elif mode == "spans_mmap":
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            chunks = sum(1 for _ in iter_chunk_spans(m, chunk_size, overlap))
+    elif mode == "spans_stream":
+        with open(path, encoding="utf-8") as f:
+            chunks = sum(1 for _ in iter_chunk_spans(f, chunk_size, overlap))
+    elif mode == "spans_stream_tokens":
+        with open(path, encoding="utf-8") as f:
+            chunks = sum(1 for _ in iter_chunk_spans(f, chunk_size, overlap, max_tokens=chunk_size // 6))
+    else:
+        raise ValueError(f"Unknown mode {mode}")
+    elapsed = time.perf_counter() - start
+    size_mb = os.path.getsize(path) / (1024 * 1024)
+    return {
+        "mode": mode,
+        "chunks": chunks,
+        "seconds": elapsed,
+        "mb_per_s": size_mb / elapsed,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chunker throughput on large inputs")
+    parser.add_argument("--mb", type=int, default=300, help="Size of the synthetic corpus in MB")
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    parser.add_argument("--overlap", type=int, default=500)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--file", type=str, help="Chunk this file instead of a synthetic corpus")
+    parser.add_argument("--json", type=str, help="Also write results to this JSON file")
+    parser.add_argument("--run-mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_mode:
+        print(json.dumps(run_mode(args.run_mode, args.file, args.chunk_size, args.overlap)))
+        sys.exit(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.file
+        if path is None:
+            path = os.path.join(tmp, "corpus.txt")
+            print(f"Writing {args.mb} MB synthetic corpus...")
+            write_corpus(path, args.mb)
+        results = []
+        for mode in args.modes:
+            out = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_text_chunker", "--run-mode", mode, "--file", path,
+                 "--chunk-size", str(args.chunk_size), "--overlap", str(args.overlap)],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            result = json.loads(out)
+            results.append(result)
+            print(f"{mode:<22}{result['chunks']:>10} chunks {result['seconds']:>8.2f}s "
+                  f"{result['mb_per_s']:>8.1f} MB/s  max RSS {result['max_rss_mb']:>8.1f} MB")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
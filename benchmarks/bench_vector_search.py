@@ -0,0 +1,93 @@
+"""
+Recall vs latency benchmark for the index types in utils/vector_search.py
+
+Run from the project root:
+    python -m benchmarks.bench_vector_search --n 200000 --dim 128
+"""
+import argparse
+import json
+import time
+
+import faiss
+import numpy as np
+
+from utils.vector_search import create_index, make_search_params
+
+def make_dataset(n, dim, n_queries, n_clusters=256, seed=0):
+    """Generate normalized, clustered float32 vectors and queries drawn near them."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, n_clusters, size=n)
+    data = centers[labels] + 0.5 * rng.standard_normal((n, dim)).astype(np.float32)
+    query_labels = rng.integers(0, n_clusters, size=n_queries)
+    queries = centers[query_labels] + 0.5 * rng.standard_normal((n_queries, dim)).astype(np.float32)
+    faiss.normalize_L2(data)
+    faiss.normalize_L2(queries)
+    return data, queries
+
+def recall_at_k(found, truth):
+    """Fraction of the true top-k neighbors present in the found top-k."""
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+def measure(index, queries, top_k, params):
+    """Return (indices, per-query latency in ms) for one-at-a-time and batch search."""
+    start = time.perf_counter()
+    for q in queries[:200]:
+        index.search(q.reshape(1, -1), top_k, params=params)
+    single_ms = (time.perf_counter() - start) / min(200, len(queries)) * 1000
+    start = time.perf_counter()
+    _, found = index.search(queries, top_k, params=params)
+    batch_ms = (time.perf_counter() - start) / len(queries) * 1000
+    return found, single_ms, batch_ms
+
+def run(n, dim, n_queries, top_k):
+    data, queries = make_dataset(n, dim, n_queries)
+    configs = [
+        ("flat", {}, [{}]),
+        ("ivf", {}, [{"nprobe": p} for p in (1, 4, 16, 64)]),
+        ("ivfpq", {}, [{"nprobe": p} for p in (4, 16, 64)]),
+        ("hnsw", {"hnsw_m": 32}, [{"ef_search": ef} for ef in (16, 32, 64, 128)]),
+    ]
+    results = []
+    truth = None
+    for index_type, build_kwargs, search_settings in configs:
+        start = time.perf_counter()
+        index = create_index(data, index_type=index_type, **build_kwargs)
+        build_s = time.perf_counter() - start
+        size_mb = faiss.serialize_index(index).nbytes / 1e6
+        for settings in search_settings:
+            found, single_ms, batch_ms = measure(index, queries, top_k, make_search_params(index, **settings))
+            if truth is None:
+                truth = found
+            results.append({
+                "index_type": index_type,
+                **build_kwargs,
+                **settings,
+                "recall": recall_at_k(found, truth),
+                "single_query_ms": single_ms,
+                "batch_query_ms": batch_ms,
+                "build_s": build_s,
+                "size_mb": size_mb,
+            })
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall vs latency for FAISS index types")
+    parser.add_argument("--n", type=int, default=200000, help="Number of indexed vectors")
+    parser.add_argument("--dim", type=int, default=128, help="Vector dimension")
+    parser.add_argument("--queries", type=int, default=1000, help="Number of queries")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--json", type=str, help="Also write results to this JSON file")
+    args = parser.parse_args()
+
+    results = run(args.n, args.dim, args.queries, args.top_k)
+    print(f"\n{'index':<8}{'setting':<16}{'recall@' + str(args.top_k):>10}{'1-query ms':>12}"
+          f"{'batch ms/q':>12}{'build s':>10}{'size MB':>10}")
+    for r in results:
+        setting = ", ".join(f"{k}={r[k]}" for k in ("nprobe", "ef_search") if k in r) or "exact"
+        print(f"{r['index_type']:<8}{setting:<16}{r['recall']:>10.3f}{r['single_query_ms']:>12.3f}"
+              f"{r['batch_query_ms']:>12.4f}{r['build_s']:>10.1f}{r['size_mb']:>10.1f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
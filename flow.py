@@ -1,104 +1,472 @@
-from pocketflow import Node, Flow
-from utils.call_llm import call_llm
+from pocketflow import Node, Flow, AsyncNode, AsyncFlow
+from utils.call_llm import call_llm, async_call_llm, stream_llm
+from utils.text_chunker import count_tokens
+from utils.tracing import TraceMixin, TraceIdFilter, JsonLogFormatter
+import asyncio
+import json
 import logging
+import os
+import re
+import threading
+import time
 import yaml
 
 # Configure logging
+# LOG_LEVEL=WARNING silences the per-phase lines; LOG_FORMAT=json emits one JSON object per record
 logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=os.environ.get("LOG_LEVEL", "INFO").upper(),
+    format='%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s',
     datefmt='%Y-%m-%d %H:%M:%S'
 )
+for handler in logging.getLogger().handlers:
+    handler.addFilter(TraceIdFilter())
+    if os.environ.get("LOG_FORMAT", "text").lower() == "json":
+        handler.setFormatter(JsonLogFormatter())
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logger = logging.getLogger("demo_agent")
 
+VALIDATION_PROMPT = """
+Given the following question: {question} and answer: {answer}.
+Is the answer correct?
+Return your analysis in YAML format:
+```yaml
+is_correct: true/false # true if the query is related to {question}, false otherwise
+reason: "Brief explanation of your decision"
+"""
+
+# Model names, or route names when LLM_ROUTES maps them to several backends (utils/llm_router.py)
+ANSWER_MODEL = os.environ.get("ANSWER_MODEL", "deepseek-chat")
+# Validation cascade: a cheap JSON-mode check first, the reasoner only when it is unsure
+VALIDATOR_MODEL = os.environ.get("VALIDATOR_MODEL", "deepseek-chat")
+ESCALATION_MODEL = os.environ.get("ESCALATION_MODEL", "deepseek-reasoner")
+CONFIDENCE_THRESHOLD = 0.8
+
+JSON_VALIDATION_PROMPT = """Question: {question}
+Answer: {answer}
+Is the answer correct? Reply with JSON only:
+{{"is_correct": true or false, "confidence": number from 0 to 1, "reason": "one short sentence"}}"""
+
+_validation_stats = {"validations": 0, "fast_path": 0, "parse_failures": 0, "escalations": 0}
+_validation_lock = threading.Lock()
+
+def _count(*keys):
+    with _validation_lock:
+        for key in keys:
+            _validation_stats[key] += 1
+
+def get_validation_stats():
+    """Return counts of validations, fast-path verdicts, JSON parse failures and escalations."""
+    with _validation_lock:
+        return dict(_validation_stats)
+
+def reset_validation_stats():
+    with _validation_lock:
+        for key in _validation_stats:
+            _validation_stats[key] = 0
+
+CONTEXT_PROMPT = """Use the following context to answer. If it does not contain the answer, rely on your own knowledge.
+
+Context:
+{context}
+
+{prompt}"""
+
+def build_answer_prompt(shared):
+    """Build the AnswerNode prompt, asking for a new answer after a failed validation.
+
+    Chunks retrieved into shared["context"] are prepended to the prompt.
+    """
+    if "is_correct" in shared and shared["is_correct"] == False:
+        prompt = f'You answer: {shared["answer"]} for question: {shared["question"]} is wrong! please give new answer.'
+    else:
+        prompt = shared["question"]
+    if shared.get("context"):
+        context = "\n\n".join(f"[{chunk['path']}]\n{chunk['text'].strip()}" for chunk in shared["context"])
+        prompt = CONTEXT_PROMPT.format(context=context, prompt=prompt)
+    return prompt
+
+def retrieve_context(question, corpus, top_k=5, max_context_tokens=1500):
+    """Embed the question and return the best chunks that fit the token budget.
+
+    Chunks are taken in score order; a chunk that would overflow the budget
+    is skipped so a smaller, lower-ranked one can still fit.
+
+    Returns:
+        tuple: (chunks, timings) where timings holds "embed_s", "search_s" and "tokens"
+    """
+    from utils.embedding import get_embedding  # Vertex AI is only needed for retrieval flows
+
+    start = time.perf_counter()
+    query = get_embedding(question, task_type="RETRIEVAL_QUERY")
+    embedded = time.perf_counter()
+    hits = corpus.search([query], top_k=top_k)[0]
+    searched = time.perf_counter()
+
+    chunks, tokens = [], 0
+    for hit in hits:
+        size = count_tokens(hit["text"])
+        if tokens + size > max_context_tokens:
+            continue
+        chunks.append(hit)
+        tokens += size
+    return chunks, {"embed_s": embedded - start, "search_s": searched - embedded, "tokens": tokens}
+
+def parse_validation(response, answer):
+    """Parse the validator's YAML reply into (is_correct, reason)."""
+    # Extract YAML content
+    yaml_content = response
+    if "```yaml" in response:
+        yaml_content = response.split("```yaml")[1].split("```")[0].strip()
+    elif "```" in response:
+        yaml_content = response.split("```")[1].strip()
+
+    structured_result = yaml.safe_load(yaml_content)
+
+    # Validate with assertions
+    assert "is_correct" in structured_result, "Missing is_correct field"
+    assert isinstance(structured_result["is_correct"], bool), "is_correct must be boolean"
+    assert "reason" in structured_result, "Missing reason field"
+
+    is_correct = structured_result["is_correct"]
+    reason = structured_result["reason"]
+
+    if not is_correct:
+        logger.log(logging.INFO, 'ValidateAnswerNode: Given the following answer, but not correct: %s', answer)
+
+    return is_correct, reason
+
+_JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+_BOOLEANS = {"true": True, "yes": True, "correct": True, "false": False, "no": False, "incorrect": False}
+
+def parse_json_validation(response):
+    """Parse a JSON-mode validator reply into (is_correct, reason, confidence).
+
+    Tolerates code fences or text around the object and booleans written
+    as strings. Raises ValueError when no usable verdict is found, including
+    when the reply has no text content (None).
+    """
+    if not isinstance(response, str):
+        raise ValueError(f"Validator reply is {type(response).__name__}, not text")
+    try:
+        data = json.loads(response)
+    except ValueError:
+        match = _JSON_OBJECT.search(response)
+        if match is None:
+            raise ValueError("No JSON object in validator reply")
+        data = json.loads(match.group(0))
+    if not isinstance(data, dict):
+        raise ValueError("Validator reply is not a JSON object")
+
+    is_correct = data.get("is_correct")
+    if isinstance(is_correct, str):
+        is_correct = _BOOLEANS.get(is_correct.strip().lower())
+    if not isinstance(is_correct, bool):
+        raise ValueError("is_correct must be boolean")
+    try:
+        confidence = float(data.get("confidence", 0.0))
+    except (TypeError, ValueError):
+        confidence = 0.0
+    return is_correct, str(data.get("reason", "")), confidence
+
+def _fast_verdict(response):
+    # Returns (is_correct, reason) from the cheap validator, or None to escalate
+    try:
+        is_correct, reason, confidence = parse_json_validation(response)
+    except ValueError as e:
+        logger.log(logging.INFO, "Validation reply could not be parsed, escalating: %s", e)
+        _count("parse_failures", "escalations")
+        return None
+    if confidence < CONFIDENCE_THRESHOLD:
+        logger.log(logging.INFO, "Validation confidence %.2f is low, escalating", confidence)
+        _count("escalations")
+        return None
+    _count("fast_path")
+    return is_correct, reason
+
+def validate_answer(question, answer):
+    """Validate an answer with the JSON-mode model, escalating to the reasoner when unsure.
+
+    Returns:
+        tuple: (is_correct, reason)
+    """
+    _count("validations")
+    response = call_llm(JSON_VALIDATION_PROMPT.format(question=question, answer=answer),
+                        model_name=VALIDATOR_MODEL, response_format={"type": "json_object"})
+    verdict = _fast_verdict(response)
+    if verdict is not None:
+        if not verdict[0]:
+            logger.log(logging.INFO, 'ValidateAnswerNode: Given the following answer, but not correct: %s', answer)
+        return verdict
+    response = call_llm(VALIDATION_PROMPT.format(question=question, answer=answer), model_name=ESCALATION_MODEL)
+    return parse_validation(response, answer)
+
+async def async_validate_answer(question, answer):
+    """validate_answer() for async flows."""
+    _count("validations")
+    response = await async_call_llm(JSON_VALIDATION_PROMPT.format(question=question, answer=answer),
+                                    model_name=VALIDATOR_MODEL, response_format={"type": "json_object"})
+    verdict = _fast_verdict(response)
+    if verdict is not None:
+        if not verdict[0]:
+            logger.log(logging.INFO, 'ValidateAnswerNode: Given the following answer, but not correct: %s', answer)
+        return verdict
+    response = await async_call_llm(VALIDATION_PROMPT.format(question=question, answer=answer),
+                                    model_name=ESCALATION_MODEL)
+    return parse_validation(response, answer)
+
+def record_validation(shared, exec_res):
+    """Store a validation result in shared and return the next action.
+
+    Counts attempts in shared["attempts"]; once shared["max_attempts"] (if set)
+    is used up, an incorrect answer ends the flow with "exhausted" instead of
+    looping back to the answer node.
+    """
+    is_correct, reason = exec_res
+    shared["is_correct"] = is_correct
+    shared["reason"] = reason #if not is_correct else None
+    shared["attempts"] = shared.get("attempts", 0) + 1
+
+    if is_correct:
+        return "correct"
+    max_attempts = shared.get("max_attempts")
+    if max_attempts is not None and shared["attempts"] >= max_attempts:
+        logger.log(logging.INFO, "Retry budget of %d attempts exhausted", max_attempts)
+        return "exhausted"
+    return "incorrect"
+
 # An example node and flow
 # Please replace this with your own node and flow
-class AnswerNode(Node):
+class AnswerNode(TraceMixin, Node):
+    """Answers the question; streams tokens to shared["on_token"] when it is set.
+
+    The callback receives each text fragment as it arrives and None once the
+    answer is complete. Time-to-first-token is stored in shared["ttft"].
+    """
     def prep(self, shared):
         # Read question from shared
         logger.log(logging.INFO, "AnswerNode: Reading question from shared")
-        prompt = ""
-        if "is_correct" in shared and shared["is_correct"] == False:
-            prompt = f'You answer: {shared["answer"]} for question: {shared["question"]} is wrong! please give new answer.'
-        else:
-            prompt = shared["question"]
-        return prompt
-     
-    def exec(self, question):
+        return build_answer_prompt(shared), shared.get("on_token")
+
+    def exec(self, inputs):
+        question, on_token = inputs
         logger.log(logging.INFO, "AnswerNode: Calling LLM")
-        return call_llm(question)
-    
+        if on_token is None:
+            return call_llm(question, model_name=ANSWER_MODEL), None
+
+        start = time.perf_counter()
+        ttft = None
+        parts = []
+        for token in stream_llm(question, model_name=ANSWER_MODEL):
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            parts.append(token)
+            on_token(token)
+        on_token(None)
+        return "".join(parts), ttft
+
     def post(self, shared, prep_res, exec_res):
         # Store the answer in shared
         logger.log(logging.INFO, "AnswerNode: Storing answer in shared")
-        shared["answer"] = exec_res
+        shared["answer"], ttft = exec_res
+        if ttft is not None:
+            shared["ttft"] = ttft
 
-class ValidateAnswerNode(Node):
+class ValidateAnswerNode(TraceMixin, Node):
     def prep(self, shared):
         # Read question from shared
         logger.log(logging.INFO, "ValidateAnswerNode: Reading question and answer from shared")
         return shared["question"], shared["answer"]
-    
+
     def exec(self, inputs):
         logger.log(logging.INFO, "ValidateAnswerNode: Calling LLM")
         question, answer = inputs
-        prompt = """
-Given the following question: {question} and answer: {answer}.
-Is the answer correct?
-Return your analysis in YAML format:
-```yaml
-is_correct: true/false # true if the query is related to {question}, false otherwise
-reason: "Brief explanation of your decision"
-"""
+        return validate_answer(question, answer)
 
-        prompt = prompt.format(question=question, answer=answer)
-        response = call_llm(prompt,model_name="deepseek-reasoner")
-    
-            # Extract YAML content
-        yaml_content = response
-        if "```yaml" in response:
-            yaml_content = response.split("```yaml")[1].split("```")[0].strip()
-        elif "```" in response:
-            yaml_content = response.split("```")[1].strip()
-        
-        structured_result = yaml.safe_load(yaml_content)
-        
-        # Validate with assertions
-        assert "is_correct" in structured_result, "Missing is_correct field"
-        assert isinstance(structured_result["is_correct"], bool), "is_correct must be boolean"
-        assert "reason" in structured_result, "Missing reason field"
-
-        is_correct = structured_result["is_correct"]
-        reason = structured_result["reason"]
-
-        if not is_correct:
-            logger.log(logging.INFO, f'ValidateAnswerNode: Given the following answer, but not correct: {answer}')
-
-        return is_correct, reason
-    
     def post(self, shared, prep_res, exec_res):
         # Store the answer in shared
         logger.log(logging.INFO, "ValidateAnswerNode: Storing answer in shared")
-        is_correct, reason = exec_res
-        shared["is_correct"] = is_correct
-        shared["reason"] = reason #if not is_correct else None
+        return record_validation(shared, exec_res)
 
-        if not is_correct:
-            return "incorrect"
-        
-        return "correct"
-        
 class FinishNode(Node):
     pass
 
+class RetrieveNode(TraceMixin, Node):
+    """Puts the chunks most relevant to the question into shared["context"].
+
+    Searches the corpus built by ingest.py in shared["index_dir"] (or
+    `index_dir`). shared["top_k"] and shared["max_context_tokens"] override
+    the constructor settings per question. Query-embedding and search times
+    are stored separately in shared["retrieval"].
+    """
+    def __init__(self, index_dir="index", top_k=5, max_context_tokens=1500, **kwargs):
+        super().__init__(**kwargs)
+        self.index_dir = index_dir
+        self.top_k = top_k
+        self.max_context_tokens = max_context_tokens
+
+    def prep(self, shared):
+        from utils.corpus_index import open_corpus  # FAISS is only needed for retrieval flows
+
+        logger.log(logging.INFO, "RetrieveNode: Reading question from shared")
+        return (shared["question"], open_corpus(shared.get("index_dir") or self.index_dir),
+                shared.get("top_k") or self.top_k, shared.get("max_context_tokens") or self.max_context_tokens)
+
+    def exec(self, inputs):
+        logger.log(logging.INFO, "RetrieveNode: Searching the index")
+        return retrieve_context(*inputs)
+
+    def post(self, shared, prep_res, exec_res):
+        chunks, timings = exec_res
+        logger.log(logging.INFO, "RetrieveNode: Storing %d chunks (%d tokens) in shared", len(chunks), timings["tokens"])
+        shared["context"] = chunks
+        shared["retrieval"] = timings
+
+# Async variants: same prompts and shared-store contract, but the LLM calls
+# await the async client so many questions can run on one event loop
+class AsyncAnswerNode(TraceMixin, AsyncNode):
+    async def prep_async(self, shared):
+        logger.log(logging.INFO, "AsyncAnswerNode: Reading question from shared")
+        return build_answer_prompt(shared)
+
+    async def exec_async(self, question):
+        logger.log(logging.INFO, "AsyncAnswerNode: Calling LLM")
+        return await async_call_llm(question, model_name=ANSWER_MODEL)
+
+    async def post_async(self, shared, prep_res, exec_res):
+        logger.log(logging.INFO, "AsyncAnswerNode: Storing answer in shared")
+        shared["answer"] = exec_res
+
+class AsyncValidateAnswerNode(TraceMixin, AsyncNode):
+    async def prep_async(self, shared):
+        logger.log(logging.INFO, "AsyncValidateAnswerNode: Reading question and answer from shared")
+        return shared["question"], shared["answer"]
+
+    async def exec_async(self, inputs):
+        logger.log(logging.INFO, "AsyncValidateAnswerNode: Calling LLM")
+        question, answer = inputs
+        return await async_validate_answer(question, answer)
+
+    async def post_async(self, shared, prep_res, exec_res):
+        logger.log(logging.INFO, "AsyncValidateAnswerNode: Storing answer in shared")
+        return record_validation(shared, exec_res)
+
+class AsyncRetrieveNode(RetrieveNode, AsyncNode):
+    """RetrieveNode for async flows; the blocking embed and search run in a worker thread."""
+    async def prep_async(self, shared):
+        return RetrieveNode.prep(self, shared)
+
+    async def exec_async(self, inputs):
+        return await asyncio.to_thread(RetrieveNode.exec, self, inputs)
+
+    async def post_async(self, shared, prep_res, exec_res):
+        return RetrieveNode.post(self, shared, prep_res, exec_res)
+
+class SpeculativeAnswerNode(TraceMixin, AsyncNode):
+    """Generates several candidate answers at once and keeps the first one validated as correct.
+
+    Each round starts `num_candidates` generate-then-validate tasks concurrently.
+    The first candidate judged correct wins and the remaining calls are
+    cancelled. If none is correct, the next round asks again with the last
+    rejected answer as feedback, up to `max_rounds` rounds. shared["num_candidates"]
+    and shared["max_attempts"] override the constructor settings per question.
+    """
+    def __init__(self, num_candidates=3, max_rounds=3, temperature=1.0, **kwargs):
+        super().__init__(**kwargs)
+        self.num_candidates = num_candidates
+        self.max_rounds = max_rounds
+        self.temperature = temperature
+
+    async def prep_async(self, shared):
+        logger.log(logging.INFO, "SpeculativeAnswerNode: Reading question from shared")
+        return (shared["question"], shared.get("context"),
+                shared.get("num_candidates") or self.num_candidates,
+                shared.get("max_attempts") or self.max_rounds)
+
+    async def _candidate(self, prompt, question):
+        # Candidates bypass the response cache, otherwise they would all be identical
+        answer = await async_call_llm(prompt, model_name=ANSWER_MODEL, use_cache=False,
+                                      temperature=self.temperature)
+        return answer, await async_validate_answer(question, answer)
+
+    async def exec_async(self, inputs):
+        question, context, num_candidates, max_rounds = inputs
+        rejected = None
+        for round_no in range(1, max_rounds + 1):
+            if rejected is None:
+                prompt = build_answer_prompt({"question": question, "context": context})
+            else:
+                prompt = build_answer_prompt({"question": question, "context": context,
+                                              "answer": rejected[0], "is_correct": False})
+            logger.log(logging.INFO, "SpeculativeAnswerNode: Round %d, %d candidates", round_no, num_candidates)
+            tasks = [asyncio.ensure_future(self._candidate(prompt, question)) for _ in range(num_candidates)]
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    try:
+                        answer, (is_correct, reason) = await next_done
+                    except Exception as e:
+                        logger.log(logging.WARNING, "SpeculativeAnswerNode: Candidate failed: %s", e)
+                        continue
+                    if is_correct:
+                        return answer, (True, reason), round_no
+                    rejected = (answer, reason)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+        if rejected is None:
+            raise RuntimeError("All speculative candidates failed")
+        return rejected[0], (False, rejected[1]), max_rounds
+
+    async def post_async(self, shared, prep_res, exec_res):
+        logger.log(logging.INFO, "SpeculativeAnswerNode: Storing answer in shared")
+        answer, (is_correct, reason), rounds = exec_res
+        shared["answer"] = answer
+        shared["is_correct"] = is_correct
+        shared["reason"] = reason
+        shared["attempts"] = rounds
+        return "correct" if is_correct else "exhausted"
+
 answer_node = AnswerNode()
 validate_answerNode = ValidateAnswerNode()
 finish = FinishNode()
 
 validate_answerNode - "correct" >> finish
 validate_answerNode - "incorrect" >> answer_node
+validate_answerNode - "exhausted" >> finish
 
 answer_node >> validate_answerNode
 
-qa_flow = Flow(start=answer_node)
\ No newline at end of file
+qa_flow = Flow(start=answer_node)
+
+async_answer_node = AsyncAnswerNode()
+async_validate_answer_node = AsyncValidateAnswerNode()
+
+async_validate_answer_node - "correct" >> finish
+async_validate_answer_node - "incorrect" >> async_answer_node
+async_validate_answer_node - "exhausted" >> finish
+
+async_answer_node >> async_validate_answer_node
+
+# Use as: await async_qa_flow.run_async(shared)
+async_qa_flow = AsyncFlow(start=async_answer_node)
+
+speculative_answer_node = SpeculativeAnswerNode()
+
+speculative_answer_node - "correct" >> finish
+speculative_answer_node - "exhausted" >> finish
+
+# Use as: await speculative_qa_flow.run_async(shared)
+speculative_qa_flow = AsyncFlow(start=speculative_answer_node)
+
+# Retrieval-augmented variants: retrieve once, then the usual answer/validate loop
+retrieve_node = RetrieveNode()
+retrieve_node >> answer_node
+rag_qa_flow = Flow(start=retrieve_node)
+
+async_retrieve_node = AsyncRetrieveNode()
+async_retrieve_node >> async_answer_node
+async_rag_qa_flow = AsyncFlow(start=async_retrieve_node)
+
+speculative_retrieve_node = AsyncRetrieveNode()
+speculative_retrieve_node >> speculative_answer_node
+speculative_rag_qa_flow = AsyncFlow(start=speculative_retrieve_node)
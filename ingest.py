@@ -0,0 +1,52 @@
+from ingest_flow import ingest_flow, serial_ingest_flow
+import argparse
+import logging
+import time
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+def main(args):
+    shared = {
+        "settings": {
+            "data_dir": args.data_dir,
+            "index_dir": args.index_dir,
+            "chunk_size": args.chunk_size,
+            "overlap": args.overlap,
+            "max_tokens": args.max_tokens,
+            "queue_size": args.queue_size,
+            "chunk_workers": args.chunk_workers,
+            "embed_workers": args.embed_workers,
+            "embed_batch_docs": args.embed_batch_docs,
+            "checkpoint_every": args.checkpoint_every,
+        }
+    }
+    start = time.perf_counter()
+    (serial_ingest_flow if args.serial else ingest_flow).run(shared)
+    corpus = shared["corpus"]
+    print(f"Indexed {corpus.index.ntotal if corpus.index else 0} vectors in {time.perf_counter() - start:.1f}s "
+          f"({len(shared['removed'])} deleted documents removed)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest a directory of text files into a FAISS index")
+    parser.add_argument("--data-dir", type=str, default="data", help="Directory of .txt files to ingest")
+    parser.add_argument("--index-dir", type=str, default="index",
+                        help="Where the index, chunk store and manifest are kept")
+    parser.add_argument("--chunk-size", type=int, default=2000, help="Maximum chunk size in characters")
+    parser.add_argument("--overlap", type=int, default=500, help="Overlap between chunks in characters")
+    parser.add_argument("--max-tokens", type=int, default=None, help="Optional token budget per chunk")
+    parser.add_argument("--queue-size", type=int, default=8, help="Capacity of each queue between stages")
+    parser.add_argument("--chunk-workers", type=int, default=2)
+    parser.add_argument("--embed-workers", type=int, default=4)
+    parser.add_argument("--embed-batch-docs", type=int, default=16,
+                        help="Documents grouped into one embedding call")
+    parser.add_argument("--checkpoint-every", type=int, default=100,
+                        help="Save the index and manifest after this many documents")
+    parser.add_argument("--serial", action="store_true",
+                        help="Run each stage to completion before the next (no pipelining)")
+
+    main(parser.parse_args())
@@ -0,0 +1,167 @@
+from pocketflow import Node, BatchNode, Flow
+from utils.data_loader import iter_data
+from utils.text_chunker import iter_chunk_spans
+from utils.embedding import get_embeddings
+from utils.corpus_index import CorpusIndex
+from utils.pipeline import Stage, run_pipeline, format_stage_stats
+import logging
+
+logger = logging.getLogger("ingest")
+
+# Files at least this large are memory-mapped instead of read into a str
+MMAP_THRESHOLD = 16 * 1024 * 1024
+
+def _load_settings(shared):
+    settings = shared["settings"]
+    if "corpus" not in shared:
+        shared["corpus"] = CorpusIndex(settings["index_dir"])
+    return settings, shared["corpus"]
+
+def _documents(settings, corpus):
+    """Yield (path, content) for new and changed files under the data directory."""
+    return iter_data(settings["data_dir"], extensions=tuple(settings.get("extensions", (".txt",))),
+                     max_workers=settings.get("load_workers", 8), mmap_threshold=MMAP_THRESHOLD,
+                     manifest=corpus.manifest, auto_commit=False)
+
+def _chunk_text(content, offset, length):
+    piece = content[offset:offset + length]
+    return piece if isinstance(piece, str) else bytes(piece).decode("utf-8", "ignore")
+
+class LoadDocumentsNode(Node):
+    """Loads every new or changed document into shared["documents"] (serial mode)."""
+    def prep(self, shared):
+        return _load_settings(shared)
+
+    def exec(self, inputs):
+        settings, corpus = inputs
+        return list(_documents(settings, corpus))
+
+    def post(self, shared, prep_res, exec_res):
+        logger.log(logging.INFO, f"LoadDocumentsNode: Loaded {len(exec_res)} new or changed documents")
+        shared["documents"] = exec_res
+
+class ChunkDocumentsNode(BatchNode):
+    """Splits each (path, content) document into (path, [(offset, length, text), ...])."""
+    def prep(self, shared):
+        self.settings = shared["settings"]
+        return shared["documents"]
+
+    def exec(self, document):
+        path, content = document
+        settings = self.settings
+        chunks = [(offset, length, _chunk_text(content, offset, length))
+                  for offset, length in iter_chunk_spans(content, chunk_size=settings.get("chunk_size", 2000),
+                                                         overlap=settings.get("overlap", 500),
+                                                         max_tokens=settings.get("max_tokens"))]
+        if hasattr(content, "close"):
+            content.close()  # release mmapped files as soon as they are chunked
+        return path, chunks
+
+    def post(self, shared, prep_res, exec_res):
+        shared["chunked"] = exec_res
+
+class EmbedChunksNode(BatchNode):
+    """Embeds groups of chunked documents, one batched embedding call per group."""
+    def prep(self, shared):
+        chunked = shared["chunked"]
+        size = shared["settings"].get("embed_batch_docs", 16)
+        return [chunked[i:i + size] for i in range(0, len(chunked), size)]
+
+    def exec(self, group):
+        texts = [text for _, chunks in group for _, _, text in chunks]
+        vectors = get_embeddings(texts) if texts else None
+        embedded, start = [], 0
+        for path, chunks in group:
+            embedded.append((path, chunks, vectors[start:start + len(chunks)] if chunks else None))
+            start += len(chunks)
+        return embedded
+
+    def post(self, shared, prep_res, exec_res):
+        shared["embedded"] = [doc for group in exec_res for doc in group]
+
+class IndexChunksNode(BatchNode):
+    """Writes embedded documents into the corpus index, checkpointing every N documents."""
+    def prep(self, shared):
+        settings, corpus = _load_settings(shared)
+        self.corpus = corpus
+        self.checkpoint_every = settings.get("checkpoint_every", 100)
+        self.indexed = 0
+        return shared["embedded"]
+
+    def exec(self, group):
+        # Accepts one embedded document or a list of them (pipelined mode)
+        for path, chunks, vectors in (group if isinstance(group, list) else [group]):
+            self.corpus.replace_document(path, chunks, vectors)
+            self.indexed += 1
+            if self.indexed % self.checkpoint_every == 0:
+                self.corpus.checkpoint()
+                logger.log(logging.INFO, f"IndexChunksNode: Checkpoint after {self.indexed} documents")
+
+    def post(self, shared, prep_res, exec_res):
+        finish_ingest(shared, self.corpus)
+
+def finish_ingest(shared, corpus):
+    """Drop deleted files from the index and write the final checkpoint."""
+    removed = corpus.manifest.missing()
+    for path in removed:
+        corpus.remove_document(path)
+    corpus.checkpoint()
+    shared["removed"] = removed
+    logger.log(logging.INFO, f"Ingest finished: {len(removed)} deleted documents removed, "
+                             f"{corpus.index.ntotal if corpus.index else 0} vectors indexed")
+
+class PipelinedIngestNode(Node):
+    """Runs load -> chunk -> embed -> index concurrently through bounded queues.
+
+    The chunk, embed and index stages reuse the serial BatchNodes' exec logic,
+    each on its own worker threads. A slow stage applies backpressure to the
+    ones before it, and per-stage throughput is stored in shared["stage_stats"]
+    so the bottleneck is visible.
+    """
+    def __init__(self, chunk_node=None, embed_node=None, index_node=None, **kwargs):
+        super().__init__(**kwargs)
+        self.chunk_node = chunk_node or ChunkDocumentsNode()
+        self.embed_node = embed_node or EmbedChunksNode()
+        self.index_node = index_node or IndexChunksNode()
+
+    def prep(self, shared):
+        settings, corpus = _load_settings(shared)
+        # Give the stage nodes their settings without running their serial prep
+        self.chunk_node.settings = settings
+        self.index_node.corpus = corpus
+        self.index_node.checkpoint_every = settings.get("checkpoint_every", 100)
+        self.index_node.indexed = 0
+        return settings, corpus
+
+    def exec(self, inputs):
+        settings, corpus = inputs
+        # Node._exec applies each node's retry policy per item
+        stages = [
+            Stage("chunk", lambda doc: Node._exec(self.chunk_node, doc),
+                  workers=settings.get("chunk_workers", 2)),
+            Stage("embed", lambda group: Node._exec(self.embed_node, group),
+                  workers=settings.get("embed_workers", 4), batch_size=settings.get("embed_batch_docs", 16)),
+            Stage("index", lambda group: Node._exec(self.index_node, group), workers=1, count=len),
+        ]
+        return run_pipeline(_documents(settings, corpus), stages, queue_size=settings.get("queue_size", 8))
+
+    def post(self, shared, prep_res, exec_res):
+        shared["stage_stats"] = exec_res
+        logger.log(logging.INFO, "PipelinedIngestNode: Stage throughput\n" + format_stage_stats(exec_res))
+        finish_ingest(shared, prep_res[1])
+
+def create_serial_ingest_flow():
+    """Load everything, then chunk everything, then embed, then index."""
+    load = LoadDocumentsNode()
+    chunk = ChunkDocumentsNode()
+    embed = EmbedChunksNode(max_retries=3, wait=1)
+    index = IndexChunksNode()
+    load >> chunk >> embed >> index
+    return Flow(start=load)
+
+def create_ingest_flow():
+    """All stages run concurrently; see PipelinedIngestNode."""
+    return Flow(start=PipelinedIngestNode(embed_node=EmbedChunksNode(max_retries=3, wait=1)))
+
+ingest_flow = create_ingest_flow()
+serial_ingest_flow = create_serial_ingest_flow()
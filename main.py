@@ -1,31 +1,274 @@
-from flow import qa_flow
+from flow import (qa_flow, async_qa_flow, speculative_qa_flow,
+                  rag_qa_flow, async_rag_qa_flow, speculative_rag_qa_flow, get_validation_stats)
+from utils.latency_stats import summarize_latencies, format_summary
+from utils.tracing import trace, configure_tracing, write_prometheus
+from utils.rate_limiter import BATCH, priority, bind_priority, get_limiter_stats
+from utils.llm_router import get_router
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
 import argparse
+import asyncio
+import json
+import sys
+import time
 
-# Example main function
-def main(args):
-    print("Main function called")
-    shared = {
-        "question": None,
+def new_shared(question, **options):
+    """Create a fresh shared store for one question.
+
+    Options such as max_attempts or num_candidates are copied into the store.
+    """
+    return {
+        "question": question,
         "answer": None,
         "is_correct": None,
-        "reason": None
+        "reason": None,
+        **{key: value for key, value in options.items() if value is not None}
     }
+
+def flow_options(args):
+    """Collect the per-question shared-store options from the command line."""
+    return {
+        "max_attempts": getattr(args, "max_attempts", None),
+        "num_candidates": getattr(args, "candidates", None),
+        "index_dir": getattr(args, "index_dir", None),
+        "top_k": getattr(args, "top_k", None),
+        "max_context_tokens": getattr(args, "context_tokens", None),
+    }
+
+def is_speculative(args):
+    return (getattr(args, "candidates", None) or 1) > 1
+
+def select_flows(args):
+    """Return the (sync, async, speculative) flows, retrieval-augmented when --index-dir is set."""
+    if getattr(args, "index_dir", None):
+        return rag_qa_flow, async_rag_qa_flow, speculative_rag_qa_flow
+    return qa_flow, async_qa_flow, speculative_qa_flow
+
+# Example main function
+def main(args):
+    print("Main function called")
+    shared = new_shared(None, **flow_options(args))
     if hasattr(args, "question") and args.question:
         shared["question"] = args.question
     else:
         shared["question"] = input("Please enter a question: ")
 
 
-    qa_flow.run(shared)
+    speculative = is_speculative(args)
+    if not speculative and not getattr(args, "no_stream", False):
+        print("Answer (streaming):")
+        shared["on_token"] = print_token
+
+    sync_flow, _, speculative_flow = select_flows(args)
+    start = time.perf_counter()
+    with trace(question=shared["question"]) as root:
+        shared["trace_id"] = root.trace_id
+        if speculative:
+            asyncio.run(speculative_flow.run_async(shared))
+        else:
+            sync_flow.run(shared)
+        root.set(attempts=shared.get("attempts"), is_correct=shared["is_correct"])
+    total_latency = time.perf_counter() - start
     print("Question:", shared["question"])
     print("Answer:", shared["answer"])
     print("Is correct:", shared["is_correct"])
     print("Reason:", shared["reason"])
+    print("Attempts:", shared.get("attempts"))
+    if shared.get("retrieval"):
+        retrieval = shared["retrieval"]
+        print(f"Retrieval: {len(shared['context'])} chunks, {retrieval['tokens']} tokens "
+              f"(embed {retrieval['embed_s'] * 1000:.1f}ms, search {retrieval['search_s'] * 1000:.1f}ms)")
+    if shared.get("ttft") is not None:
+        print(f"Time to first token: {shared['ttft'] * 1000:.1f}ms")
+    print(f"Total latency: {total_latency * 1000:.1f}ms")
+
+def print_token(token):
+    """Print streamed answer tokens as they arrive; None ends the answer."""
+    if token is None:
+        print(flush=True)
+    else:
+        print(token, end="", flush=True)
+
+def read_questions(stream, on_error=None):
+    """Yield (id, question) pairs from a JSONL stream.
+
+    Each line is either a JSON object with a "question" key (and optional "id")
+    or a bare JSON string. Blank lines are skipped. A line that is not valid
+    JSON or has no question is passed to on_error(line_no, message) and
+    skipped; without on_error it raises ValueError.
+    """
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+            if isinstance(record, str):
+                yield line_no, record
+            elif isinstance(record, dict) and isinstance(record.get("question"), str):
+                yield record.get("id", line_no), record["question"]
+            else:
+                raise ValueError('expected a JSON string or an object with a "question" string')
+        except ValueError as e:
+            if on_error is None:
+                raise ValueError(f"Line {line_no}: {e}") from e
+            on_error(line_no, f"{type(e).__name__}: {e}")
+
+def run_one(item, options, flow=qa_flow):
+    """Run a flow (qa_flow by default) on one question and return its result record."""
+    question_id, question = item
+    shared = new_shared(question, **options)
+    start = time.perf_counter()
+    with trace(question_id=question_id) as root:
+        shared["trace_id"] = root.trace_id
+        try:
+            flow.run(shared)
+            error = None
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        root.set(attempts=shared.get("attempts"), is_correct=shared["is_correct"])
+    return _result(question_id, shared, time.perf_counter() - start, error)
+
+async def run_one_async(item, options, flow=async_qa_flow):
+    """Run an async flow on one question and return its result record."""
+    question_id, question = item
+    shared = new_shared(question, **options)
+    start = time.perf_counter()
+    with trace(question_id=question_id) as root:
+        shared["trace_id"] = root.trace_id
+        try:
+            await flow.run_async(shared)
+            error = None
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        root.set(attempts=shared.get("attempts"), is_correct=shared["is_correct"])
+    return _result(question_id, shared, time.perf_counter() - start, error)
+
+def _result(question_id, shared, latency, error):
+    result = {"id": question_id, **shared, "latency": latency}
+    if error:
+        result["error"] = error
+    return result
+
+def run_batch_threaded(items, workers, emit, options, flow=qa_flow):
+    """Run questions on a bounded thread pool, emitting each result as it finishes.
+
+    At most 2 * workers questions are read ahead, so huge inputs are streamed.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for item in items:
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    emit(future.result())
+            pending.add(executor.submit(bind_priority(run_one), item, options, flow))
+        for future in as_completed(pending):
+            emit(future.result())
+
+async def run_batch_async(items, workers, emit, options, flow=async_qa_flow):
+    """Run questions on the event loop with at most `workers` flows in flight."""
+    pending = set()
+    for item in items:
+        if len(pending) >= workers:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                emit(task.result())
+        pending.add(asyncio.ensure_future(run_one_async(item, options, flow)))
+    for task in asyncio.as_completed(pending):
+        emit(await task)
+
+def batch_main(args):
+    stream = sys.stdin if args.batch == "-" else open(args.batch, "r", encoding="utf-8")
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    latencies = []
+    errors = 0
+
+    def emit(result):
+        nonlocal errors
+        if "latency" in result:
+            latencies.append(result["latency"])
+        errors += "error" in result
+        out.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+        out.flush()
+
+    start = time.perf_counter()
+    try:
+        # Malformed lines get an error record instead of ending the batch
+        items = read_questions(stream, on_error=lambda line_no, error: emit({"id": line_no, "error": error}))
+        options = flow_options(args)
+        sync_flow, async_flow, speculative_flow = select_flows(args)
+        # Batch questions queue behind interactive ones for API slots
+        with priority(BATCH):
+            if is_speculative(args):
+                # Speculative candidates run concurrently on the event loop
+                args.mode = "async"
+                asyncio.run(run_batch_async(items, args.workers, emit, options, speculative_flow))
+            elif args.mode == "async":
+                asyncio.run(run_batch_async(items, args.workers, emit, options, async_flow))
+            else:
+                run_batch_threaded(items, args.workers, emit, options, sync_flow)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+        if out is not sys.stdout:
+            out.close()
+
+    summary = summarize_latencies(latencies, elapsed=time.perf_counter() - start)
+    print(f"Batch done ({args.mode}, workers={args.workers}, errors={errors}): {format_summary(summary)}",
+          file=sys.stderr)
+    validation = get_validation_stats()
+    print(f"Validation: {validation['validations']} checks, {validation['escalations']} escalated to the reasoner "
+          f"({validation['parse_failures']} unparseable replies)", file=sys.stderr)
+    for name, stats in get_limiter_stats().items():
+        print(f"Limiter {name}: limit {stats['limit']}, {stats['queued']}/{stats['calls']} calls queued, "
+              f"{stats['throttled']} throttled, {stats['retries']} retried", file=sys.stderr)
+    router = get_router()
+    if router is not None:
+        stats = router.stats()
+        print(f"Router: {stats['calls']} calls, {stats['fallbacks']} fallbacks, "
+              f"{stats['hedges']} hedges ({stats['hedge_wins']} won)", file=sys.stderr)
+        for name, backend in stats["backends"].items():
+            p50 = "n/a" if backend["p50"] is None else f"{backend['p50'] * 1000:.1f}ms"
+            print(f"  {name} ({backend['model']}): p50 {p50}, errors {backend['error_rate']:.0%}, "
+                  f"{'healthy' if backend['healthy'] else 'cooling down'}", file=sys.stderr)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="AI agent - Ask questions about any topic")
     parser.add_argument("--question", type=str,
                         help="Question to ask the AI agent")
-    
+    parser.add_argument("--no-stream", action="store_true",
+                        help="Wait for the full answer instead of printing tokens as they arrive")
+    parser.add_argument("--batch", type=str, metavar="PATH",
+                        help="JSONL file of questions to answer ('-' for stdin)")
+    parser.add_argument("--output", type=str, default="-", metavar="PATH",
+                        help="Where to write JSONL results in batch mode (default: stdout)")
+    parser.add_argument("--workers", type=int, default=8,
+                        help="Maximum questions in flight in batch mode")
+    parser.add_argument("--mode", choices=["thread", "async"], default="thread",
+                        help="Run batch questions on a thread pool or an asyncio event loop")
+    parser.add_argument("--max-attempts", type=int, default=None,
+                        help="Stop retrying after this many answer/validate attempts (default: unbounded)")
+    parser.add_argument("--candidates", type=int, default=None,
+                        help="Generate and validate this many candidate answers in parallel per attempt")
+    parser.add_argument("--index-dir", type=str, default=None,
+                        help="Answer with context retrieved from this index (built by ingest.py)")
+    parser.add_argument("--top-k", type=int, default=None,
+                        help="Chunks to retrieve per question (default: 5)")
+    parser.add_argument("--context-tokens", type=int, default=None,
+                        help="Token budget for retrieved context (default: 1500)")
+    parser.add_argument("--trace-file", type=str, default=None, metavar="PATH",
+                        help="Append every trace span (flow, node, phase, LLM call) to this JSONL file")
+    parser.add_argument("--metrics-file", type=str, default=None, metavar="PATH",
+                        help="Write latency and token metrics in Prometheus text format when done")
+
     args = parser.parse_args()
-    main(args)
\ No newline at end of file
+    if args.trace_file:
+        configure_tracing(jsonl_path=args.trace_file)
+    try:
+        if args.batch:
+            batch_main(args)
+        else:
+            main(args)
+    finally:
+        if args.metrics_file:
+            write_prometheus(args.metrics_file)
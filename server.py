@@ -0,0 +1,344 @@
+"""
+HTTP server for the QA flow with a pre-forked pool of warm workers
+
+The parent imports the flow once, binds the port and forks the workers; each
+worker serves HTTP on the shared socket and runs the async flows on its own
+event loop, so concurrent questions share one process without blocking each
+other. Every request gets its own shared store. The API rate and concurrency
+budgets (LLM_RATE_LIMIT, RATE_LIMIT_<NAME>, ...) are for the whole server:
+each of the N workers gets 1/N of them. Run from the project root:
+    python server.py --port 8080 --workers 4
+    curl -s localhost:8080/v1/answer -d '{"question": "What is PocketFlow?"}'
+
+Endpoints:
+    POST /v1/answer  {"question", "max_attempts"?, "candidates"?, "top_k"?,
+                      "context_tokens"? (positive, capped by the server's setting),
+                      "priority"? ("interactive" | "batch"),
+                      "timeout"? (seconds, capped by --timeout)}
+    GET  /healthz    200 while serving, 503 once draining (for load balancer checks)
+    GET  /metrics    Prometheus text: flow spans, LLM calls and tokens of this worker
+
+SIGTERM or SIGINT drains: for --drain-grace seconds workers keep accepting
+and answering questions but fail health checks, so load balancers stop
+routing to them; then they stop accepting, close the listening socket (new
+connects are refused rather than left in the backlog), finish in-flight
+questions for up to --drain-timeout seconds and exit.
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import logging
+import math
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from main import flow_options, is_speculative, run_one_async, select_flows
+from utils.rate_limiter import BATCH, INTERACTIVE, priority, set_process_share
+from utils.tracing import export_prometheus
+
+logger = logging.getLogger("server")
+
+MAX_BODY_BYTES = 1024 * 1024
+# Per-request overrides a client may send; anything else (e.g. the index) is fixed by the server
+REQUEST_OPTIONS = {"max_attempts": int, "candidates": int, "top_k": int, "context_tokens": int}
+# Caps on those overrides when the server sets no value of its own (which is then the cap),
+# so one request cannot fan out into an unbounded number of LLM calls
+REQUEST_LIMITS = {"max_attempts": 10, "candidates": 8, "top_k": 50, "context_tokens": 32000}
+# Fields of the shared store returned to the client
+RESPONSE_FIELDS = ("question", "answer", "is_correct", "reason", "attempts", "trace_id", "retrieval", "error")
+
+async def _answer(item, options, flow, lane, timeout):
+    with priority(lane):
+        return await asyncio.wait_for(run_one_async(item, options, flow), timeout)
+
+class Worker:
+    """One serving process: an HTTP server on the shared socket plus an event loop running flows."""
+
+    def __init__(self, sock, config):
+        self.config = config
+        self.loop = asyncio.new_event_loop()
+        self.slots = threading.BoundedSemaphore(config.concurrency)
+        self.draining = threading.Event()
+        self.requests = Counter()
+        self._in_flight = 0
+        self._idle = threading.Condition()
+        self.httpd = _HTTPServer(sock, self)
+
+    def _warm_up(self):
+        # Build the pooled LLM clients (and map the index) before the first request arrives
+        from utils.call_llm import get_async_client, get_client
+        get_client()
+        get_async_client()  # runs on the flow loop, so the client is bound to it
+        if self.config.index_dir:
+            from utils.corpus_index import open_corpus
+            open_corpus(self.config.index_dir)
+
+    def run(self, handle_sigint=False):
+        threading.Thread(target=self.loop.run_forever, name="flow-loop", daemon=True).start()
+        self.loop.call_soon_threadsafe(self._warm_up)
+        # shutdown() blocks until serve_forever returns, so it must run on another thread
+        drain = lambda *_: threading.Thread(target=self.drain, daemon=True).start()
+        signal.signal(signal.SIGTERM, drain)
+        signal.signal(signal.SIGINT, drain if handle_sigint else signal.SIG_IGN)
+        logger.info("Worker %d serving on %s:%d", os.getpid(), *self.httpd.server_address[:2])
+        self.httpd.serve_forever()
+        # This process's copy of the shared socket; once every process has closed it, connects are refused
+        self.httpd.socket.close()
+        with self._idle:
+            self._idle.wait_for(lambda: self._in_flight == 0, timeout=self.config.drain_timeout)
+            if self._in_flight:
+                logger.warning("Worker %d exiting with %d questions in flight", os.getpid(), self._in_flight)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        logger.info("Worker %d drained", os.getpid())
+
+    def drain(self):
+        if not self.draining.is_set():
+            self.draining.set()
+            # Keep serving (with /healthz at 503) until the load balancer has noticed
+            time.sleep(self.config.drain_grace)
+            self.httpd.shutdown()
+
+    def _begin(self):
+        with self._idle:
+            self._in_flight += 1
+
+    def _end(self):
+        with self._idle:
+            self._in_flight -= 1
+            self._idle.notify_all()
+
+    def count(self, status):
+        with self._idle:
+            self.requests[status] += 1
+
+    def flow_args(self, request):
+        """Server defaults overridden by the request's allowed options, as a main.py-style namespace.
+
+        Overrides must be positive and are clamped to the server's own value
+        for the option, or to REQUEST_LIMITS when it has none.
+        """
+        args = argparse.Namespace(**vars(self.config))
+        for key, convert in REQUEST_OPTIONS.items():
+            if request.get(key) is None:
+                continue
+            value = convert(request[key])
+            if value <= 0:
+                raise ValueError(f"{key} must be positive")
+            setattr(args, key, min(value, getattr(self.config, key) or REQUEST_LIMITS[key]))
+        return args
+
+    def answer(self, request, request_id):
+        """Run one question; returns (HTTP status, response dict)."""
+        question = request.get("question")
+        if not isinstance(question, str) or not question.strip():
+            return 400, {"error": "Expected a non-empty \"question\" string"}
+        try:
+            args = self.flow_args(request)
+            timeout = float(request.get("timeout") or self.config.timeout)
+            if not math.isfinite(timeout) or timeout <= 0:
+                raise ValueError("timeout must be a positive number")
+            timeout = min(timeout, self.config.timeout)
+        except (TypeError, ValueError, OverflowError) as e:
+            return 400, {"error": f"Invalid option: {e}"}
+        _, async_flow, speculative_flow = select_flows(args)
+        flow = speculative_flow if is_speculative(args) else async_flow
+        lane = BATCH if request.get("priority") == "batch" else INTERACTIVE
+
+        start = time.monotonic()
+        if not self.slots.acquire(timeout=timeout):
+            return 503, {"id": request_id, "error": "Worker busy"}
+        try:
+            remaining = timeout - (time.monotonic() - start)
+            future = asyncio.run_coroutine_threadsafe(
+                _answer((request_id, question), flow_options(args), flow, lane, remaining), self.loop)
+            try:
+                result = future.result(remaining + 1.0)
+            except (asyncio.TimeoutError, concurrent.futures.TimeoutError):
+                future.cancel()
+                return 504, {"id": request_id, "error": f"Timed out after {timeout:g}s"}
+        finally:
+            self.slots.release()
+
+        response = {"id": request_id, **{key: result.get(key) for key in RESPONSE_FIELDS if key in result},
+                    "latency": result["latency"], "worker": os.getpid()}
+        return (500 if "error" in result else 200), response
+
+    def metrics(self):
+        with self._idle:
+            in_flight = self._in_flight
+            requests = dict(self.requests)
+        lines = [export_prometheus().rstrip("\n"),
+                 "# HELP qa_server_requests_total HTTP requests by status",
+                 "# TYPE qa_server_requests_total counter"]
+        for status, count in sorted(requests.items()):
+            lines.append(f'qa_server_requests_total{{worker="{os.getpid()}",status="{status}"}} {count}')
+        lines += ["# HELP qa_server_in_flight Questions being answered",
+                  "# TYPE qa_server_in_flight gauge",
+                  f'qa_server_in_flight{{worker="{os.getpid()}"}} {in_flight}']
+        return "\n".join(lines) + "\n"
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive for load balancers and clients
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def _send(self, status, body, content_type="application/json"):
+        worker = self.server.worker
+        worker.count(status)
+        data = body.encode("utf-8") if isinstance(body, str) else json.dumps(body, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        if worker.draining.is_set():
+            self.close_connection = True
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        worker = self.server.worker
+        if self.path == "/healthz":
+            if worker.draining.is_set():
+                self._send(503, {"status": "draining", "worker": os.getpid()})
+            else:
+                self._send(200, {"status": "ok", "worker": os.getpid()})
+        elif self.path == "/metrics":
+            self._send(200, worker.metrics(), "text/plain; version=0.0.4")
+        else:
+            self._send(404, {"error": "Not found"})
+
+    def do_POST(self):
+        if self.path != "/v1/answer":
+            self._send(404, {"error": "Not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            if length < 0:
+                raise ValueError
+        except ValueError:
+            self.close_connection = True
+            self._send(400, {"error": "Invalid Content-Length"})
+            return
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            self._send(413, {"error": "Request body too large"})
+            return
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(request, dict):
+                raise ValueError("expected a JSON object")
+        except ValueError as e:
+            self._send(400, {"error": f"Invalid JSON: {e}"})
+            return
+        request_id = self.headers.get("X-Request-Id") or uuid.uuid4().hex
+        worker = self.server.worker
+        worker._begin()
+        try:
+            status, response = worker.answer(request, request_id)
+            self._send(status, response)
+        finally:
+            # Only after the reply is written, so a draining worker does not exit under it
+            worker._end()
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, sock, worker):
+        super().__init__(sock.getsockname()[:2], _Handler, bind_and_activate=False)
+        self.socket.close()
+        self.socket = sock
+        self.worker = worker
+
+    def handle_error(self, request, client_address):
+        # Clients that hang up before their reply are not server errors
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+def _spawn(sock, config):
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            # Each worker builds its own limiters; together they must stay within one API budget
+            set_process_share(1.0 / config.workers)
+            Worker(sock, config).run()
+            code = 0
+        except Exception:
+            logger.exception("Worker %d failed", os.getpid())
+        finally:
+            os._exit(code)
+    return pid
+
+def serve(config):
+    """Bind the port, fork config.workers warm workers and supervise them until SIGTERM/SIGINT."""
+    sock = socket.create_server((config.host, config.port), backlog=config.backlog)
+    # Workers all wait on this socket; non-blocking so the ones that lose an accept race return
+    sock.setblocking(False)
+    if config.workers <= 1 or not hasattr(os, "fork"):
+        Worker(sock, config).run(handle_sigint=True)
+        return
+
+    children = {_spawn(sock, config) for _ in range(config.workers)}
+    stopping = threading.Event()
+
+    def stop(signum, frame):
+        if not stopping.is_set():
+            logger.info("Draining %d workers", len(children))
+            stopping.set()
+            # The workers hold their own copies of the socket until their grace period ends
+            sock.close()
+            for pid in children:
+                os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    logger.info("Serving on %s:%d with %d workers", config.host, sock.getsockname()[1], config.workers)
+    deadline = None
+    while children:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid == 0:
+            if stopping.is_set():
+                deadline = deadline or time.monotonic() + config.drain_grace + config.drain_timeout + 5.0
+                if time.monotonic() > deadline:
+                    for pid in children:
+                        os.kill(pid, signal.SIGKILL)
+            time.sleep(0.1)
+            continue
+        children.discard(pid)
+        if not stopping.is_set():
+            logger.warning("Worker %d exited (status %d); starting a replacement", pid, status)
+            time.sleep(0.5)  # don't spin if workers crash on start
+            children.add(_spawn(sock, config))
+    sock.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the QA flow over HTTP with pre-forked workers")
+    parser.add_argument("--host", type=str, default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes (default: one per core; 1 serves in-process)")
+    parser.add_argument("--concurrency", type=int, default=64, help="Questions in flight per worker")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Maximum seconds per question")
+    parser.add_argument("--drain-grace", type=float, default=5.0,
+                        help="Seconds a stopping worker keeps accepting while failing health checks")
+    parser.add_argument("--drain-timeout", type=float, default=30.0,
+                        help="Seconds a stopping worker waits for in-flight questions")
+    parser.add_argument("--backlog", type=int, default=1024, help="Listen backlog of the shared socket")
+    parser.add_argument("--max-attempts", type=int, default=None,
+                        help="Default answer/validate attempts per question (default: unbounded)")
+    parser.add_argument("--candidates", type=int, default=None,
+                        help="Default candidate answers per attempt (speculative flow when > 1)")
+    parser.add_argument("--index-dir", type=str, default=None,
+                        help="Answer with context retrieved from this index (built by ingest.py)")
+    parser.add_argument("--top-k", type=int, default=None, help="Default chunks to retrieve per question")
+    parser.add_argument("--context-tokens", type=int, default=None, help="Default token budget for context")
+    serve(parser.parse_args())
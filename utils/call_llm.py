@@ -1,18 +1,317 @@
-from openai import OpenAI
-
-def call_llm(prompt,model_name="deepseek-chat"):    
-    client = OpenAI(
-        api_key="sk-9c06d4df5a7a492aaa045541e50cd0e3", 
-        base_url="https://api.deepseek.com",
-        timeout=30.0,
-        max_retries=3,
-    )
-    r = client.chat.completions.create(
-        model=model_name,
-        messages=[{"role": "user", "content": prompt}]
-    )
-    return r.choices[0].message.content
-    
+import asyncio
+import os
+import threading
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+from utils.llm_cache import get_llm_cache
+from utils.llm_router import get_router
+from utils.rate_limiter import get_limiter
+from utils.tracing import detached_span, span, record_usage, tracing_enabled
+
+API_KEY = os.environ.get("DEEPSEEK_API_KEY", "sk-9c06d4df5a7a492aaa045541e50cd0e3")
+BASE_URL = os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
+
+# Connection pool settings shared by the sync and async clients
+POOL_CONFIG = {
+    "max_connections": int(os.environ.get("LLM_POOL_MAX_CONNECTIONS", 100)),
+    "max_keepalive_connections": int(os.environ.get("LLM_POOL_MAX_KEEPALIVE", 20)),
+    "keepalive_expiry": float(os.environ.get("LLM_POOL_KEEPALIVE_EXPIRY", 60.0)),
+}
+# Requests per second and concurrent requests to the API; 429s shrink the
+# concurrency limit (see utils/rate_limiter.py, RATE_LIMIT_DEEPSEEK overrides)
+RATE_LIMIT = float(os.environ.get("LLM_RATE_LIMIT", 50))
+MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", 64))
+
+_lock = threading.Lock()
+_client = None
+_async_clients = {}
+_stats = {"requests": 0, "new_connections": 0, "tls_handshakes": 0}
+
+
+def _trace(event_name, info):
+    """httpcore trace hook: counts TCP connects and TLS handshakes."""
+    if event_name == "connection.connect_tcp.complete":
+        with _lock:
+            _stats["new_connections"] += 1
+    elif event_name == "connection.start_tls.complete":
+        with _lock:
+            _stats["tls_handshakes"] += 1
+
+
+async def _async_trace(event_name, info):
+    _trace(event_name, info)
+
+
+def _on_request(request):
+    request.extensions["trace"] = _trace
+    with _lock:
+        _stats["requests"] += 1
+
+
+async def _on_async_request(request):
+    request.extensions["trace"] = _async_trace
+    with _lock:
+        _stats["requests"] += 1
+
+
+def _limits():
+    return httpx.Limits(**POOL_CONFIG)
+
+
+def configure_pool(max_connections=None, max_keepalive_connections=None, keepalive_expiry=None):
+    """Change the connection pool size used by the shared LLM clients.
+
+    Existing clients are closed and rebuilt lazily on the next call.
+
+    Args:
+        max_connections (int, optional): Maximum number of open connections
+        max_keepalive_connections (int, optional): Maximum idle connections kept alive
+        keepalive_expiry (float, optional): Seconds an idle connection is kept
+    """
+    global _client
+    with _lock:
+        if max_connections is not None:
+            POOL_CONFIG["max_connections"] = max_connections
+        if max_keepalive_connections is not None:
+            POOL_CONFIG["max_keepalive_connections"] = max_keepalive_connections
+        if keepalive_expiry is not None:
+            POOL_CONFIG["keepalive_expiry"] = keepalive_expiry
+        old_client, _client = _client, None
+        _async_clients.clear()
+    if old_client is not None:
+        old_client.close()
+
+
+def get_client():
+    """Return the process-wide OpenAI client, creating it on first use.
+
+    The client owns a keep-alive connection pool, so repeated calls reuse
+    warm connections instead of paying a new TCP/TLS handshake each time.
+    httpx clients are thread-safe, so one instance serves all threads.
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                http_client = httpx.Client(
+                    limits=_limits(),
+                    timeout=30.0,
+                    event_hooks={"request": [_on_request]},
+                )
+                _client = OpenAI(
+                    api_key=API_KEY,
+                    base_url=BASE_URL,
+                    timeout=30.0,
+                    max_retries=0,  # retried by the shared limiter
+                    http_client=http_client,
+                )
+    return _client
+
+
+def get_async_client():
+    """Return the AsyncOpenAI client bound to the running event loop.
+
+    Async connection pools cannot be shared across event loops, so one
+    client is kept per loop.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        with _lock:
+            client = _async_clients.get(loop)
+            if client is None:
+                http_client = httpx.AsyncClient(
+                    limits=_limits(),
+                    timeout=30.0,
+                    event_hooks={"request": [_on_async_request]},
+                )
+                client = AsyncOpenAI(
+                    api_key=API_KEY,
+                    base_url=BASE_URL,
+                    timeout=30.0,
+                    max_retries=0,  # retried by the shared limiter
+                    http_client=http_client,
+                )
+                # Drop clients whose loop is gone so they can be collected
+                for stale in [l for l in _async_clients if l.is_closed()]:
+                    del _async_clients[stale]
+                _async_clients[loop] = client
+    return client
+
+
+def get_pool_stats():
+    """Return connection reuse statistics for the shared LLM clients.
+
+    Returns:
+        dict: requests sent, new connections opened, TLS handshakes
+              performed and requests that reused a pooled connection
+    """
+    with _lock:
+        stats = dict(_stats)
+    stats["reused_connections"] = max(0, stats["requests"] - stats["new_connections"])
+    return stats
+
+
+def reset_pool_stats():
+    """Reset the connection statistics counters to zero."""
+    with _lock:
+        for key in _stats:
+            _stats[key] = 0
+
+
+def _reset_after_fork():
+    # Sockets inherited from the parent must not be shared with the child
+    global _client, _lock
+    _lock = threading.Lock()
+    _client = None
+    _async_clients.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_llm_limiter():
+    """Return the limiter shared by every call to the LLM API in this process."""
+    return get_limiter("deepseek", rate=RATE_LIMIT, max_concurrency=MAX_CONCURRENCY)
+
+
+def call_llm(prompt, model_name="deepseek-chat", use_cache=True, **params):
+    """Send a single-turn prompt to the LLM and return the reply text.
+
+    Args:
+        prompt (str): The user prompt
+        model_name (str): Model to call
+        use_cache (bool): Look up and store the reply in the persistent response cache
+        **params: Extra chat.completions.create parameters (e.g. temperature)
+
+    Returns:
+        str: The model's reply
+    """
+    with span("llm", "llm", model=model_name) as s:
+        cache = get_llm_cache() if use_cache else None
+        if cache is not None:
+            key = cache.make_key(model_name, prompt, params)
+            cached = cache.get(key)
+            if cached is not None:
+                s.set(cached=True)
+                return cached
+        messages = [{"role": "user", "content": prompt}]
+        router = get_router()
+        if router is not None and router.handles(model_name):
+            r, backend = router.complete(model_name, messages, **params)
+            s.set(backend=backend.name)
+        else:
+            r = get_llm_limiter().call(
+                get_client().chat.completions.create,
+                model=model_name,
+                messages=messages,
+                **params
+            )
+        record_usage(s, r.usage)
+        content = r.choices[0].message.content
+        if cache is not None and content is not None:
+            cache.set(key, content)
+        return content
+
+
+async def async_call_llm(prompt, model_name="deepseek-chat", use_cache=True, **params):
+    """Async variant of call_llm using the event loop's pooled AsyncOpenAI client.
+
+    Cache reads and writes run in a worker thread: SQLite can block for up to
+    its busy timeout while another process writes, which would stall the loop.
+    """
+    with span("llm", "llm", model=model_name) as s:
+        cache = get_llm_cache() if use_cache else None
+        if cache is not None:
+            key = cache.make_key(model_name, prompt, params)
+            cached = await asyncio.to_thread(cache.get, key)
+            if cached is not None:
+                s.set(cached=True)
+                return cached
+        messages = [{"role": "user", "content": prompt}]
+        router = get_router()
+        if router is not None and router.handles(model_name):
+            r, backend = await router.complete_async(model_name, messages, **params)
+            s.set(backend=backend.name)
+        else:
+            r = await get_llm_limiter().call_async(
+                get_async_client().chat.completions.create,
+                model=model_name,
+                messages=messages,
+                **params
+            )
+        record_usage(s, r.usage)
+        content = r.choices[0].message.content
+        if cache is not None and content is not None:
+            await asyncio.to_thread(cache.set, key, content)
+        return content
+
+def stream_llm(prompt, model_name="deepseek-chat", use_cache=True, **params):
+    """Stream the LLM reply, yielding text fragments as they arrive.
+
+    Shares the response cache with call_llm: a cached reply is yielded in one
+    piece, and a fully streamed reply is stored once the stream completes.
+
+    Args:
+        prompt (str): The user prompt
+        model_name (str): Model to call
+        use_cache (bool): Look up and store the reply in the persistent response cache
+        **params: Extra chat.completions.create parameters (e.g. temperature)
+
+    Yields:
+        str: Successive fragments of the reply
+    """
+    # Detached: the span stays open across yields, where the consumer's context is current
+    with detached_span("llm", "llm", model=model_name, stream=True) as s:
+        cache = get_llm_cache() if use_cache else None
+        if cache is not None:
+            key = cache.make_key(model_name, prompt, params)
+            cached = cache.get(key)
+            if cached is not None:
+                s.set(cached=True)
+                yield cached
+                return
+        extra = {"stream_options": {"include_usage": True}} if tracing_enabled() else {}
+        messages = [{"role": "user", "content": prompt}]
+        router = get_router()
+        if router is not None and router.handles(model_name):
+            stream, backend = router.stream(model_name, messages, **extra, **params)
+            s.set(backend=backend.name)
+        else:
+            # The limiter admits and retries opening the stream; reading it is not throttled
+            stream = get_llm_limiter().call(
+                get_client().chat.completions.create,
+                model=model_name,
+                messages=messages,
+                stream=True,
+                **extra,
+                **params
+            )
+        parts = []
+        try:
+            for chunk in stream:
+                if getattr(chunk, "usage", None) is not None:
+                    record_usage(s, chunk.usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        finally:
+            stream.close()
+        if cache is not None and parts:
+            cache.set(key, "".join(parts))
+
 if __name__ == "__main__":
     prompt = "What is the meaning of life?"
-    print(call_llm(prompt))
\ No newline at end of file
+    print(call_llm(prompt))
+    print(call_llm(prompt))
+    print(get_pool_stats())
+    for token in stream_llm(prompt, use_cache=False):
+        print(token, end="", flush=True)
+    print()
+    print(get_llm_cache().stats())
@@ -1,45 +1,272 @@
 """
 HTML Content Retrieval Utility for Cold Outreach Opener Generator
 """
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
 import requests
 from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+from utils.rate_limiter import bind_priority, get_limiter
+
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:  # lxml is optional; html.parser is used without it
+    lxml = None
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+CACHE_DIR = os.environ.get("HTML_CACHE_DIR", os.path.join(".cache", "html"))
+# "auto" picks lxml when it is installed
+HTML_PARSER = os.environ.get("HTML_PARSER", "auto")
+
+# Keep-alive connections kept open per host by the shared session
+POOL_MAXSIZE = 16
+# Politeness limits per host: concurrent requests and requests per second
+DEFAULT_PER_HOST = 4
+HOST_RATE_LIMIT = float(os.environ.get("HTML_HOST_RATE_LIMIT", 10))
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """Return the process-wide requests session, which keeps connections alive between calls."""
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        with _session_lock:
+            if _session is None or _session_pid != os.getpid():
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_MAXSIZE, pool_maxsize=POOL_MAXSIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers["User-Agent"] = USER_AGENT
+                _session, _session_pid = session, os.getpid()
+    return _session
+
+def _clean(text):
+    # Collapse all runs of whitespace, including newlines, to single spaces
+    return " ".join(text.split())
+
+def _extract_html_parser(content):
+    soup = BeautifulSoup(content, 'html.parser')
+
+    # Remove script and style elements
+    for script in soup(["script", "style"]):
+        script.extract()
+
+    title = soup.title.string if soup.title and soup.title.string else ""
+    return title.strip(), _clean(soup.get_text(separator=' ', strip=True))
+
+def _extract_lxml(content):
+    try:
+        tree = lxml.html.fromstring(content)
+    except ValueError:  # str with an XML encoding declaration
+        tree = lxml.html.fromstring(content.encode("utf-8"))
+    etree.strip_elements(tree, "script", "style", etree.Comment, with_tail=False)
+    title = tree.findtext(".//title") or ""
+    return title.strip(), _clean(" ".join(tree.itertext()))
+
+PARSERS = {
+    "html.parser": _extract_html_parser,
+    "lxml": _extract_lxml,
+}
+
+def _declared_charset(response):
+    content_type = response.headers.get("Content-Type", "")
+    if "charset=" not in content_type.lower():
+        return None
+    return content_type.lower().split("charset=", 1)[1].split(";")[0].strip(" \"'")
+
+def extract_text(content, parser=None, encoding=None):
+    """
+    Extracts the title and visible text from an HTML document.
+
+    Args:
+        content (str or bytes): HTML document
+        parser (str, optional): "lxml" or "html.parser". Defaults to HTML_PARSER.
+        encoding (str, optional): Encoding of bytes content. Defaults to UTF-8, falling
+            back to the parser's own detection when the bytes are not valid UTF-8.
+
+    Returns:
+        tuple: (title, text)
+    """
+    if isinstance(content, bytes):
+        try:
+            content = content.decode(encoding or "utf-8")
+        except (UnicodeDecodeError, LookupError):
+            pass
+    parser = parser or HTML_PARSER
+    if parser == "auto":
+        parser = "lxml" if lxml is not None else "html.parser"
+    if not content or not content.strip():
+        return "", ""
+    return PARSERS[parser](content)
+
+class HtmlCache:
+    """
+    On-disk cache of fetched pages keyed by URL.
+
+    Each entry keeps the validators (ETag, Last-Modified) needed for a
+    conditional GET, the extracted title and text, and the raw HTML in a
+    separate file so it is only read when a caller asks for it.
+    """
+
+    def __init__(self, directory=CACHE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, key + ".json"), os.path.join(self.directory, key + ".html")
+
+    def get(self, url):
+        meta_path, _ = self._paths(url)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def get_html(self, url, encoding):
+        _, html_path = self._paths(url)
+        with open(html_path, "rb") as f:
+            return f.read().decode(encoding or "utf-8", "replace")
+
+    @staticmethod
+    def _write(path, data):
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def set(self, url, entry, content=None):
+        """Store an entry; the raw HTML bytes are written first, then the metadata."""
+        meta_path, html_path = self._paths(url)
+        if content is not None:
+            self._write(html_path, content)
+        self._write(meta_path, json.dumps(entry).encode("utf-8"))
+
+_cache = None
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _session_lock:
+            if _cache is None:
+                _cache = HtmlCache()
+    return _cache
+
+def _host_limiter(url, per_host):
+    # Process-wide per host, so concurrent batches share the host's budget
+    return get_limiter("web:" + urlsplit(url).netloc, rate=HOST_RATE_LIMIT, max_concurrency=per_host)
+
+def _fetch(url, timeout, cache, max_age, include_html, parser, per_host=DEFAULT_PER_HOST):
+    entry = cache.get(url) if cache else None
+    if entry is not None and max_age is not None and time.time() - entry["fetched_at"] < max_age:
+        status = "cached"
+    else:
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        with _host_limiter(url, per_host).slot() as slot:
+            response = get_session().get(url, headers=headers, timeout=timeout)
+            if response.status_code == 429:
+                slot.mark_throttled()
+
+        if response.status_code == 304 and entry is not None:
+            status = "not_modified"
+            entry["fetched_at"] = time.time()
+            cache.set(url, entry)
+        else:
+            response.raise_for_status()  # Raise exception for 4XX/5XX status codes
+            status = "fetched"
+            content = response.content
+            title, text = extract_text(content, parser, _declared_charset(response))
+            entry = {
+                "url": url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "encoding": response.encoding,
+                "fetched_at": time.time(),
+                "title": title,
+                "text": text,
+            }
+            if cache:
+                cache.set(url, entry, content)
+            if include_html:
+                return {"url": url, "status": status, "title": title, "text": text, "html": response.text}
+
+    result = {"url": url, "status": status, "title": entry["title"], "text": entry["text"]}
+    if include_html:
+        result["html"] = cache.get_html(url, entry.get("encoding"))
+    return result
+
+def fetch_html_many(urls, max_workers=16, per_host=DEFAULT_PER_HOST, timeout=10, use_cache=True, max_age=None,
+                    include_html=False, parser=None):
+    """
+    Retrieves many URLs concurrently over a shared keep-alive session.
+
+    Cached pages are revalidated with ETag / Last-Modified, so unchanged pages
+    cost a 304 and are not parsed again. Duplicate URLs are fetched once.
+
+    Args:
+        urls (list): URLs to retrieve
+        max_workers (int, optional): Requests in flight overall. Defaults to 16.
+        per_host (int, optional): Requests in flight per host, shared with other
+            callers in the process and lowered when the host answers 429. Defaults to 4.
+        timeout (int, optional): Request timeout in seconds. Defaults to 10.
+        use_cache (bool, optional): Read and write the on-disk cache. Defaults to True.
+        max_age (float, optional): Serve cache entries younger than this many seconds
+            without contacting the server. Defaults to always revalidating.
+        include_html (bool, optional): Also return the raw HTML. Defaults to False.
+        parser (str, optional): Text extraction parser, see extract_text.
+
+    Returns:
+        list: One dict per URL, in input order, with "url", "status" ("fetched",
+            "not_modified", "cached" or "error"), "title", "text" and, on
+            failure, "error"
+    """
+    cache = get_cache() if use_cache else None
+    unique = list(dict.fromkeys(urls))
+
+    def fetch_one(url):
+        try:
+            return _fetch(url, timeout, cache, max_age, include_html, parser, per_host)
+        except Exception as e:
+            return {"url": url, "status": "error", "title": "", "text": "", "error": str(e)}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(unique)))) as executor:
+        results = dict(zip(unique, executor.map(bind_priority(fetch_one), unique)))
+    return [results[url] for url in urls]
 
 def get_html_content(url, timeout=10):
     """
     Retrieves HTML content from a URL.
-    
+
     Args:
         url (str): URL to retrieve content from
         timeout (int, optional): Request timeout in seconds. Defaults to 10.
-        
+
     Returns:
         dict: Dictionary containing HTML content and extracted text
     """
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=timeout)
-        response.raise_for_status()  # Raise exception for 4XX/5XX status codes
-        
-        html_content = response.text
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        # Remove script and style elements
-        for script in soup(["script", "style"]):
-            script.extract()
-            
-        # Extract text content
-        text = soup.get_text(separator=' ', strip=True)
-        
-        # Clean up text (remove excessive newlines)
-        lines = (line.strip() for line in text.splitlines())
-        text = ' '.join(line for line in lines if line)
-        
+        result = _fetch(url, timeout, get_cache(), None, True, None)
         return {
-            "html": html_content,
-            "text": text,
-            "title": soup.title.string if soup.title else ""
+            "html": result["html"],
+            "text": result["text"],
+            "title": result["title"]
         }
     except Exception as e:
         print(f"Error retrieving content from {url}: {e}")
@@ -56,4 +283,12 @@ if __name__ == "__main__":
     print(f"Title: {content['title']}")
     print(f"Text length: {len(content['text'])}")
     print("First 200 characters of text:")
-    print(content['text'][:200] + "...") 
\ No newline at end of file
+    print(content['text'][:200] + "...")
+
+    # Bulk fetch; the second call revalidates the cached pages
+    urls = [test_url, "https://github.com/The-Pocket/PocketFlow-Tutorial-Codebase-Knowledge"]
+    for attempt in range(2):
+        start = time.perf_counter()
+        results = fetch_html_many(urls)
+        print(f"Bulk fetch {attempt + 1}: {[r['status'] for r in results]} "
+              f"in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,185 @@
+import os
+import sqlite3
+import threading
+
+import faiss
+import numpy as np
+
+from utils.data_loader import FileManifest
+from utils.index_manager import IndexManager
+
+INDEX_FILE = "index.faiss"
+CHUNKS_FILE = "chunks.sqlite"
+MANIFEST_FILE = "manifest.json"
+
+class ChunkStore:
+    """SQLite table of chunk texts and their source spans, keyed by vector id.
+
+    Ids come from an AUTOINCREMENT column, so ids of removed chunks are never
+    reused and stay safe to use as stable FAISS external ids.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, path TEXT NOT NULL, "
+                "offset INTEGER NOT NULL, length INTEGER NOT NULL, text TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS chunks_path ON chunks (path)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def replace_document(self, path, chunks):
+        """Replace a document's chunks; returns (old_ids, new_ids).
+
+        Args:
+            path (str): Source document path
+            chunks (list): (offset, length, text) tuples
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            old_ids = [i for (i,) in conn.execute("SELECT id FROM chunks WHERE path = ?", (path,))]
+            conn.execute("DELETE FROM chunks WHERE path = ?", (path,))
+            new_ids = [
+                conn.execute("INSERT INTO chunks (path, offset, length, text) VALUES (?, ?, ?, ?)",
+                             (path, offset, length, text)).lastrowid
+                for offset, length, text in chunks
+            ]
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return old_ids, new_ids
+
+    def remove_document(self, path):
+        """Delete a document's chunks and return their ids."""
+        return self.replace_document(path, [])[0]
+
+    def get(self, ids):
+        """Return {id: {"path", "offset", "length", "text"}} for the ids that exist."""
+        ids = [int(i) for i in ids]
+        if not ids:
+            return {}
+        placeholders = ",".join("?" * len(ids))
+        rows = self._conn().execute(
+            f"SELECT id, path, offset, length, text FROM chunks WHERE id IN ({placeholders})", ids)
+        return {row[0]: {"path": row[1], "offset": row[2], "length": row[3], "text": row[4]} for row in rows}
+
+    def all_ids(self):
+        return np.fromiter((i for (i,) in self._conn().execute("SELECT id FROM chunks")), dtype=np.int64)
+
+class CorpusIndex:
+    """A directory holding a vector index, its chunk store and a file manifest.
+
+    Documents are replaced as a unit: their old vectors and chunks are
+    removed and the new ones added. checkpoint() saves the index atomically
+    and only then commits the documents indexed since the last checkpoint to
+    the manifest. After a crash, those uncommitted documents are simply
+    ingested again on the next run.
+    """
+
+    def __init__(self, directory, index_type="flat", train_vectors=None, read_only=False, mmap=False):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.index_type = index_type
+        self.train_vectors = train_vectors
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        self.chunks = ChunkStore(os.path.join(directory, CHUNKS_FILE))
+        self.manifest = FileManifest(os.path.join(directory, MANIFEST_FILE))
+        self.read_only = read_only or mmap
+        self.index = None
+        self._pending = []
+        self._lock = threading.Lock()
+        if os.path.exists(self.index_path):
+            self.index = IndexManager.load(self.index_path, mmap=mmap)
+            if not self.read_only:
+                self._drop_orphans()
+
+    def _drop_orphans(self):
+        # Vectors whose chunks were replaced after the last checkpoint (crash recovery)
+        base = faiss.downcast_index(self.index.index)
+        if isinstance(base, faiss.IndexIDMap2):
+            stored = faiss.vector_to_array(base.id_map)
+            orphans = np.setdiff1d(stored, self.chunks.all_ids())
+            if len(orphans):
+                self.index.remove(orphans)
+
+    def _ensure_index(self, dim):
+        if self.index is None:
+            self.index = IndexManager.create(dim, index_type=self.index_type, train_vectors=self.train_vectors,
+                                             path=self.index_path)
+        return self.index
+
+    def replace_document(self, path, chunks, vectors):
+        """Index a document's chunks, replacing any previous version.
+
+        Args:
+            path (str): Source document path
+            chunks (list): (offset, length, text) tuples
+            vectors (numpy.ndarray): One embedding per chunk
+        """
+        with self._lock:
+            old_ids, new_ids = self.chunks.replace_document(path, chunks)
+            if len(new_ids):
+                index = self._ensure_index(vectors.shape[1])
+                if old_ids:
+                    index.remove(old_ids)
+                index.add(new_ids, vectors)
+            elif old_ids and self.index is not None:
+                self.index.remove(old_ids)
+            self._pending.append(path)
+
+    def remove_document(self, path):
+        """Remove a deleted document from the index, chunk store and manifest."""
+        with self._lock:
+            old_ids = self.chunks.remove_document(path)
+            if old_ids and self.index is not None:
+                self.index.remove(old_ids)
+            self.manifest.forget(path)
+
+    def checkpoint(self):
+        """Persist the index, then commit indexed documents to the manifest."""
+        with self._lock:
+            if self.index is not None:
+                self.index.save(self.index_path)
+            for path in self._pending:
+                self.manifest.commit(path)
+            self._pending = []
+            self.manifest.save()
+
+    def search(self, query_vectors, top_k=5, **kwargs):
+        """Batch search; returns one list of {"id", "score", "path", "offset", "length", "text"} per query."""
+        if self.index is None or self.index.ntotal == 0:
+            return [[] for _ in range(len(np.atleast_2d(query_vectors)))]
+        scores, ids = self.index.search(query_vectors, top_k, **kwargs)
+        chunks = self.chunks.get({int(i) for i in ids.reshape(-1) if i >= 0})
+        results = []
+        for row_scores, row_ids in zip(scores, ids):
+            # Ids without a stored chunk are stale vectors from an interrupted run
+            results.append([{"id": int(i), "score": float(s), **chunks[int(i)]}
+                            for s, i in zip(row_scores, row_ids) if int(i) in chunks])
+        return results
+
+_corpora = {}
+_corpora_lock = threading.Lock()
+
+def open_corpus(directory):
+    """Open a corpus read-only (memory-mapped) once per process and directory."""
+    key = (os.path.abspath(directory), os.getpid())
+    corpus = _corpora.get(key)
+    if corpus is None:
+        with _corpora_lock:
+            corpus = _corpora.get(key)
+            if corpus is None:
+                corpus = _corpora[key] = CorpusIndex(directory, mmap=True)
+    return corpus
@@ -1,44 +1,186 @@
+import hashlib
+import json
+import mmap
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+def scan_files(data_dir, extensions=(".txt",), recursive=True):
+    """Yield os.DirEntry objects for matching files under data_dir.
+
+    Uses os.scandir, so file type and stat information come from the
+    directory listing without extra system calls on most platforms.
+    """
+    stack = [data_dir]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        stack.append(entry.path)
+                elif entry.is_file() and entry.name.endswith(tuple(extensions)):
+                    yield entry
+
+class FileManifest:
+    """Remembers each file's mtime, size and content hash between runs.
+
+    Files whose mtime and size are unchanged are skipped without being read;
+    files whose mtime changed but whose content hash did not are skipped after
+    reading. New fingerprints are staged and only become part of the saved
+    manifest once committed, so a consumer can commit a file after it has
+    actually been processed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.staged = {}
+        self.seen = set()
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def is_unchanged(self, path, stat):
+        entry = self.entries.get(path)
+        return entry is not None and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size
+
+    def has_hash(self, path, digest):
+        entry = self.entries.get(path)
+        return entry is not None and entry["sha256"] == digest
+
+    def stage(self, path, stat, digest):
+        with self._lock:
+            self.staged[path] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": digest}
+
+    def commit(self, path):
+        """Mark a staged file as processed."""
+        with self._lock:
+            if path in self.staged:
+                self.entries[path] = self.staged.pop(path)
+
+    def missing(self):
+        """Return manifest paths that were not seen by the last scan (deleted files)."""
+        return [path for path in self.entries if path not in self.seen]
+
+    def forget(self, path):
+        with self._lock:
+            self.entries.pop(path, None)
+
+    def save(self):
+        """Atomically write the committed entries to disk."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp-{os.getpid()}"
+        with self._lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+
+def _read_file(path, size, mmap_threshold):
+    """Return (content, sha256) where content is str or a read-only mmap."""
+    with open(path, "rb") as f:
+        if mmap_threshold is not None and size >= mmap_threshold and size > 0:
+            content = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return content, hashlib.sha256(content).hexdigest()
+        data = f.read()
+    return data.decode("utf-8"), hashlib.sha256(data).hexdigest()
+
+def iter_data(data_dir, extensions=(".txt",), recursive=True, max_workers=8, mmap_threshold=None,
+              manifest=None, auto_commit=True):
+    """Lazily load files under data_dir, reading them in parallel.
+
+    Args:
+        data_dir (str): Directory to scan
+        extensions (tuple): File name suffixes to load
+        recursive (bool): Descend into subdirectories
+        max_workers (int): Threads reading files concurrently
+        mmap_threshold (int, optional): Files at least this many bytes are yielded
+            as read-only mmap objects (UTF-8 bytes) instead of str
+        manifest (FileManifest, optional): Skip files unchanged since the manifest was saved
+        auto_commit (bool): Commit each file to the manifest as it is yielded; pass False
+            to call manifest.commit(path) yourself once the file is processed
+
+    Yields:
+        tuple: (path, content) in completion order
+    """
+    def load(entry):
+        stat = entry.stat()
+        content, digest = _read_file(entry.path, stat.st_size, mmap_threshold)
+        return entry.path, stat, content, digest
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = set()
+
+        def drain(return_when):
+            nonlocal pending
+            done, pending = wait(pending, return_when=return_when)
+            for future in done:
+                path, stat, content, digest = future.result()
+                if manifest is not None:
+                    if manifest.has_hash(path, digest):
+                        # Touched but not modified: refresh mtime, skip the content
+                        if isinstance(content, mmap.mmap):
+                            content.close()
+                        manifest.stage(path, stat, digest)
+                        manifest.commit(path)
+                        continue
+                    manifest.stage(path, stat, digest)
+                yield path, content
+                if manifest is not None and auto_commit:
+                    manifest.commit(path)
+
+        for entry in scan_files(data_dir, extensions, recursive):
+            if manifest is not None:
+                manifest.seen.add(entry.path)
+                if manifest.is_unchanged(entry.path, entry.stat()):
+                    continue
+            # Bound read-ahead so memory stays proportional to max_workers
+            if len(pending) >= max_workers * 2:
+                yield from drain(FIRST_COMPLETED)
+            pending.add(executor.submit(load, entry))
+        while pending:
+            yield from drain(FIRST_COMPLETED)
 
 def load_data(data_dir):
     """Load data from files.
-    
+
     Args:
         data_dir (str): Directory containing the essay text files
-        
+
     Returns:
         data_dict: Dictionary mapping file_id to essay text
     """
-    data = {}
-    
-    for filename in os.listdir(data_dir):
-        if filename.endswith('.txt'):
-            with open(os.path.join(data_dir, filename), 'r', encoding='utf-8') as f:
-                data[filename] = f.read()
-    
-    return data
+    return {os.path.basename(path): text for path, text in iter_data(data_dir, recursive=False)}
 
 if __name__ == "__main__":
     # Example usage
     import sys
-    
+
     # Get current directory
     current_dir = os.path.dirname(os.path.abspath(__file__))
     # Go up one level to project root
     project_root = os.path.dirname(current_dir)
-    
+
     data_dir = os.path.join(project_root, "data")
-    
+
     if os.path.exists(data_dir):
         data = load_data(data_dir)
-        
+
         print(f"Loaded {len(data)} files")
-        
+
         # Print a sample essay
         if data:
             sample_id = next(iter(data))
             print(f"\nSample essay (ID: {sample_id}):")
             print(f"{data[sample_id][:200]}...")
+
+        # Incremental, recursive load: a second run skips unchanged files
+        manifest = FileManifest(os.path.join(project_root, ".cache", "data_manifest.json"))
+        changed = sum(1 for _ in iter_data(data_dir, manifest=manifest))
+        manifest.save()
+        print(f"\n{changed} new or changed files since the last run")
     else:
         print(f"Data directory not found.")
         print(f"Expected data directory: {data_dir}")
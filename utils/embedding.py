@@ -1,33 +1,235 @@
 from vertexai.language_models import TextEmbeddingInput, TextEmbeddingModel
 from functools import lru_cache
+import hashlib
+import os
+import sqlite3
+import threading
+import numpy as np
+
+from utils.rate_limiter import get_limiter
+
+MODEL_NAME = "text-embedding-005"
+# Vertex AI request limits for text embedding models
+MAX_BATCH_SIZE = 250
+MAX_BATCH_TOKENS = 20000
+# Embedding requests per second and in flight, shared by all threads
+RATE_LIMIT = float(os.environ.get("EMBEDDING_RATE_LIMIT", 20))
+MAX_CONCURRENCY = int(os.environ.get("EMBEDDING_MAX_CONCURRENCY", 8))
+
+CACHE_DIR = os.environ.get("EMBEDDING_CACHE_DIR", os.path.join(".cache", "embeddings"))
+
+_model = None
+_model_lock = threading.Lock()
+
+def get_model():
+    """Load the embedding model once per process."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _model = TextEmbeddingModel.from_pretrained(MODEL_NAME)
+    return _model
+
+def _estimate_tokens(text):
+    # Rough count used only to keep batches under the request token limit
+    return len(text) // 4 + 1
+
+def iter_batches(texts, max_size=MAX_BATCH_SIZE, max_tokens=MAX_BATCH_TOKENS):
+    """Group texts into the largest batches allowed by the API limits.
+
+    Args:
+        texts (list): Texts to group
+        max_size (int): Maximum texts per request
+        max_tokens (int): Maximum estimated tokens per request
+
+    Yields:
+        list: Consecutive slices of texts
+    """
+    batch, batch_tokens = [], 0
+    for text in texts:
+        tokens = _estimate_tokens(text)
+        if batch and (len(batch) >= max_size or batch_tokens + tokens > max_tokens):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+class EmbeddingCache:
+    """On-disk, content-addressed embedding cache that survives restarts.
+
+    Vectors are appended to a flat float32 file that is read back through a
+    memory map; a SQLite table maps each content hash to its row. Writers
+    serialize on a SQLite write lock, so several processes can share one cache.
+    """
+
+    def __init__(self, directory=CACHE_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.index_path = os.path.join(directory, "index.sqlite")
+        self._local = threading.local()
+        self._mmap = None
+        self._mmap_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(text, task_type, model_name=MODEL_NAME):
+        return hashlib.sha256(f"{model_name}\0{task_type}\0{text}".encode("utf-8")).hexdigest()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.index_path, timeout=30.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _dim(self):
+        row = self._conn().execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        return int(row[0]) if row else None
+
+    def _rows(self, min_rows, dim):
+        # Re-map the vector file only when it has grown past the current view
+        with self._mmap_lock:
+            if self._mmap is None or len(self._mmap) < min_rows:
+                # Whole rows only: a crashed writer may have left a partial row at the end
+                rows = os.path.getsize(self.vectors_path) // (dim * 4)
+                self._mmap = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, dim))
+            return self._mmap
+
+    def get_many(self, keys):
+        """Return {key: vector} for the keys present in the cache."""
+        if not keys:
+            return {}
+        conn = self._conn()
+        found = {}
+        keys = list(keys)
+        # Stay well below SQLite's bound-parameter limit
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            found.update(conn.execute(
+                f"SELECT key, row FROM vectors WHERE key IN ({placeholders})", chunk
+            ).fetchall())
+        if not found:
+            return {}
+        rows = self._rows(max(found.values()) + 1, self._dim())
+        return {key: np.array(rows[row]) for key, row in found.items()}
+
+    def put_many(self, keys, vectors):
+        """Append vectors for keys that are not cached yet."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            dim = self._dim()
+            if dim is None:
+                dim = vectors.shape[1]
+                conn.execute("INSERT INTO meta (name, value) VALUES ('dim', ?)", (str(dim),))
+            elif dim != vectors.shape[1]:
+                raise ValueError(f"Embedding cache holds {dim}-d vectors, got {vectors.shape[1]}-d")
+
+            existing = set()
+            for i in range(0, len(keys), 500):
+                chunk = list(keys[i:i + 500])
+                placeholders = ",".join("?" * len(chunk))
+                existing.update(k for (k,) in conn.execute(
+                    f"SELECT key FROM vectors WHERE key IN ({placeholders})", chunk))
+            new = [i for i, key in enumerate(keys) if key not in existing]
+            if new:
+                next_row = conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM vectors").fetchone()[0]
+                # Rows past MAX(row) may hold a crashed writer's data, so overwrite from there
+                mode = "r+b" if os.path.exists(self.vectors_path) else "w+b"
+                with open(self.vectors_path, mode) as f:
+                    f.seek(next_row * dim * 4)
+                    f.write(vectors[new].tobytes())
+                    # Drop any leftover bytes past the rows just written
+                    f.truncate()
+                conn.executemany("INSERT INTO vectors (key, row) VALUES (?, ?)",
+                                 [(keys[i], next_row + n) for n, i in enumerate(new)])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+_cache = None
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _model_lock:
+            if _cache is None:
+                _cache = EmbeddingCache()
+    return _cache
+
+def get_embeddings(texts, task_type="RETRIEVAL_DOCUMENT", use_cache=True):
+    """Get embedding vectors for many texts using Vertex AI.
+
+    Duplicate texts are embedded once, cached vectors are read from disk and
+    the rest are sent in as few API requests as the batch limits allow.
+
+    Args:
+        texts (list): The texts to embed
+        task_type (str): Vertex AI task type, e.g. "RETRIEVAL_DOCUMENT" or "RETRIEVAL_QUERY"
+        use_cache (bool): Read and write the on-disk embedding cache
+
+    Returns:
+        numpy.ndarray: float32 array of shape (len(texts), dim)
+    """
+    texts = list(texts)
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+
+    cache = get_cache() if use_cache else None
+    keys = [EmbeddingCache.make_key(text, task_type) for text in texts]
+    vectors = cache.get_many(set(keys)) if cache else {}
+
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in vectors:
+            missing.setdefault(key, text)
+
+    if missing:
+        model = get_model()
+        limiter = get_limiter("vertex_embedding", rate=RATE_LIMIT, max_concurrency=MAX_CONCURRENCY)
+        missing_keys = list(missing)
+        missing_texts = [missing[key] for key in missing_keys]
+        fetched = []
+        for batch in iter_batches(missing_texts):
+            inputs = [TextEmbeddingInput(text, task_type) for text in batch]
+            fetched.extend(e.values for e in limiter.call(model.get_embeddings, inputs))
+        fetched = np.asarray(fetched, dtype=np.float32)
+        if cache:
+            cache.put_many(missing_keys, fetched)
+        vectors.update(zip(missing_keys, fetched))
+
+    return np.stack([vectors[key] for key in keys]).astype(np.float32, copy=False)
 
 @lru_cache(maxsize=1000)
-def get_embedding(text):
+def get_embedding(text, task_type="RETRIEVAL_DOCUMENT"):
     """Get embedding vector for a text using Vertex AI.
-    
+
     Args:
         text (str): The text to embed
-        
+        task_type (str): Vertex AI task type
+
     Returns:
         list: The embedding vector
     """
-    # Instantiate the embedding model
-    model = TextEmbeddingModel.from_pretrained("text-embedding-005")
-    
-    # Prepare input for the embedding
-    embedding_input = TextEmbeddingInput(text, "RETRIEVAL_DOCUMENT")
-    
-    # Fetch embedding (this returns a list; we take [0] since we have 1 input)
-    embedding_obj = model.get_embeddings([embedding_input])[0]
-    
-    # Extract the actual values from the TextEmbedding object
-    embedding_vector = embedding_obj.values
-    
-    return embedding_vector
+    return get_embeddings([text], task_type=task_type)[0].tolist()
 
 if __name__ == "__main__":
     # Test the embedding function
     sample_text = "This is a test sentence to embed."
     embedding = get_embedding(sample_text)
     print(f"Embedding dimension: {len(embedding)}")
-    print(f"First few values: {embedding[:5]}") 
\ No newline at end of file
+    print(f"First few values: {embedding[:5]}")
+
+    # Test the batch API; the second call is served from the disk cache
+    corpus = [f"Sentence number {i} about pocket flow." for i in range(600)]
+    vectors = get_embeddings(corpus)
+    print(f"Batch embeddings shape: {vectors.shape}")
+    print(f"Cached batch equal: {np.allclose(vectors, get_embeddings(corpus))}")
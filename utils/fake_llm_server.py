@@ -0,0 +1,206 @@
+import json
+import random
+import socket
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+def parse_latency(spec):
+    """Turn a latency spec into a function returning seconds.
+
+    Specs (milliseconds): "fixed:50", "uniform:20:200", "lognormal:MEDIAN:SIGMA"
+    (e.g. "lognormal:120:0.6" for a long-tailed distribution), or "0".
+    """
+    if callable(spec):
+        return spec
+    kind, _, rest = str(spec).partition(":")
+    args = [float(a) for a in rest.split(":")] if rest else []
+    if kind in ("0", "none"):
+        return lambda: 0.0
+    if kind == "fixed":
+        return lambda: args[0] / 1000
+    if kind == "uniform":
+        return lambda: random.uniform(args[0], args[1]) / 1000
+    if kind == "lognormal":
+        import math
+        mu = math.log(args[0] / 1000)
+        return lambda: random.lognormvariate(mu, args[1])
+    raise ValueError(f"Unknown latency spec {spec!r}")
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def get_request(self):
+        # Headers and body go out as separate small writes; without TCP_NODELAY,
+        # Nagle plus the client's delayed ACK adds ~40 ms to every keep-alive request
+        conn, addr = super().get_request()
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return conn, addr
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up mid-reply (e.g. a cancelled hedged request) are expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+def _is_validation(prompt):
+    return "Is the answer correct" in prompt
+
+def _count_tokens(text):
+    return max(1, len(text.split()))
+
+class FakeLLMServer:
+    """A local OpenAI-compatible chat completions server for tests and benchmarks.
+
+    Answers are an echo of the prompt. Validation prompts from flow.py are
+    judged correct with probability `correct_ratio` and answered as JSON in
+    JSON mode or as the YAML block the reasoner prompt asks for. Streaming
+    (with an optional usage chunk) is supported, and a fraction of requests
+    can fail with `error_status` to exercise retries and fallbacks.
+
+    Use as a context manager, or call start() and stop():
+        with FakeLLMServer(latency="lognormal:100:0.5") as server:
+            os.environ["DEEPSEEK_BASE_URL"] = server.base_url
+    """
+
+    def __init__(self, latency="fixed:50", correct_ratio=1.0, confidence=0.9, stream_chunks=8,
+                 token_delay=0.005, error_rate=0.0, error_status=429, host="127.0.0.1", port=0, seed=None):
+        self.latency = parse_latency(latency)
+        self.correct_ratio = correct_ratio
+        self.confidence = confidence
+        self.stream_chunks = stream_chunks
+        self.token_delay = token_delay
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.host = host
+        self.port = port
+        self.stats = {"requests": 0, "streams": 0, "validations": 0, "errors": 0}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/v1"
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _random(self):
+        with self._lock:
+            return self._rng.random()
+
+    def _reply(self, body):
+        prompt = body["messages"][-1]["content"]
+        if not _is_validation(prompt):
+            return "echo: " + prompt[:200]
+        self._count("validations")
+        correct = "true" if self._random() < self.correct_ratio else "false"
+        if (body.get("response_format") or {}).get("type") == "json_object":
+            return json.dumps({"is_correct": correct == "true", "confidence": self.confidence, "reason": "fake"})
+        return f'```yaml\nis_correct: {correct}\nreason: "fake"\n```'
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like real API endpoints
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status, payload, headers=()):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in headers:
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _chunk(self, data):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                server._count("requests")
+                time.sleep(server.latency())
+                if server.error_rate and server._random() < server.error_rate:
+                    server._count("errors")
+                    self._send_json(server.error_status, {"error": {"message": "fake overload", "type": "fake"}},
+                                    headers=[("Retry-After", "0")])
+                    return
+
+                content = server._reply(body)
+                prompt_tokens = _count_tokens(body["messages"][-1]["content"])
+                usage = {"prompt_tokens": prompt_tokens, "completion_tokens": _count_tokens(content),
+                         "total_tokens": prompt_tokens + _count_tokens(content)}
+                base = {"id": "chatcmpl-" + uuid.uuid4().hex[:12], "created": int(time.time()), "model": body["model"]}
+
+                if not body.get("stream"):
+                    self._send_json(200, {**base, "object": "chat.completion", "usage": usage, "choices": [
+                        {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}]})
+                    return
+
+                server._count("streams")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                size = max(1, -(-len(content) // server.stream_chunks))
+                for i in range(0, len(content), size):
+                    event = {**base, "object": "chat.completion.chunk", "choices": [
+                        {"index": 0, "delta": {"content": content[i:i + size]}, "finish_reason": None}]}
+                    self._chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                    if server.token_delay:
+                        time.sleep(server.token_delay)
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    event = {**base, "object": "chat.completion.chunk", "choices": [], "usage": usage}
+                    self._chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                self._chunk(b"data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+        return Handler
+
+    def start(self):
+        self._server = _Server((self.host, self.port), self._handler())
+        self.port = self._server.server_port
+        threading.Thread(target=self._server.serve_forever, name="fake-llm-server", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a fake OpenAI-compatible LLM server")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=str, default="lognormal:100:0.5",
+                        help='Latency spec in ms: "fixed:50", "uniform:20:200" or "lognormal:MEDIAN:SIGMA"')
+    parser.add_argument("--correct-ratio", type=float, default=0.8)
+    parser.add_argument("--confidence", type=float, default=0.9)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeLLMServer(latency=args.latency, correct_ratio=args.correct_ratio, confidence=args.confidence,
+                           error_rate=args.error_rate, port=args.port).start()
+    print(f"Fake LLM server on {server.base_url}; run with DEEPSEEK_BASE_URL={server.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
@@ -1,71 +1,57 @@
-def html_generator(title, image_url, sections):
-    """
-    Generates an HTML string with a handwriting style using Tailwind CSS.
+import html
+import re
 
-    :param title: Main title for the page ("Title 1").
-    :param image_url: URL of the image to be placed below the main title.
-    :param sections: A list of dictionaries, each containing:
-        {
-            "title": str (Title for the section e.g. "Title 2"),
-            "bullets": [
-                ("bold_text", "regular_text"),
-                ("bold_text_2", "regular_text_2"),
-                ...
-            ]
-        }
-    :return: A string of HTML content.
-    """
-    # Start building the HTML
-    html_template = f"""<!DOCTYPE html>
-<html lang=\"en\">
+# Everything before the page title never changes, so it is built once at import
+_HEAD = """<!DOCTYPE html>
+<html lang="en">
 <head>
-  <meta charset=\"UTF-8\" />
-  <meta name=\"viewport\" content=\"width=device-width, initial-scale=1.0\" />
+  <meta charset="UTF-8" />
+  <meta name="viewport" content="width=device-width, initial-scale=1.0" />
   <title>Youtube Made Simple</title>
   <!-- Using Tailwind CSS CDN -->
   <link
-    rel=\"stylesheet\"
-    href=\"https://unpkg.com/tailwindcss@2.2.19/dist/tailwind.min.css\"
+    rel="stylesheet"
+    href="https://unpkg.com/tailwindcss@2.2.19/dist/tailwind.min.css"
   />
   <!-- Google Font for a handwriting style -->
-  <link rel=\"preconnect\" href=\"https://fonts.gstatic.com\" />
+  <link rel="preconnect" href="https://fonts.gstatic.com" />
   <link
-    href=\"https://fonts.googleapis.com/css2?family=Patrick+Hand&display=swap\"
-    rel=\"stylesheet\"
+    href="https://fonts.googleapis.com/css2?family=Patrick+Hand&display=swap"
+    rel="stylesheet"
   />
   <style>
-    body {{
+    body {
       background-color: #f7fafc;
       font-family: 'Patrick Hand', sans-serif;
-    }}
-    h1, h2 {{
+    }
+    h1, h2 {
       font-weight: 700;
       margin-bottom: 0.5rem;
-    }}
-    ul {{
+    }
+    ul {
       list-style-type: disc;
       margin-left: 1.5rem;
       margin-bottom: 1.5rem;
-    }}
-    li {{
+    }
+    li {
       margin-bottom: 1rem;
-    }}
-    ol {{
+    }
+    ol {
       list-style-type: decimal;
       margin-left: 2rem;
       margin-top: 0.5rem;
-    }}
-    ol li {{
+    }
+    ol li {
       margin-bottom: 0.2rem;
-    }}
-    .bullet-content ol {{
+    }
+    .bullet-content ol {
       margin-top: 0.3rem;
       margin-bottom: 0.3rem;
-    }}
+    }
   </style>
 </head>
-<body class=\"min-h-screen flex items-center justify-center p-4\">
-  <div class=\"max-w-2xl w-full bg-white rounded-2xl shadow-lg p-6\">
+<body class="min-h-screen flex items-center justify-center p-4">
+  <div class="max-w-2xl w-full bg-white rounded-2xl shadow-lg p-6">
     <!-- Attribution header -->
     <div class="mb-6 text-right text-gray-500 text-sm">
       Generated by 
@@ -76,41 +62,104 @@ def html_generator(title, image_url, sections):
     </div>
     
     <!-- Title 1 -->
-    <h1 class=\"text-4xl text-gray-800 mb-4\">{title}</h1>
+    """
+
+_TITLE = """<h1 class="text-4xl text-gray-800 mb-4">{title}</h1>
     <!-- Image below Title 1 -->
     <img
-      src=\"{image_url}\"
-      alt=\"Placeholder image\"
-      class=\"rounded-xl mb-6\"
+      src="{image_url}"
+      alt="Placeholder image"
+      class="rounded-xl mb-6"
     />"""
+_SECTION_OPEN = """
+    <h2 class="text-2xl text-gray-800 mb-4">"""
+_SECTION_LIST = """</h2>
+    <ul class="text-gray-600">"""
+_BULLET_OPEN = """
+      <li>
+        <strong>"""
+_BULLET_MIDDLE = """</strong><br />
+        <div class="bullet-content">"""
+_BULLET_CLOSE = """</div>
+      </li>"""
+_SECTION_END = "\n    </ul>"
+_TAIL = """
+  </div>
+</body>
+</html>"""
 
-    # For each section, add a sub-title (Title 2, etc.) and bullet points.
-    for section in sections:
-        section_title = section.get("title", "")
-        bullets = section.get("bullets", [])
+_SPECIAL = re.compile(r"[&<>\"']")
 
-        # Add the section's title (Title 2, Title 3, etc.)
-        html_template += f"""
-    <h2 class=\"text-2xl text-gray-800 mb-4\">{section_title}</h2>
-    <ul class=\"text-gray-600\">"""
+def escape(value):
+    """HTML-escape a value; strings without special characters are returned unchanged."""
+    value = str(value)
+    return html.escape(value) if _SPECIAL.search(value) else value
 
-        # Create list items for each bullet pair
-        for bold_text, normal_text in bullets:
-            html_template += f"""
-      <li>
-        <strong>{bold_text}</strong><br />
-        <div class="bullet-content">{normal_text}</div>
-      </li>"""
+def _render_section(section, parts):
+    # Append the section's title and bullets to parts as flat string fragments
+    add = parts.extend
+    add((_SECTION_OPEN, escape(section.get("title", "")), _SECTION_LIST))
+    # Create list items for each bullet pair
+    for bold_text, normal_text in section.get("bullets", []):
+        add((_BULLET_OPEN, escape(bold_text), _BULLET_MIDDLE, normal_text, _BULLET_CLOSE))
+    parts.append(_SECTION_END)
 
-        html_template += "\n    </ul>"
+def iter_html(title, image_url, sections):
+    """
+    Yields the page produced by html_generator() one section at a time.
 
+    Titles, the image URL and bold text are HTML-escaped; the regular text of
+    a bullet is inserted as-is so it can contain markup such as <ol> lists.
+    """
+    yield _HEAD
+    yield _TITLE.format(title=escape(title), image_url=escape(image_url))
+    # For each section, add a sub-title (Title 2, etc.) and bullet points.
+    for section in sections:
+        parts = []
+        _render_section(section, parts)
+        yield "".join(parts)
     # Close the main container and body
-    html_template += """
-  </div>
-</body>
-</html>"""
+    yield _TAIL
+
+def html_generator(title, image_url, sections):
+    """
+    Generates an HTML string with a handwriting style using Tailwind CSS.
+
+    :param title: Main title for the page ("Title 1").
+    :param image_url: URL of the image to be placed below the main title.
+    :param sections: A list of dictionaries, each containing:
+        {
+            "title": str (Title for the section e.g. "Title 2"),
+            "bullets": [
+                ("bold_text", "regular_text"),
+                ("bold_text_2", "regular_text_2"),
+                ...
+            ]
+        }
+    :return: A string of HTML content.
+    """
+    # Collect every fragment in one flat list and join once: linear time, one copy
+    parts = [_HEAD, _TITLE.format(title=escape(title), image_url=escape(image_url))]
+    for section in sections:
+        _render_section(section, parts)
+    parts.append(_TAIL)
+    return "".join(parts)
 
-    return html_template
+def write_html(target, title, image_url, sections):
+    """
+    Streams the page to a writable file object or to a file path, without
+    building the whole document in memory.
+
+    :param target: An object with a write() method, or a path to write to.
+    :return: None
+    """
+    if hasattr(target, "write"):
+        # Only write() is required, so don't rely on writelines()
+        for part in iter_html(title, image_url, sections):
+            target.write(part)
+        return
+    with open(target, "w", encoding="utf-8") as file:
+        file.writelines(iter_html(title, image_url, sections))
 
 if __name__ == "__main__":
     sections_data = [
@@ -128,6 +177,9 @@ if __name__ == "__main__":
             ]
         }
     ]
-    html_content = html_generator("Title 1", "https://picsum.photos/600/300?grayscale", sections_data) 
+    html_content = html_generator("Title 1", "https://picsum.photos/600/300?grayscale", sections_data)
     with open("output.html", "w") as file:
         file.write(html_content)
+
+    # Same page, streamed straight to the file
+    write_html("output.html", "Title 1", "https://picsum.photos/600/300?grayscale", sections_data)
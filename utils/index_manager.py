@@ -0,0 +1,140 @@
+import os
+import threading
+
+import faiss
+import numpy as np
+
+from utils.vector_search import make_index, load_index, save_index, search_index_batch
+
+class IndexManager:
+    """A FAISS index with stable external ids that can be updated in place.
+
+    Vectors are addressed by caller-chosen int64 ids rather than insertion
+    order, so documents can be added, removed or replaced without rebuilding.
+    Flat indexes are wrapped in an IndexIDMap2; IVF indexes store the ids in
+    their inverted lists directly. HNSW graphs cannot delete vectors, so they
+    are not supported here.
+
+    Mutations take a lock; searches do not, since FAISS searches are
+    thread-safe against each other.
+    """
+
+    def __init__(self, index, path=None, read_only=False):
+        self.index = index
+        self.path = path
+        self.read_only = read_only
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, dim, index_type="flat", train_vectors=None, path=None, **index_kwargs):
+        """Create an empty manager.
+
+        Args:
+            dim (int): Vector dimension
+            index_type (str): "flat", "ivf" or "ivfpq"
+            train_vectors (numpy.ndarray, optional): Sample used to train IVF types
+            path (str, optional): Default path for save()
+            **index_kwargs: Extra make_index options (nlist, pq_m, ...)
+        """
+        if index_type == "flat":
+            index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+        elif index_type in ("ivf", "ivfpq"):
+            if train_vectors is None:
+                raise ValueError(f"{index_type} index needs train_vectors")
+            train_vectors = np.array(train_vectors, dtype=np.float32)
+            faiss.normalize_L2(train_vectors)
+            index = make_index(train_vectors, index_type=index_type, **index_kwargs)
+        else:
+            raise ValueError(f"IndexManager does not support index_type {index_type!r}")
+        return cls(index, path=path)
+
+    @classmethod
+    def load(cls, path, mmap=False):
+        """Load a saved index; with mmap=True it is read-only and shared via the page cache."""
+        return cls(load_index(path, mmap=mmap), path=path, read_only=mmap)
+
+    @property
+    def ntotal(self):
+        return self.index.ntotal
+
+    def _check_writable(self):
+        if self.read_only:
+            raise RuntimeError("Index was loaded read-only (mmap); load it without mmap to modify it")
+
+    @staticmethod
+    def _prepare(ids, vectors):
+        ids = np.ascontiguousarray(ids, dtype=np.int64).reshape(-1)
+        vectors = np.array(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+        if len(ids) != len(vectors):
+            raise ValueError(f"Got {len(ids)} ids for {len(vectors)} vectors")
+        faiss.normalize_L2(vectors)
+        return ids, vectors
+
+    def add(self, ids, vectors):
+        """Add vectors under new ids. Use upsert() if some ids may already exist."""
+        self._check_writable()
+        ids, vectors = self._prepare(ids, vectors)
+        with self._lock:
+            self.index.add_with_ids(vectors, ids)
+
+    def remove(self, ids):
+        """Remove vectors by id and return how many were removed."""
+        self._check_writable()
+        ids = np.ascontiguousarray(ids, dtype=np.int64).reshape(-1)
+        with self._lock:
+            return self.index.remove_ids(faiss.IDSelectorBatch(ids))
+
+    def upsert(self, ids, vectors):
+        """Replace the vectors stored under ids, adding any ids not present yet."""
+        self._check_writable()
+        ids, vectors = self._prepare(ids, vectors)
+        with self._lock:
+            self.index.remove_ids(faiss.IDSelectorBatch(ids))
+            self.index.add_with_ids(vectors, ids)
+
+    def search(self, query_vectors, top_k=5, **kwargs):
+        """Batch search; returns (scores, ids) with the external ids. See search_index_batch."""
+        return search_index_batch(query_vectors, self.index, top_k, **kwargs)
+
+    def save(self, path=None):
+        """Atomically write the index to path (or the path it was loaded from)."""
+        path = path or self.path
+        if path is None:
+            raise ValueError("No path given to save the index to")
+        with self._lock:
+            save_index(self.index, path)
+        self.path = path
+
+if __name__ == "__main__":
+    dim = 64
+    rng = np.random.default_rng(0)
+    docs = rng.random((1000, dim), dtype=np.float32)
+    doc_ids = np.arange(1000, dtype=np.int64) * 7 + 100000
+
+    manager = IndexManager.create(dim)
+    manager.add(doc_ids, docs)
+    print(f"Indexed {manager.ntotal} vectors")
+
+    manager.upsert(doc_ids[:10], rng.random((10, dim), dtype=np.float32))
+    print(f"Removed {manager.remove(doc_ids[10:20])} vectors, {manager.ntotal} left")
+
+    os.makedirs("test_faiss", exist_ok=True)
+    path = os.path.join("test_faiss", "managed.faiss")
+    manager.save(path)
+
+    shared = IndexManager.load(path, mmap=True)
+    scores, ids = shared.search(docs[30:32], top_k=3)
+    print(f"Search through the mmap-loaded index: {ids.tolist()}")
+
+    # Save / mmap-load round trip for every index type create() accepts
+    for index_type in ("flat", "ivf", "ivfpq"):
+        manager = IndexManager.create(dim, index_type, train_vectors=docs, nlist=16)
+        manager.add(doc_ids, docs)
+        expected = manager.search(docs[:5], top_k=3)[1]
+        manager.save(os.path.join("test_faiss", f"managed_{index_type}.faiss"))
+        shared = IndexManager.load(manager.path, mmap=True)
+        assert shared.ntotal == manager.ntotal and shared.read_only
+        assert (shared.search(docs[:5], top_k=3)[1] == expected).all(), index_type
+        print(f"{index_type}: mmap round trip returns the same ids")
@@ -0,0 +1,57 @@
+import math
+
+def percentile(sorted_values, pct):
+    """Return the pct-th percentile of an already sorted list (nearest-rank).
+
+    Args:
+        sorted_values (list): Values sorted in ascending order
+        pct (float): Percentile between 0 and 100
+
+    Returns:
+        float: The percentile value, or None for an empty list
+    """
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+def summarize_latencies(latencies, elapsed=None):
+    """Summarize a list of latencies in seconds.
+
+    Args:
+        latencies (list): Per-item latencies in seconds
+        elapsed (float, optional): Wall-clock time for the whole run, used for throughput
+
+    Returns:
+        dict: count, mean, p50, p95, p99, max and (if elapsed is given) throughput per second
+    """
+    values = sorted(latencies)
+    summary = {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else None,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": values[-1] if values else None,
+    }
+    if elapsed is not None:
+        summary["elapsed"] = elapsed
+        summary["throughput"] = len(values) / elapsed if elapsed > 0 else None
+    return summary
+
+def format_summary(summary):
+    """Format a summarize_latencies() result as a one-line report."""
+    def ms(value):
+        return "n/a" if value is None else f"{value * 1000:.1f}ms"
+
+    line = (f"n={summary['count']} mean={ms(summary['mean'])} p50={ms(summary['p50'])} "
+            f"p95={ms(summary['p95'])} p99={ms(summary['p99'])} max={ms(summary['max'])}")
+    if summary.get("throughput") is not None:
+        line += f" throughput={summary['throughput']:.2f}/s"
+    return line
+
+if __name__ == "__main__":
+    import random
+    samples = [random.lognormvariate(-1, 0.5) for _ in range(1000)]
+    summary = summarize_latencies(samples, elapsed=10.0)
+    print(format_summary(summary))
@@ -0,0 +1,180 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_PATH = os.environ.get("LLM_CACHE_PATH", os.path.join(".cache", "llm_cache.sqlite"))
+DEFAULT_TTL = float(os.environ.get("LLM_CACHE_TTL", 7 * 24 * 3600))
+DEFAULT_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 100000))
+DEFAULT_MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+# Access times are only rewritten when older than this, so hot keys don't
+# turn every read into a write
+TOUCH_INTERVAL = 60.0
+# Size bounds are enforced every N writes rather than on every write
+EVICT_EVERY = 100
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at);
+"""
+
+
+class LLMCache:
+    """Disk-backed LLM response cache stored in SQLite.
+
+    Entries are keyed on a hash of (model_name, prompt, parameters), expire
+    after `ttl` seconds and are evicted least-recently-used first once the
+    cache exceeds `max_entries` rows or `max_bytes` of response text.
+    SQLite in WAL mode makes the cache safe to share between threads and
+    processes; each thread (and each forked process) opens its own connection.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES,
+                 max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "writes": 0, "evictions": 0}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(model_name, prompt, params=None):
+        """Return the content hash identifying one request."""
+        payload = json.dumps([model_name, prompt, params or {}], sort_keys=True, ensure_ascii=False,
+                             default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, stat, n=1):
+        with self._lock:
+            self._stats[stat] += n
+
+    def get(self, key):
+        """Return the cached response for key, or None on a miss or expired entry."""
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT value, created_at, accessed_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self._count("misses")
+            return None
+        value, created_at, accessed_at = row
+        now = time.time()
+        if self.ttl is not None and now - created_at > self.ttl:
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._count("expired")
+            self._count("misses")
+            return None
+        if now - accessed_at > TOUCH_INTERVAL:
+            conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        self._count("hits")
+        return value
+
+    def set(self, key, value):
+        """Store a response, evicting old entries when the cache is over its bounds."""
+        now = time.time()
+        self._conn().execute(
+            "INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, value, len(value.encode("utf-8")), now, now),
+        )
+        self._count("writes")
+        with self._lock:
+            self._writes += 1
+            due = self._writes % EVICT_EVERY == 0
+        if due:
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries, then least-recently-used entries beyond the size bounds."""
+        conn = self._conn()
+        evicted = 0
+        if self.ttl is not None:
+            evicted += conn.execute(
+                "DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,)
+            ).rowcount
+        count, total_bytes = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if self.max_entries is not None and count > self.max_entries:
+            evicted += conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?)",
+                (count - self.max_entries,),
+            ).rowcount
+        if self.max_bytes is not None and total_bytes > self.max_bytes:
+            # Walk from the oldest entry until enough bytes are freed
+            excess, doomed = total_bytes - self.max_bytes, []
+            for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed_at ASC"):
+                if excess <= 0:
+                    break
+                doomed.append((key,))
+                excess -= size
+            conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+            evicted += len(doomed)
+        self._count("evictions", evicted)
+        return evicted
+
+    def clear(self):
+        """Remove every cached response."""
+        self._conn().execute("DELETE FROM responses")
+
+    def stats(self):
+        """Return hit/miss counters for this process plus the current entry count."""
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["entries"] = self._conn().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return stats
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_llm_cache():
+    """Return the process-wide cache, or None when disabled with LLM_CACHE=off."""
+    global _default_cache
+    if os.environ.get("LLM_CACHE", "on").lower() in ("off", "0", "false"):
+        return None
+    if _default_cache is None:
+        with _default_lock:
+            if _default_cache is None:
+                _default_cache = LLMCache()
+    return _default_cache
+
+
+if __name__ == "__main__":
+    cache = LLMCache(path=os.path.join(".cache", "llm_cache_demo.sqlite"), max_entries=150)
+    cache.clear()
+    for i in range(200):
+        cache.set(cache.make_key("deepseek-chat", f"prompt {i}"), f"response {i}")
+    print(cache.get(cache.make_key("deepseek-chat", "prompt 199")))
+    print(cache.get(cache.make_key("deepseek-chat", "prompt 0")))
+    print(cache.stats())
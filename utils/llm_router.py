@@ -0,0 +1,432 @@
+import asyncio
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+from utils.latency_stats import percentile
+from utils.rate_limiter import bind_priority, get_limiter
+
+# Calls remembered per backend for latency percentiles and error rates
+WINDOW = 100
+# Latency samples older than this (seconds) no longer count towards percentiles
+SAMPLE_MAX_AGE = 60.0
+# Weight of the newest call in the smoothed latency that ranks backends, so a
+# slow start (cold connections) or a past slow spell is soon outweighed. The
+# average is taken over log latency, which tracks the median and is not
+# dragged up by a long tail the way a plain mean is.
+LATENCY_ALPHA = 0.2
+# Successful calls needed before a backend's p95 is trusted as a hedge deadline
+MIN_SAMPLES = 20
+# Consecutive failures (or error rate over the window) that take a backend out of rotation
+MAX_CONSECUTIVE_FAILURES = 3
+MAX_ERROR_RATE = 0.5
+COOLDOWN = 10.0
+# Share of calls sent to another backend of the best tier, so stale statistics
+# (e.g. from a cold start) get refreshed
+EXPLORE_RATE = 0.05
+
+class Backend:
+    """One model on one OpenAI-compatible endpoint, with rolling latency and error statistics.
+
+    Backends in lower tiers are preferred; higher tiers are fallbacks used
+    when every backend in the tiers below is unhealthy or has failed.
+    """
+
+    def __init__(self, name, base_url, model, api_key=None, tier=0, timeout=30.0, rate=50, max_concurrency=64):
+        self.name = name
+        self.base_url = base_url
+        self.model = model
+        self.api_key = api_key or "none"
+        self.tier = tier
+        self.timeout = timeout
+        self.rate = rate
+        self.max_concurrency = max_concurrency
+        self._latencies = deque(maxlen=WINDOW)
+        self._outcomes = deque(maxlen=WINDOW)
+        self._consecutive_failures = 0
+        self._open_until = 0.0
+        self._smoothed = None
+        self._started = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._client = None
+        self._client_pid = None
+        self._async_clients = {}
+
+    def client(self):
+        if self._client is None or self._client_pid != os.getpid():
+            with self._lock:
+                if self._client is None or self._client_pid != os.getpid():
+                    self._client = OpenAI(api_key=self.api_key, base_url=self.base_url, timeout=self.timeout,
+                                          max_retries=0, http_client=httpx.Client(timeout=self.timeout))
+                    self._client_pid = os.getpid()
+        return self._client
+
+    def async_client(self):
+        # Async connection pools cannot be shared across event loops
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, timeout=self.timeout,
+                                 max_retries=0, http_client=httpx.AsyncClient(timeout=self.timeout))
+            with self._lock:
+                for stale in [l for l in self._async_clients if l.is_closed()]:
+                    del self._async_clients[stale]
+                self._async_clients[loop] = client
+        return client
+
+    def limiter(self):
+        # No limiter retries: a throttled call fails over to the next backend instead
+        return get_limiter("llm:" + self.name, rate=self.rate, max_concurrency=self.max_concurrency, max_retries=0)
+
+    def _begin(self):
+        with self._lock:
+            self._started += 1
+            self._in_flight += 1
+
+    def _end(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _recent(self):
+        # Called with the lock held: drop samples past SAMPLE_MAX_AGE, return the latencies
+        cutoff = time.monotonic() - SAMPLE_MAX_AGE
+        while self._latencies and self._latencies[0][0] < cutoff:
+            self._latencies.popleft()
+        return sorted(latency for _, latency in self._latencies)
+
+    def record(self, latency, ok):
+        """Record one call; latency may be None when it is not comparable (e.g. streams)."""
+        with self._lock:
+            self._outcomes.append(ok)
+            if ok:
+                self._consecutive_failures = 0
+                if latency is not None:
+                    self._latencies.append((time.monotonic(), latency))
+                    log_latency = math.log(max(latency, 1e-6))
+                    self._smoothed = log_latency if self._smoothed is None else (
+                        LATENCY_ALPHA * log_latency + (1 - LATENCY_ALPHA) * self._smoothed)
+                return
+            self._consecutive_failures += 1
+            failures = self._outcomes.count(False)
+            if (self._consecutive_failures >= MAX_CONSECUTIVE_FAILURES
+                    or (len(self._outcomes) >= 10 and failures / len(self._outcomes) > MAX_ERROR_RATE)):
+                # Circuit open: skip this backend until the cooldown ends, then probe it again
+                self._open_until = time.monotonic() + COOLDOWN
+                self._consecutive_failures = 0
+                self._outcomes.clear()
+
+    def healthy(self):
+        return time.monotonic() >= self._open_until
+
+    def latency(self, pct):
+        with self._lock:
+            values = self._recent()
+        return percentile(values, pct)
+
+    def smoothed_latency(self):
+        """Exponentially weighted (geometric) average latency in seconds, or None before any sample."""
+        smoothed = self._smoothed
+        return None if smoothed is None else math.exp(smoothed)
+
+    def hedge_delay(self):
+        """Seconds after which a duplicate request is worth sending: the recent p95, once known."""
+        with self._lock:
+            values = self._recent()
+        return percentile(values, 95) if len(values) >= MIN_SAMPLES else None
+
+    def _rank(self):
+        with self._lock:
+            started, in_flight, smoothed = self._started, self._in_flight, self._smoothed
+        if not started:
+            # Never tried: rank first so each backend gets explored once
+            return (self.tier, 0, 0.0)
+        if smoothed is None:
+            # No comparable latency yet (first calls in flight, stream-only, or every call
+            # failed): after measured peers, least busy first, then in configuration order
+            return (self.tier, 2, in_flight)
+        return (self.tier, 1, smoothed)
+
+    def _request(self, messages, params):
+        return {"model": self.model, "messages": messages, **params}
+
+    # Latency is measured from slot admission: time queued in our own limiter
+    # says nothing about the backend. Without limiter retries a slot is one call.
+
+    def complete(self, messages, params):
+        self._begin()
+        try:
+            with self.limiter().slot():
+                start = time.monotonic()
+                response = self.client().chat.completions.create(**self._request(messages, params))
+        except Exception:
+            self.record(None, False)
+            raise
+        finally:
+            self._end()
+        self.record(time.monotonic() - start, True)
+        return response
+
+    async def complete_async(self, messages, params):
+        self._begin()
+        try:
+            async with await self.limiter().slot_async():
+                start = time.monotonic()
+                response = await self.async_client().chat.completions.create(**self._request(messages, params))
+        except asyncio.CancelledError:
+            raise  # a hedge lost the race; not the backend's fault
+        except Exception:
+            self.record(None, False)
+            raise
+        finally:
+            self._end()
+        self.record(time.monotonic() - start, True)
+        return response
+
+    def open_stream(self, messages, params):
+        self._begin()
+        try:
+            with self.limiter().slot():
+                stream = self.client().chat.completions.create(stream=True, **self._request(messages, params))
+        except Exception:
+            self.record(None, False)
+            raise
+        finally:
+            self._end()
+        self.record(None, True)
+        return stream
+
+    def snapshot(self):
+        with self._lock:
+            outcomes = list(self._outcomes)
+            samples = len(self._recent())
+        return {"model": self.model, "base_url": self.base_url, "tier": self.tier, "healthy": self.healthy(),
+                "samples": samples, "smoothed": self.smoothed_latency(), "p50": self.latency(50), "p95": self.latency(95),
+                "error_rate": outcomes.count(False) / len(outcomes) if outcomes else 0.0}
+
+class LLMRouter:
+    """Routes chat completions for a model name to the fastest healthy backend.
+
+    `routes` maps the model names used by callers (e.g. "deepseek-chat") to
+    lists of Backends. Candidates are ordered by tier, then by smoothed
+    latency (untried backends first, backends without latency samples after
+    measured ones); unhealthy backends go last. A failed call moves on to the next
+    candidate. With hedging on, a duplicate request goes to the next candidate
+    (or the same backend if it is the only one) once the first has been
+    running longer than its p95, and the first reply wins.
+    """
+
+    def __init__(self, routes, hedge=True, max_workers=256):
+        self.routes = routes
+        self.hedge = hedge
+        self.max_workers = max_workers
+        self._executor = None
+        self._executor_pid = None
+        self._stats = {"calls": 0, "fallbacks": 0, "hedges": 0, "hedge_wins": 0}
+        self._lock = threading.Lock()
+
+    def handles(self, model):
+        return model in self.routes
+
+    def candidates(self, model):
+        backends = self.routes[model]
+        healthy = sorted((b for b in backends if b.healthy()), key=Backend._rank)
+        # If everything is unhealthy, try the backend whose cooldown ends first
+        unhealthy = sorted((b for b in backends if not b.healthy()), key=lambda b: b._open_until)
+        peers = [i for i, b in enumerate(healthy) if i > 0 and b.tier == healthy[0].tier]
+        if peers and random.random() < EXPLORE_RATE:
+            healthy.insert(0, healthy.pop(random.choice(peers)))
+        return healthy + unhealthy
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _get_executor(self):
+        # Worker threads do not survive a fork, so each process starts its own pool
+        if self._executor is None or self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._executor_pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix="llm-router")
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def _hedge_delay(self, backend):
+        return backend.hedge_delay() if self.hedge else None
+
+    def complete(self, model, messages, **params):
+        """Return (response, backend) for a chat completion on the best backend for `model`."""
+        candidates = self.candidates(model)
+        self._count("calls")
+        delay = self._hedge_delay(candidates[0])
+        if delay is None:
+            # No hedge: try the candidates in turn on the calling thread
+            for i, backend in enumerate(candidates):
+                try:
+                    return backend.complete(messages, params), backend
+                except Exception:
+                    if i == len(candidates) - 1:
+                        raise
+                    self._count("fallbacks")
+
+        pending = {}
+        hedges = set()
+        launched = 0
+
+        def launch(hedge=False):
+            nonlocal launched
+            backend = candidates[launched % len(candidates)]
+            launched += 1
+            future = self._get_executor().submit(bind_priority(backend.complete), messages, params)
+            pending[future] = backend
+            if hedge:
+                hedges.add(future)
+                self._count("hedges")
+
+        # The loser of a hedge cannot be interrupted; it finishes in the background
+        # and still updates its backend's statistics
+        launch()
+        error = None
+        while pending:
+            done, _ = wait(pending, timeout=None if hedges else delay, return_when=FIRST_COMPLETED)
+            if not done:
+                launch(hedge=True)
+                continue
+            for future in done:
+                backend = pending.pop(future)
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                if future in hedges:
+                    self._count("hedge_wins")
+                return future.result(), backend
+            if not pending and launched < len(candidates):
+                self._count("fallbacks")
+                launch()
+        raise error
+
+    async def complete_async(self, model, messages, **params):
+        """Async variant of complete(); the losing hedge is cancelled."""
+        candidates = self.candidates(model)
+        self._count("calls")
+        delay = self._hedge_delay(candidates[0])
+        pending = {}
+        hedges = set()
+        launched = 0
+
+        def launch(hedge=False):
+            nonlocal launched
+            backend = candidates[launched % len(candidates)]
+            launched += 1
+            task = asyncio.ensure_future(backend.complete_async(messages, params))
+            pending[task] = backend
+            if hedge:
+                hedges.add(task)
+                self._count("hedges")
+
+        launch()
+        error = None
+        try:
+            while pending:
+                waiting = delay is not None and not hedges
+                done, _ = await asyncio.wait(pending, timeout=delay if waiting else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    launch(hedge=True)
+                    continue
+                for task in done:
+                    backend = pending.pop(task)
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    if task in hedges:
+                        self._count("hedge_wins")
+                    return task.result(), backend
+                if not pending and launched < len(candidates):
+                    self._count("fallbacks")
+                    launch()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stream(self, model, messages, **params):
+        """Open a streaming completion on the best backend, falling back if opening fails.
+
+        Returns:
+            tuple: (stream, backend)
+        """
+        candidates = self.candidates(model)
+        self._count("calls")
+        for i, backend in enumerate(candidates):
+            try:
+                return backend.open_stream(messages, params), backend
+            except Exception:
+                if i == len(candidates) - 1:
+                    raise
+                self._count("fallbacks")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        backends = {b.name: b for route in self.routes.values() for b in route}
+        stats["backends"] = {name: backend.snapshot() for name, backend in backends.items()}
+        return stats
+
+def load_routes(spec):
+    """Build routes from a JSON file path or JSON string.
+
+    Format: {"<model name>": [{"name", "base_url", "model", "api_key_env"?,
+    "tier"?, "timeout"?, "rate"?, "max_concurrency"?}, ...]}. A backend name
+    listed under several model names is shared, statistics included.
+    """
+    if os.path.exists(spec):
+        with open(spec, "r", encoding="utf-8") as f:
+            config = json.load(f)
+    else:
+        config = json.loads(spec)
+    backends = {}
+    routes = {}
+    for model, entries in config.items():
+        routes[model] = []
+        for entry in entries:
+            entry = dict(entry)
+            api_key_env = entry.pop("api_key_env", None)
+            if api_key_env:
+                entry["api_key"] = os.environ.get(api_key_env)
+            if entry["name"] not in backends:
+                backends[entry["name"]] = Backend(**entry)
+            routes[model].append(backends[entry["name"]])
+    return routes
+
+_router = None
+_router_loaded = False
+_router_lock = threading.Lock()
+
+def get_router():
+    """Return the process-wide router configured by LLM_ROUTES (file or JSON), or None."""
+    global _router, _router_loaded
+    if not _router_loaded:
+        with _router_lock:
+            if not _router_loaded:
+                spec = os.environ.get("LLM_ROUTES")
+                if spec:
+                    hedge = os.environ.get("LLM_HEDGE", "on").lower() not in ("off", "0", "false")
+                    _router = LLMRouter(load_routes(spec), hedge=hedge)
+                _router_loaded = True
+    return _router
+
+def configure_router(router):
+    """Install a router (or None to call the default endpoint directly)."""
+    global _router, _router_loaded
+    with _router_lock:
+        _router, _router_loaded = router, True
@@ -0,0 +1,197 @@
+import queue
+import threading
+import time
+
+_DONE = object()
+
+class Stage:
+    """One step of a pipeline: `fn` is applied to every item by `workers` threads.
+
+    With batch_size > 1 a worker collects up to that many queued items and
+    passes them to fn as a list, so slow per-call stages (e.g. API requests)
+    can amortize their overhead. fn returns the item to hand downstream, or
+    None to drop it.
+    """
+
+    def __init__(self, name, fn, workers=1, batch_size=1, count=None):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.batch_size = batch_size
+        # Optional function giving the number of logical items in one queued item
+        self.count = count
+        self.items = 0
+        self.calls = 0
+        self.busy = 0.0
+        self.starved = 0.0
+        self.blocked = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, items, busy, starved, blocked):
+        with self._lock:
+            self.items += items
+            self.calls += 1
+            self.busy += busy
+            self.starved += starved
+            self.blocked += blocked
+
+    def stats(self, elapsed):
+        return {
+            "stage": self.name,
+            "workers": self.workers,
+            "items": self.items,
+            "calls": self.calls,
+            "busy_s": self.busy,
+            "starved_s": self.starved,
+            "blocked_s": self.blocked,
+            "items_per_s": self.items / elapsed if elapsed > 0 else 0.0,
+            # Fraction of the stage's worker time spent working; the bottleneck is near 1
+            "utilization": self.busy / (elapsed * self.workers) if elapsed > 0 else 0.0,
+        }
+
+class PipelineError(Exception):
+    """Raised when a stage fails; the original exception is chained."""
+
+def run_pipeline(source, stages, queue_size=8):
+    """Run `source` through `stages` concurrently, connected by bounded queues.
+
+    Every stage runs on its own worker threads. Queues hold at most
+    queue_size items, so a slow stage pushes back on the stages before it
+    instead of letting work pile up in memory. If any stage raises, the
+    pipeline stops and a PipelineError is raised.
+
+    Args:
+        source (iterable): Items fed to the first stage
+        stages (list): Stage objects, in order
+        queue_size (int): Capacity of each queue between stages
+
+    Returns:
+        list: Per-stage statistics dicts, starting with the source
+    """
+    source_stage = Stage("source", None)
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    abort = threading.Event()
+    errors = []
+
+    def put(q, item):
+        # Blocking put that gives up if another stage failed
+        while not abort.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(q):
+        while not abort.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def fail(stage, exc):
+        errors.append((stage.name, exc))
+        abort.set()
+
+    def feed():
+        try:
+            iterator = iter(source)
+            while not abort.is_set():
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                fetched = time.perf_counter()
+                if not put(queues[0], item):
+                    break
+                source_stage.record(1, fetched - start, 0.0, time.perf_counter() - fetched)
+        except BaseException as e:
+            fail(source_stage, e)
+        finally:
+            for _ in range(stages[0].workers):
+                put(queues[0], _DONE)
+
+    def work(index, stage, remaining):
+        inbox = queues[index]
+        outbox = queues[index + 1] if index + 1 < len(queues) else None
+        try:
+            done = False
+            while not done and not abort.is_set():
+                wait_start = time.perf_counter()
+                item = get(inbox)
+                if item is _DONE:
+                    break
+                batch = [item]
+                while len(batch) < stage.batch_size:
+                    try:
+                        extra = inbox.get_nowait()
+                    except queue.Empty:
+                        break
+                    if extra is _DONE:
+                        done = True
+                        break
+                    batch.append(extra)
+                work_start = time.perf_counter()
+                result = stage.fn(batch if stage.batch_size > 1 else batch[0])
+                work_end = time.perf_counter()
+                if outbox is not None and result is not None and not put(outbox, result):
+                    break
+                items = sum(map(stage.count, batch)) if stage.count else len(batch)
+                stage.record(items, work_end - work_start, work_start - wait_start,
+                             time.perf_counter() - work_end)
+        except BaseException as e:
+            fail(stage, e)
+        finally:
+            # The last worker of a stage tells every downstream worker to stop
+            with remaining["lock"]:
+                remaining["count"] -= 1
+                last = remaining["count"] == 0
+            if last and outbox is not None:
+                for _ in range(stages[index + 1].workers):
+                    put(outbox, _DONE)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=feed, name="pipeline-source", daemon=True)]
+    for index, stage in enumerate(stages):
+        remaining = {"count": stage.workers, "lock": threading.Lock()}
+        for n in range(stage.workers):
+            threads.append(threading.Thread(target=work, args=(index, stage, remaining),
+                                            name=f"pipeline-{stage.name}-{n}", daemon=True))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    if errors:
+        name, exc = errors[0]
+        raise PipelineError(f"Stage {name!r} failed: {exc}") from exc
+    return [source_stage.stats(elapsed)] + [stage.stats(elapsed) for stage in stages]
+
+def format_stage_stats(stats):
+    """Format run_pipeline() statistics as a table, marking the bottleneck stage."""
+    bottleneck = max(stats, key=lambda s: s["utilization"])["stage"] if stats else None
+    lines = [f"{'stage':<10}{'workers':>8}{'items':>10}{'items/s':>10}{'busy s':>10}"
+             f"{'starved s':>11}{'blocked s':>11}{'util':>7}"]
+    for s in stats:
+        marker = "  <- bottleneck" if s["stage"] == bottleneck else ""
+        lines.append(f"{s['stage']:<10}{s['workers']:>8}{s['items']:>10}{s['items_per_s']:>10.1f}"
+                     f"{s['busy_s']:>10.2f}{s['starved_s']:>11.2f}{s['blocked_s']:>11.2f}"
+                     f"{s['utilization']:>7.0%}{marker}")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    def slow_square(x):
+        time.sleep(0.01)
+        return x * x
+
+    collected = []
+    stats = run_pipeline(range(200), [
+        Stage("square", slow_square, workers=4),
+        Stage("sum", lambda batch: collected.extend(batch), batch_size=16),
+    ])
+    print(f"Sum of squares: {sum(collected)}")
+    print(format_stage_stats(stats))
@@ -0,0 +1,452 @@
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import re
+import threading
+import time
+
+class RateLimitTimeout(Exception):
+    """Raised when a token could not be acquired within the timeout."""
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` calls per second with bursts of `capacity`.
+
+    acquire() blocks until enough tokens have accumulated, so callers that
+    share a bucket are throttled together regardless of how many threads
+    they run on.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens=1):
+        """Take tokens if they are available right now; returns True on success."""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1, timeout=None):
+        """Block until tokens are available and take them.
+
+        Returns:
+            float: Seconds spent waiting
+        """
+        start = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return now - start
+                wait = (tokens - self._tokens) / self.rate
+            if timeout is not None and now + wait - start > timeout:
+                raise RateLimitTimeout(f"No rate limit token within {timeout}s")
+            time.sleep(wait)
+
+    def wait_time(self, tokens=1):
+        """Seconds until `tokens` would be available (0 if they are available now)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0.0, (tokens - self._tokens) / self.rate)
+
+# Priority lanes: lower values are served first when callers queue for a slot
+INTERACTIVE = 0
+BATCH = 10
+
+_priority = contextvars.ContextVar("rate_limit_priority", default=INTERACTIVE)
+
+@contextlib.contextmanager
+def priority(level):
+    """Run a block (and the asyncio tasks it starts) in a priority lane, e.g. with priority(BATCH)."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def current_priority():
+    return _priority.get()
+
+def bind_priority(fn):
+    """Wrap fn so it runs in the caller's priority lane, e.g. when submitted to a thread pool."""
+    level = _priority.get()
+
+    def run(*args, **kwargs):
+        with priority(level):
+            return fn(*args, **kwargs)
+    return run
+
+_RETRYABLE_NAMES = {"RateLimitError", "ResourceExhausted", "TooManyRequests", "ServiceUnavailable",
+                    "APIConnectionError", "APITimeoutError", "InternalServerError",
+                    "ConnectionError", "Timeout", "ReadTimeout", "ConnectTimeout"}
+
+def _status_code(exc):
+    for candidate in (getattr(exc, "status_code", None),
+                      getattr(getattr(exc, "response", None), "status_code", None),
+                      getattr(exc, "code", None)):
+        if isinstance(candidate, int):
+            return candidate
+    return None
+
+def is_throttle_error(exc):
+    """True for 429 / quota errors from openai, requests and google-api-core."""
+    return _status_code(exc) == 429 or type(exc).__name__ in ("RateLimitError", "ResourceExhausted",
+                                                             "TooManyRequests")
+
+def is_retryable_error(exc):
+    """True for throttling, 5xx responses, timeouts and dropped connections."""
+    status = _status_code(exc)
+    if status is not None and (status == 429 or status >= 500):
+        return True
+    return any(cls.__name__ in _RETRYABLE_NAMES for cls in type(exc).__mro__)
+
+def _retry_after(exc):
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "wake", "granted", "cancelled")
+
+    def __init__(self, priority, seq, wake):
+        self.priority, self.seq, self.wake = priority, seq, wake
+        self.granted = self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+class _Slot:
+    """Handle for one admitted call; the limiter learns from its latency and outcome on release."""
+
+    __slots__ = ("limiter", "start", "throttled")
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.start = time.monotonic()
+        self.throttled = False
+
+    def mark_throttled(self):
+        """Report a 429 that did not surface as an exception (e.g. a checked status code)."""
+        self.throttled = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and issubclass(exc_type, asyncio.CancelledError):
+            # A cancelled call (e.g. a hedge that lost its race) says nothing about
+            # the backend: free the slot without a latency sample or an increase
+            self.limiter._give_back()
+            return False
+        self.limiter._release(time.monotonic() - self.start,
+                              self.throttled or (exc is not None and is_throttle_error(exc)))
+        return False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+class AdaptiveLimiter:
+    """Rate limit plus adaptive concurrency limit for one backend.
+
+    Calls take a token from a TokenBucket (`rate` per second) and one of
+    `limit` concurrent slots. The slot limit follows AIMD: it grows by about
+    one per round of successful calls up to max_concurrency, and is cut by
+    `backoff` on a 429 (and by 10% when the smoothed latency exceeds
+    target_latency), at most once per round trip. Callers waiting for a slot
+    are served by priority lane, then in arrival order.
+    """
+
+    def __init__(self, name, rate, capacity=None, max_concurrency=16, min_concurrency=1,
+                 target_latency=None, backoff=0.5, max_retries=3, retry_delay=0.5):
+        self.name = name
+        self.bucket = TokenBucket(rate, capacity)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._limit = float(max_concurrency)
+        self._in_flight = 0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._latency = None
+        self._last_decrease = 0.0
+        self._stats = {"calls": 0, "queued": 0, "throttled": 0, "retries": 0, "timeouts": 0}
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self):
+        return max(self.min_concurrency, int(self._limit))
+
+    def _dispatch(self):
+        # Called with the lock held: admit queued callers while slots are free
+        while self._waiters and self._in_flight < self.limit:
+            waiter = heapq.heappop(self._waiters)
+            if waiter.cancelled:
+                continue
+            self._in_flight += 1
+            waiter.granted = True
+            waiter.wake()
+
+    def _enqueue(self, level, wake):
+        with self._lock:
+            self._stats["calls"] += 1
+            if not self._waiters and self._in_flight < self.limit:
+                self._in_flight += 1
+                return None
+            self._stats["queued"] += 1
+            waiter = _Waiter(_priority.get() if level is None else level, next(self._seq), wake)
+            heapq.heappush(self._waiters, waiter)
+            self._dispatch()
+            return waiter
+
+    def _abandon(self, waiter):
+        # Returns True if the slot was granted just as the caller gave up, so it can be used
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiter.cancelled = True
+            self._stats["timeouts"] += 1
+            return False
+
+    def _give_back(self):
+        with self._lock:
+            self._in_flight -= 1
+            self._dispatch()
+
+    def _release(self, latency, throttled):
+        with self._lock:
+            self._in_flight -= 1
+            now = time.monotonic()
+            round_trip = self._latency or latency
+            if throttled:
+                self._stats["throttled"] += 1
+                if now - self._last_decrease >= round_trip:
+                    self._limit = max(self.min_concurrency, self._limit * self.backoff)
+                    self._last_decrease = now
+            else:
+                self._latency = latency if self._latency is None else 0.9 * self._latency + 0.1 * latency
+                if self.target_latency is not None and self._latency > self.target_latency:
+                    if now - self._last_decrease >= round_trip:
+                        self._limit = max(self.min_concurrency, self._limit * 0.9)
+                        self._last_decrease = now
+                else:
+                    self._limit = min(self.max_concurrency, self._limit + 1.0 / max(1.0, self._limit))
+            self._dispatch()
+
+    def slot(self, priority=None, timeout=None):
+        """Block until the call may start; use as `with limiter.slot():`.
+
+        Raises:
+            RateLimitTimeout: No slot and token within timeout seconds
+        """
+        start = time.monotonic()
+        event = threading.Event()
+        waiter = self._enqueue(priority, event.set)
+        if waiter is not None and not event.wait(timeout) and not self._abandon(waiter):
+            raise RateLimitTimeout(f"No {self.name} slot within {timeout}s")
+        try:
+            remaining = None if timeout is None else max(0.0, timeout - (time.monotonic() - start))
+            self.bucket.acquire(timeout=remaining)
+        except BaseException:
+            self._give_back()
+            raise
+        return _Slot(self)
+
+    async def slot_async(self, priority=None, timeout=None):
+        """Async variant of slot(); use as `async with await limiter.slot_async():`."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        start = time.monotonic()
+        waiter = self._enqueue(priority, wake)
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                if not self._abandon(waiter):
+                    raise RateLimitTimeout(f"No {self.name} slot within {timeout}s") from None
+            except asyncio.CancelledError:
+                if self._abandon(waiter):
+                    self._give_back()
+                raise
+        try:
+            while not self.bucket.try_acquire():
+                if timeout is not None and time.monotonic() - start > timeout:
+                    raise RateLimitTimeout(f"No {self.name} rate limit token within {timeout}s")
+                await asyncio.sleep(self.bucket.wait_time())
+        except BaseException:
+            self._give_back()
+            raise
+        return _Slot(self)
+
+    def _retry_wait(self, exc, attempt):
+        with self._lock:
+            self._stats["retries"] += 1
+        delay = _retry_after(exc)
+        if delay is None:
+            delay = self.retry_delay * 2 ** attempt * random.uniform(0.5, 1.5)
+        return delay
+
+    def call(self, fn, *args, priority=None, **kwargs):
+        """Run fn(*args, **kwargs) in a slot, retrying 429, 5xx and connection errors with backoff.
+
+        Retries queue for a new slot, so they respect the reduced limit
+        instead of piling onto an overloaded backend.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self.slot(priority):
+                    return fn(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable_error(e):
+                    raise
+                delay = self._retry_wait(e, attempt)
+            time.sleep(delay)
+
+    async def call_async(self, fn, *args, priority=None, **kwargs):
+        """Async variant of call(): awaits fn(*args, **kwargs) in a slot."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with await self.slot_async(priority):
+                    return await fn(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable_error(e):
+                    raise
+                delay = self._retry_wait(e, attempt)
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "limit": self.limit, "in_flight": self._in_flight,
+                    "waiting": sum(not w.cancelled for w in self._waiters), "rate": self.bucket.rate,
+                    "latency_ewma": self._latency}
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+# Share of each backend's budget this process may use (see set_process_share)
+_share = 1.0
+
+def _env_name(name):
+    return re.sub(r"[^A-Za-z0-9]+", "_", name).upper()
+
+def get_limiter(name, rate=10, max_concurrency=16, **settings):
+    """Return the process-wide limiter for a backend, creating it on first use.
+
+    The arguments are the backend's defaults; RATE_LIMIT_<NAME>,
+    MAX_CONCURRENCY_<NAME> and TARGET_LATENCY_<NAME> (seconds) override
+    them, e.g. RATE_LIMIT_DEEPSEEK=20. Rate and concurrency are then scaled
+    by the process share, so N processes started with set_process_share(1 / N) stay within
+    one budget together.
+    """
+    limiter = _limiters.get(name)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(name)
+            if limiter is None:
+                env = _env_name(name)
+                rate = float(os.environ.get(f"RATE_LIMIT_{env}", rate))
+                max_concurrency = int(os.environ.get(f"MAX_CONCURRENCY_{env}", max_concurrency))
+                rate *= _share
+                max_concurrency = max(1, int(max_concurrency * _share))
+                if f"TARGET_LATENCY_{env}" in os.environ:
+                    settings["target_latency"] = float(os.environ[f"TARGET_LATENCY_{env}"])
+                limiter = _limiters[name] = AdaptiveLimiter(name, rate, max_concurrency=max_concurrency,
+                                                            **settings)
+    return limiter
+
+def configure_limiter(name, rate=10, max_concurrency=16, **settings):
+    """Replace a backend's limiter, e.g. to raise its rate in a benchmark."""
+    with _limiters_lock:
+        limiter = _limiters[name] = AdaptiveLimiter(name, rate, max_concurrency=max_concurrency, **settings)
+    return limiter
+
+def set_process_share(share):
+    """Give this process `share` (0-1] of every backend budget, e.g. in each of N pre-forked workers.
+
+    Applies to limiters created afterwards by get_limiter(); configure_limiter()
+    sets exact budgets and is not scaled.
+    """
+    global _share
+    if not 0 < share <= 1:
+        raise ValueError(f"share must be in (0, 1], got {share}")
+    with _limiters_lock:
+        _share = float(share)
+        _limiters.clear()
+
+def get_limiter_stats():
+    """Return {backend: stats} for every limiter created in this process."""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.stats() for limiter in limiters}
+
+def _reset_after_fork():
+    # Locks and queued waiters belong to the parent; children start with fresh limiters
+    global _limiters_lock
+    _limiters_lock = threading.Lock()
+    _limiters.clear()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+
+    bucket = TokenBucket(rate=20, capacity=5)
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda _: bucket.acquire(), range(45)))
+    # 5 burst tokens, then 40 more at 20/s: about 2 seconds
+    print(f"45 calls at 20/s (burst 5) took {time.monotonic() - start:.2f}s")
+
+    # Priority lanes and AIMD against a fake backend that throttles above 4 concurrent calls
+    class Throttled(Exception):
+        status_code = 429
+
+    limiter = AdaptiveLimiter("demo", rate=1000, max_concurrency=16, retry_delay=0.01)
+    active = []
+    order = []
+
+    def fake_call(lane):
+        active.append(1)
+        try:
+            if len(active) > 4:
+                raise Throttled()
+            time.sleep(0.02)
+            order.append(lane)
+        finally:
+            active.pop()
+
+    def run(lane):
+        with priority(lane):
+            limiter.call(fake_call, lane)
+
+    with ThreadPoolExecutor(max_workers=32) as executor:
+        list(executor.map(run, [BATCH] * 40 + [INTERACTIVE] * 10))
+    print(f"Adaptive limit settled at {limiter.limit}; stats {limiter.stats()}")
+    print(f"Interactive calls finished at positions {[i for i, lane in enumerate(order) if lane == INTERACTIVE]}")
@@ -1,45 +1,202 @@
 """
 Web Search Utility for Cold Outreach Opener Generator
 """
+import json
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils.rate_limiter import bind_priority, get_limiter
+from utils.single_flight import SingleFlight
+
+# Replace these with your actual API key and Search Engine ID, or set them in the environment.
+API_KEY = os.environ.get("GOOGLE_API_KEY", "google-api-key")
+SEARCH_ENGINE_ID = os.environ.get("GOOGLE_SEARCH_ENGINE_ID", "google-search-engine-id")
+SEARCH_URL = os.environ.get("SEARCH_URL", "https://www.googleapis.com/customsearch/v1")
+
+CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", 3600))
+CACHE_MAX_ENTRIES = int(os.environ.get("SEARCH_CACHE_MAX_ENTRIES", 10000))
+# Queries per second and concurrent queries sent to the backend, shared by all threads
+RATE_LIMIT = float(os.environ.get("SEARCH_RATE_LIMIT", 10))
+MAX_CONCURRENCY = int(os.environ.get("SEARCH_MAX_CONCURRENCY", 8))
+# Smoothed latency above which the limiter sends fewer concurrent queries
+TARGET_LATENCY = float(os.environ.get("SEARCH_TARGET_LATENCY", 3.0))
+
+class GoogleSearchBackend:
+    """
+    Google Custom Search JSON API backend.
+
+    Any callable backend(session, query, num_results, timeout) returning a
+    list of result dicts can be used instead, e.g. this class pointed at a
+    local fake server through `url`. Results are cached per backend `name`
+    (or qualified name, for backends without one).
+    """
+
+    def __init__(self, url=SEARCH_URL, api_key=API_KEY, cse_id=SEARCH_ENGINE_ID):
+        self.url = url
+        self.api_key = api_key
+        self.cse_id = cse_id
+        # Cache identity: backends with the same endpoint and engine return the same results
+        self.name = f"google:{url}:{cse_id}"
+
+    def __call__(self, session, query, num_results, timeout):
+        params = {
+            'key': self.api_key,
+            'cx': self.cse_id,
+            'q': query,
+            'num': num_results
+        }
+        response = session.get(self.url, params=params, timeout=timeout)
+        if response.status_code != 200:
+            # HTTPError carries the response so the limiter can spot 429s
+            raise requests.HTTPError(f"Error: {response.status_code}, {response.text}", response=response)
+        # Results are typically in data['items'] if the request is successful
+        return response.json().get('items', [])
+
+class TTLCache:
+    """Thread-safe in-memory cache whose entries expire after `ttl` seconds (LRU beyond max_entries)."""
+
+    def __init__(self, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
 
-def search_web(query, num_results=10):
+_backend = GoogleSearchBackend()
+_cache = TTLCache()
+_flight = SingleFlight()
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+def set_backend(backend):
+    """Replace the default search backend, e.g. with one pointed at a local fake server."""
+    global _backend
+    _backend = backend
+    _cache.clear()
+
+def _limiter():
+    return get_limiter("google_search", rate=RATE_LIMIT, max_concurrency=MAX_CONCURRENCY,
+                       target_latency=TARGET_LATENCY)
+
+def get_session():
+    """Return the process-wide session; 5xx responses are retried with backoff.
+
+    429s are left to the shared limiter, which backs off all callers at once,
+    so urllib3 must not retry them on its own because of a Retry-After header.
+    """
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        with _session_lock:
+            if _session is None or _session_pid != os.getpid():
+                retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(500, 502, 503, 504),
+                              allowed_methods=("GET",), respect_retry_after_header=False)
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=retry)
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session, _session_pid = session, os.getpid()
+    return _session
+
+def _backend_name(backend):
+    name = getattr(backend, "name", None)
+    if name is None:
+        # Functions have their own qualified name; callable instances use their class's
+        owner = backend if hasattr(backend, "__qualname__") else type(backend)
+        name = f"{owner.__module__}.{owner.__qualname__}"
+    return name
+
+def _search(query, num_results, backend, timeout, use_cache):
+    key = json.dumps([_backend_name(backend), query, num_results])
+    if use_cache:
+        cached = _cache.get(key)
+        if cached is not None:
+            return cached
+
+    def fetch():
+        results = _limiter().call(backend, get_session(), query, num_results, timeout)
+        if use_cache:
+            _cache.set(key, results)
+        return results
+
+    # Identical queries already in flight share one request
+    return _flight.do(key, fetch)
+
+def search_web(query, num_results=10, backend=None, timeout=10, use_cache=True):
     """
     Executes a Google Custom Search and returns results.
-    :param api_key: Your Google API key
-    :param cse_id: Your custom search engine ID
     :param query: The search query string
     :param num_results: Number of search results to return (1-10)
+    :param backend: Search backend to use instead of the default one
+    :param timeout: Request timeout in seconds
+    :param use_cache: Serve repeated queries from the in-memory TTL cache
     :return: A list of results (each result is a dict with relevant fields)
     """
-    # Replace these with your actual API key and Search Engine ID.
-    API_KEY = "google-api-key"
-    SEARCH_ENGINE_ID = "google-search-engine-id"
-
-    url = "https://www.googleapis.com/customsearch/v1"
-    params = {
-        'key': API_KEY,
-        'cx': SEARCH_ENGINE_ID,
-        'q': query,
-        'num': num_results
-    }
-    
-    response = requests.get(url, params=params)
-    if response.status_code == 200:
-        data = response.json()
-        # Results are typically in data['items'] if the request is successful
-        return data.get('items', [])
-    else:
-        print(f"Error: {response.status_code}, {response.text}")
+    try:
+        return _search(query, num_results, backend or _backend, timeout, use_cache)
+    except Exception as e:
+        print(e)
         return []
 
+def search_web_many(queries, num_results=10, max_workers=8, backend=None, timeout=10, use_cache=True):
+    """
+    Executes several searches concurrently over a shared session.
+
+    Duplicate queries are sent once, cached queries are not sent at all, and
+    all requests go through the shared "google_search" limiter (SEARCH_RATE_LIMIT
+    per second) in the caller's priority lane.
+    :param queries: The search query strings
+    :param num_results: Number of search results to return per query (1-10)
+    :param max_workers: Maximum searches in flight
+    :return: A list of result lists, one per query in input order
+    """
+    unique = list(dict.fromkeys(queries))
+    if not unique:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(unique)))) as executor:
+        results = dict(zip(unique, executor.map(bind_priority(
+            lambda query: search_web(query, num_results, backend, timeout, use_cache)), unique)))
+    return [results[query] for query in queries]
+
 if __name__ == "__main__":
     results = search_web("Elon Musk")
-    
+
     for idx, item in enumerate(results, start=1):
         title = item.get("title")
         snippet = item.get("snippet")
         link = item.get("link")
         print(f"{idx}. {title}\n{snippet}\nLink: {link}\n")
+
+    # Fan out several queries; repeats are served from the cache
+    queries = ["Elon Musk", "SpaceX", "Tesla", "Elon Musk"]
+    start = time.perf_counter()
+    batches = search_web_many(queries)
+    print(f"{len(queries)} queries in {time.perf_counter() - start:.2f}s: {[len(b) for b in batches]} results")
@@ -0,0 +1,66 @@
+import threading
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight wait and receive the same result (or exception). Nothing is
+    remembered once the call finishes, so pair it with a cache for reuse
+    across time.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.shared = 0  # Calls answered by another caller's execution
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+if __name__ == "__main__":
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    calls = []
+
+    def slow_lookup(key):
+        calls.append(key)
+        time.sleep(0.2)
+        return key.upper()
+
+    flight = SingleFlight()
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        results = list(executor.map(lambda k: flight.do(k, slow_lookup, k), ["a"] * 5 + ["b"] * 5))
+    print(f"Results: {results}")
+    print(f"Executions: {len(calls)}, shared: {flight.shared}")
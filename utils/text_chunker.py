@@ -1,46 +1,214 @@
+import mmap
+import re
+
+# Preferred break points, strongest first: paragraph, sentence, line, word.
+# Sentence breaks end after the punctuation; the others end before the whitespace.
+_STR_BOUNDARIES = [
+    (re.compile(r"\n[ \t]*\n"), False),
+    (re.compile(r"[.!?。！？؟][\"'”’)\]]*(?=\s)"), True),
+    (re.compile(r"\n"), False),
+    (re.compile(r"\s"), False),
+]
+# Same rules for UTF-8 bytes (。！？؟ spelled out as their UTF-8 encodings)
+_BYTES_BOUNDARIES = [
+    (re.compile(rb"\n[ \t]*\n"), False),
+    (re.compile(rb"(?:[.!?]|\xe3\x80\x82|\xef\xbc\x81|\xef\xbc\x9f|\xd8\x9f)[\"')\]]*(?=\s)"), True),
+    (re.compile(rb"\n"), False),
+    (re.compile(rb"\s"), False),
+]
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+def count_tokens(text):
+    """Approximate token count: words and punctuation marks.
+
+    Pass a real tokenizer instead (e.g. lambda t: len(enc.encode(t))) when
+    exact model token counts matter.
+    """
+    return len(_TOKEN_PATTERN.findall(text))
+
+def _last_boundary(buf, lo, hi, patterns):
+    """Return the end of the last, strongest boundary match within buf[lo:hi], or None."""
+    for pattern, include_match in patterns:
+        last = None
+        for match in pattern.finditer(buf, lo, hi):
+            last = match
+        if last is not None:
+            return last.end() if include_match else last.start()
+    return None
+
+def _fit_tokens(buf, start, end, max_tokens, token_counter, is_bytes):
+    """Shrink end until buf[start:end] has at most max_tokens tokens."""
+    if token_counter is count_tokens:
+        # Default counter: one pass, cutting where token max_tokens + 1 begins
+        window = bytes(buf[start:end]).decode("utf-8", "ignore") if is_bytes else buf[start:end]
+        if len(_TOKEN_PATTERN.findall(window)) <= max_tokens:
+            return end
+        for i, match in enumerate(_TOKEN_PATTERN.finditer(window)):
+            if i == max_tokens:
+                cut = match.start()
+                return start + (len(window[:cut].encode("utf-8")) if is_bytes else cut)
+        return end
+
+    # Custom counters: binary search on the end offset
+    def tokens(stop):
+        window = buf[start:stop]
+        return token_counter(bytes(window).decode("utf-8", "ignore") if is_bytes else window)
+
+    if tokens(end) <= max_tokens:
+        return end
+    lo, hi = start + 1, end
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if tokens(mid) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+def _chunk_end(buf, start, limit, chunk_size, at_eof, max_tokens, token_counter, is_bytes):
+    """Pick where the chunk starting at buf[start] should end."""
+    end = min(start + chunk_size, limit)
+    if max_tokens is not None:
+        end = _fit_tokens(buf, start, end, max_tokens, token_counter, is_bytes)
+    if end == limit and at_eof:
+        return end
+    # Look for a natural break in the second half of the window
+    patterns = _BYTES_BOUNDARIES if is_bytes else _STR_BOUNDARIES
+    boundary = _last_boundary(buf, start + (end - start) // 2, end, patterns)
+    if boundary is not None and boundary > start:
+        return boundary
+    if is_bytes:
+        # Never split a UTF-8 multi-byte character on a hard cut
+        while end > start + 1 and end < limit and (buf[end] & 0xC0) == 0x80:
+            end -= 1
+    return end
+
+def _skip_continuation(buf, pos, limit):
+    # Move a byte offset forward to the start of a UTF-8 character
+    while pos < limit and (buf[pos] & 0xC0) == 0x80:
+        pos += 1
+    return pos
+
+def _is_stream(source):
+    return hasattr(source, "read") and not isinstance(source, (str, bytes, bytearray, memoryview, mmap.mmap))
+
+def _iter_windows(source, chunk_size, overlap, max_tokens, token_counter, block_size):
+    """Yield (offset, length, buffer, buffer_offset) for each chunk of source."""
+    if overlap >= chunk_size:
+        overlap = chunk_size // 2  # Default to 50% overlap if invalid
+
+    if not _is_stream(source):
+        buf = source
+        is_bytes = not isinstance(buf, str)
+        if is_bytes and not isinstance(buf, memoryview):
+            buf = memoryview(buf)
+        if isinstance(buf, memoryview):
+            buf = buf.cast("B")
+        start, limit = 0, len(buf)
+        while start < limit:
+            end = _chunk_end(buf, start, limit, chunk_size, True, max_tokens, token_counter, is_bytes)
+            yield start, end - start, buf, 0
+            if end >= limit:
+                break
+            # Move forward by at least 1 character if overlap would prevent progress
+            start = max(start + 1, end - overlap)
+            if is_bytes:
+                start = _skip_continuation(buf, start, limit)
+        return
+
+    # Streams: keep a sliding buffer that starts at the current chunk
+    first = source.read(block_size)
+    is_bytes = not isinstance(first, str)
+    buf, base, at_eof = first, 0, not first
+    start = 0
+    while True:
+        # Read until the window is longer than a chunk, so end == limit only at EOF
+        while not at_eof and len(buf) - (start - base) <= chunk_size:
+            block = source.read(block_size)
+            if not block:
+                at_eof = True
+            else:
+                buf = buf[start - base:] + block
+                base = start
+        limit = base + len(buf)
+        if start >= limit:
+            return
+        local = buf if not is_bytes else memoryview(buf)
+        local_end = _chunk_end(local, start - base, len(buf), chunk_size, at_eof,
+                               max_tokens, token_counter, is_bytes)
+        end = base + local_end
+        yield start, end - start, buf, base
+        if end >= limit and at_eof:
+            return
+        start = max(start + 1, end - overlap)
+        if is_bytes:
+            start = base + _skip_continuation(buf, start - base, len(buf))
+
+def iter_chunk_spans(source, chunk_size=2000, overlap=500, max_tokens=None, token_counter=count_tokens,
+                     block_size=1 << 20):
+    """Lazily split a text into overlapping chunks, yielding (offset, length) spans.
+
+    Chunks end at the strongest natural break in the second half of the
+    window: paragraph, then sentence, then line, then word. Nothing is copied
+    for in-memory sources; streams are read block by block, so memory stays
+    bounded by the block and chunk size.
+
+    Args:
+        source: A str, bytes/bytearray/memoryview/mmap (offsets in bytes), or a
+            file object opened in text or binary mode
+        chunk_size (int): Maximum size of each chunk in characters (bytes for binary sources)
+        overlap (int): Number of overlapping characters between chunks
+        max_tokens (int, optional): Also cap each chunk at this many tokens
+        token_counter (callable): Function counting tokens in a str
+        block_size (int): Read size for stream sources
+
+    Yields:
+        tuple: (offset, length) of each chunk
+    """
+    for offset, length, _, _ in _iter_windows(source, chunk_size, overlap, max_tokens, token_counter,
+                                              block_size):
+        yield offset, length
+
+def iter_chunks(source, chunk_size=2000, overlap=500, max_tokens=None, token_counter=count_tokens,
+                block_size=1 << 20):
+    """Like iter_chunk_spans, but yield the chunk contents.
+
+    Chunks of str sources are str; chunks of binary sources are zero-copy
+    memoryview slices (bytes for binary streams).
+    """
+    for offset, length, buf, base in _iter_windows(source, chunk_size, overlap, max_tokens, token_counter,
+                                                   block_size):
+        yield buf[offset - base:offset - base + length]
+
 def chunk_text(text, chunk_size=2000, overlap=500):
     """Split text into overlapping chunks of approximately chunk_size chars.
-    
+
     Args:
         text (str): The text to chunk
         chunk_size (int): Target size of each chunk in characters
         overlap (int): Number of overlapping characters between chunks
-    
+
     Returns:
         list: List of text chunks
     """
-    # Guard against invalid parameters that would cause infinite loops
-    if overlap >= chunk_size:
-        overlap = chunk_size // 2  # Default to 50% overlap if invalid
-        
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = min(start + chunk_size, len(text))
-        if end < len(text) and end - start == chunk_size:
-            # Try to find a good breaking point
-            last_period = text.rfind('.', start, end)
-            if last_period > start + 0.5 * chunk_size:
-                end = last_period + 1
-        
-        chunks.append(text[start:end])
-        
-        # Ensure we make forward progress
-        if end == len(text):
-            # We've reached the end of the text
-            break
-            
-        # Move forward by at least 1 character if overlap would prevent progress
-        start = min(end, start + max(1, end - start - overlap))
-
-    return chunks
+    return list(iter_chunks(text, chunk_size=chunk_size, overlap=overlap))
 
 if __name__ == "__main__":
+    import io
+
     # Test the chunking function
     sample_text = "This is a test paragraph. It contains several sentences. " * 10
     chunks = chunk_text(sample_text, chunk_size=2000, overlap=500)
-    
+
     print(f"Original text length: {len(sample_text)}")
     print(f"Number of chunks: {len(chunks)}")
     for i, chunk in enumerate(chunks):
-        print(f"Chunk {i+1} (length {len(chunk)}): {chunk[:50]}...") 
\ No newline at end of file
+        print(f"Chunk {i+1} (length {len(chunk)}): {chunk[:50]}...")
+
+    # Token-budgeted spans over a stream
+    long_text = ("First paragraph sentence one. Sentence two!\n\n" * 200)
+    spans = list(iter_chunk_spans(io.StringIO(long_text), chunk_size=400, overlap=50, max_tokens=40,
+                                  block_size=1000))
+    print(f"Stream spans: {len(spans)}, first three: {spans[:3]}")
+    assert spans == list(iter_chunk_spans(long_text, chunk_size=400, overlap=50, max_tokens=40))
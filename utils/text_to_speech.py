@@ -4,77 +4,224 @@ import subprocess
 import base64
 import hashlib
 import os
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
 
-def synthesize_text_to_speech(text, output_dir="audio_cache"):
+from utils.rate_limiter import bind_priority, get_limiter
+from utils.single_flight import SingleFlight
+from utils.text_chunker import iter_chunk_spans
+
+TTS_URL = "https://texttospeech.googleapis.com/v1/text:synthesize"
+VOICE = {
+    "languageCode": "en-US",
+    "name": "en-US-Chirp3-HD-Puck"
+}
+# The API rejects inputs over 5000 bytes
+MAX_INPUT_BYTES = 5000
+# gcloud access tokens are valid for an hour; refresh a bit earlier
+TOKEN_TTL = float(os.environ.get("TTS_TOKEN_TTL", 50 * 60))
+# Synthesis requests per second and in flight, shared by all threads
+RATE_LIMIT = float(os.environ.get("TTS_RATE_LIMIT", 10))
+MAX_CONCURRENCY = int(os.environ.get("TTS_MAX_CONCURRENCY", 8))
+
+_lock = threading.Lock()
+_project = None
+_token = None
+_token_expires = 0.0
+_session = None
+_session_pid = None
+_flight = SingleFlight()
+
+def get_credentials(refresh=False):
     """
-    Synthesizes text to speech using Google Cloud Text-to-Speech API.
-    Generates a filename based on a hash of the input text.
-    
-    Args:
-        text (str): The text to convert to speech
-        output_dir (str): Directory to save audio files
-    
-    Returns:
-        str: Filename (hash) if successful, None otherwise
+    Returns (project, access_token) from gcloud, cached until the token expires.
+
+    The two gcloud commands run in parallel on a cache miss; the project ID is
+    only looked up once per process.
     """
-    # Create hash of the text for filename
-    text_hash = hashlib.md5(text.encode('utf-8')).hexdigest()
-    filename = f"{text_hash}.wav"
-    filepath = os.path.join(output_dir, filename)
-    
-    # Check if file already exists (caching)
-    if os.path.exists(filepath):
-        return text_hash
-    
-    # Ensure output directory exists
-    os.makedirs(output_dir, exist_ok=True)
-    
-    # Get the Google Cloud project ID
-    project = subprocess.check_output(
-        ["gcloud", "config", "list", "--format=value(core.project)"]
-    ).decode().strip()
+    global _project, _token, _token_expires
+    with _lock:
+        if refresh or _token is None or time.monotonic() >= _token_expires:
+            token_cmd = subprocess.Popen(["gcloud", "auth", "print-access-token"], stdout=subprocess.PIPE)
+            if _project is None:
+                _project = subprocess.check_output(
+                    ["gcloud", "config", "list", "--format=value(core.project)"]
+                ).decode().strip()
+            out, _ = token_cmd.communicate()
+            if token_cmd.returncode != 0:
+                raise subprocess.CalledProcessError(token_cmd.returncode, token_cmd.args)
+            _token = out.decode().strip()
+            _token_expires = time.monotonic() + TOKEN_TTL
+        return _project, _token
 
-    # Get an access token
-    token = subprocess.check_output(
-        ["gcloud", "auth", "print-access-token"]
-    ).decode().strip()
+def get_session():
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        with _lock:
+            if _session is None or _session_pid != os.getpid():
+                session = requests.Session()
+                session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=32))
+                _session, _session_pid = session, os.getpid()
+    return _session
 
+def split_text(text, max_bytes=MAX_INPUT_BYTES):
+    """
+    Splits text into pieces of at most max_bytes UTF-8 bytes.
+
+    Pieces end at paragraph, sentence, line or word boundaries where possible.
+    """
+    data = text.encode("utf-8")
+    pieces = []
+    for offset, length in iter_chunk_spans(data, chunk_size=max_bytes, overlap=0):
+        piece = data[offset:offset + length].decode("utf-8").strip()
+        if piece:
+            pieces.append(piece)
+    return pieces
+
+def _text_hash(text):
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+def _atomic_write(filepath, write):
+    tmp_path = f"{filepath}.tmp-{os.getpid()}-{threading.get_ident()}"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, filepath)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _post(headers, payload):
+    response = get_session().post(TTS_URL, headers=headers, json=payload)
+    if response.status_code == 429 or response.status_code >= 500:
+        response.raise_for_status()  # let the limiter back off and retry
+    return response
+
+def _request_audio(text):
     # Prepare the JSON payload
     payload = {
         "input": {
             "text": text
         },
-        "voice": {
-            "languageCode": "en-US",
-            "name": "en-US-Chirp3-HD-Puck"
-        },
+        "voice": VOICE,
         "audioConfig": {
             "audioEncoding": "LINEAR16"
         }
     }
-
-    # Set the headers
-    headers = {
-        "Content-Type": "application/json",
-        "X-Goog-User-Project": project,
-        "Authorization": f"Bearer {token}",
-    }
-
-    # Make the POST request
-    url = "https://texttospeech.googleapis.com/v1/text:synthesize"
-    response = requests.post(url, headers=headers, json=payload)
+    limiter = get_limiter("google_tts", rate=RATE_LIMIT, max_concurrency=MAX_CONCURRENCY)
+    for attempt in range(2):
+        project, token = get_credentials(refresh=attempt > 0)
+        headers = {
+            "Content-Type": "application/json",
+            "X-Goog-User-Project": project,
+            "Authorization": f"Bearer {token}",
+        }
+        response = limiter.call(_post, headers, payload)
+        if response.status_code != 401:
+            break  # a 401 means the cached token expired early: refresh once
     response.raise_for_status()  # Raises an error if the request fails
 
     # The response contains a base64-encoded audio content
-    audio_content = response.json().get("audioContent")
+    return base64.b64decode(response.json().get("audioContent"))
+
+def _synthesize_piece(text, output_dir):
+    """Synthesize one API-sized piece into output_dir/<md5>.wav and return its path."""
+    filepath = os.path.join(output_dir, f"{_text_hash(text)}.wav")
+    if os.path.exists(filepath):
+        return filepath
 
-    with open(filepath, "wb") as out_file:
-        out_file.write(base64.b64decode(audio_content))
-    return text_hash
+    def synthesize():
+        if not os.path.exists(filepath):
+            audio = _request_audio(text)
+
+            def write(path):
+                with open(path, "wb") as out_file:
+                    out_file.write(audio)
+            _atomic_write(filepath, write)
+        return filepath
+
+    # Identical pieces requested concurrently are synthesized once
+    return _flight.do(filepath, synthesize)
+
+def _stitch(filepath, piece_paths):
+    """Concatenate WAV files with the same format into filepath."""
+    def write(path):
+        with wave.open(path, "wb") as out:
+            for i, piece_path in enumerate(piece_paths):
+                with wave.open(piece_path, "rb") as piece:
+                    if i == 0:
+                        out.setparams(piece.getparams())
+                    out.writeframes(piece.readframes(piece.getnframes()))
+    _atomic_write(filepath, write)
+
+def synthesize_many(texts, output_dir="audio_cache", max_workers=8, raise_errors=False):
+    """
+    Synthesizes many texts concurrently.
+
+    Texts longer than the API limit are split at sentence boundaries, every
+    distinct piece is synthesized once over a pooled session, and the pieces
+    of each text are stitched into one WAV file named by the hash of the text.
+
+    Args:
+        texts (list): Texts to convert to speech
+        output_dir (str): Directory to save audio files
+        max_workers (int): Synthesis requests in flight
+        raise_errors (bool): Raise the first error instead of returning None for that text
+
+    Returns:
+        list: Filename hash per text, or None where synthesis failed
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    plans = []
+    for text in texts:
+        text_hash = _text_hash(text)
+        filepath = os.path.join(output_dir, f"{text_hash}.wav")
+        plans.append((text_hash, filepath, None if os.path.exists(filepath) else split_text(text)))
+
+    pieces = list(dict.fromkeys(piece for _, _, split in plans if split for piece in split))
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pieces) or 1))) as executor:
+        synthesize = bind_priority(_synthesize_piece)
+        futures = {piece: executor.submit(synthesize, piece, output_dir) for piece in pieces}
+        for text_hash, filepath, split in plans:
+            try:
+                if split:
+                    piece_paths = [futures[piece].result() for piece in split]
+                    if piece_paths != [filepath]:
+                        _flight.do(filepath, _stitch, filepath, piece_paths)
+                elif split is not None:
+                    raise ValueError("Nothing to synthesize")
+                results.append(text_hash)
+            except Exception as e:
+                if raise_errors:
+                    raise
+                print(f"Error synthesizing {text_hash}: {e}")
+                results.append(None)
+    return results
+
+def synthesize_text_to_speech(text, output_dir="audio_cache"):
+    """
+    Synthesizes text to speech using Google Cloud Text-to-Speech API.
+    Generates a filename based on a hash of the input text.
+
+    Args:
+        text (str): The text to convert to speech
+        output_dir (str): Directory to save audio files
+
+    Returns:
+        str: Filename (hash) if successful, None otherwise
+    """
+    return synthesize_many([text], output_dir=output_dir, raise_errors=True)[0]
 
 if __name__ == "__main__":
     text_to_speak = (
         "Pocket Flow is A 100-line minimalist LLM framework. humm. This is a test. humm."
     )
     result = synthesize_text_to_speech(text_to_speak)
-    print(f"Result hash: {result}") 
\ No newline at end of file
+    print(f"Result hash: {result}")
+
+    # Several texts at once; repeated texts and sentences are synthesized once
+    texts = [text_to_speak, "Another short test.", text_to_speak]
+    start = time.perf_counter()
+    print(f"Batch hashes: {synthesize_many(texts)} in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,288 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+
+# Tracing is on unless TRACING=off; spans then cost a few microseconds each
+_enabled = os.environ.get("TRACING", "on").lower() not in ("off", "0", "false")
+_jsonl = None
+_jsonl_lock = threading.Lock()
+
+_current = contextvars.ContextVar("current_span", default=None)
+
+# Upper bounds (seconds) of the Prometheus duration histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class Span:
+    """One timed operation. Spans nest through a context variable, so they
+    follow the flow across function calls and asyncio tasks."""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "attrs", "start", "duration",
+                 "root", "_counts", "_token")
+
+    def __init__(self, name, kind, parent, attrs):
+        self.name = name
+        self.kind = kind
+        self.attrs = attrs
+        self.span_id = uuid.uuid4().hex[:16]
+        if parent is None or kind == "trace":
+            self.trace_id = attrs.pop("trace_id", None) or uuid.uuid4().hex
+            self.parent_id = parent.span_id if parent is not None else None
+            self.root = self
+            self._counts = Counter()
+        else:
+            self.trace_id = parent.trace_id
+            self.parent_id = parent.span_id
+            self.root = parent.root
+            self._counts = None
+        self.start = time.time()
+        self.duration = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self):
+        return {"trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+                "name": self.name, "kind": self.kind, "start": self.start, "duration_s": self.duration,
+                **self.attrs}
+
+class _NoopSpan:
+    trace_id = None
+
+    def set(self, **attrs):
+        pass
+
+_NOOP = _NoopSpan()
+
+class _SpanContext:
+    __slots__ = ("name", "kind", "attrs", "attach", "span", "_start")
+
+    def __init__(self, name, kind, attrs, attach=True):
+        self.name, self.kind, self.attrs, self.attach = name, kind, attrs, attach
+
+    def __enter__(self):
+        if not _enabled:
+            self.span = _NOOP
+            return _NOOP
+        span = self.span = Span(self.name, self.kind, _current.get(), self.attrs)
+        if self.attach:
+            span._token = _current.set(span)
+        self._start = time.perf_counter()
+        return span
+
+    def __exit__(self, exc_type, exc, tb):
+        span = self.span
+        if span is _NOOP:
+            return False
+        span.duration = time.perf_counter() - self._start
+        if self.attach:
+            _current.reset(span._token)
+        if exc_type is not None:
+            span.attrs["error"] = exc_type.__name__
+        if span.root is not span and span.kind == "node":
+            span.root._counts[span.name] += 1
+        if span.root is span:
+            span.attrs["node_runs"] = dict(span._counts)
+        _record(span)
+        return False
+
+def span(name, kind="span", **attrs):
+    """Context manager timing a block as a child of the current span.
+
+    kind="trace" starts a new trace (pass trace_id= to choose its id).
+    """
+    return _SpanContext(name, kind, attrs)
+
+def detached_span(name, kind="span", **attrs):
+    """Like span(), but the span never becomes the current one.
+
+    For generators that yield inside the block: the consumer's own spans do
+    not nest under it between items, and closing the generator from another
+    context is safe.
+    """
+    return _SpanContext(name, kind, attrs, attach=False)
+
+def trace(name="question", trace_id=None, **attrs):
+    """Context manager for the root span of one unit of work, e.g. one question."""
+    return _SpanContext(name, "trace", {"trace_id": trace_id, **attrs})
+
+def current_span():
+    """Return the innermost open span, or a no-op span outside any trace."""
+    return _current.get() or _NOOP
+
+def current_trace_id():
+    span = _current.get()
+    return span.trace_id if span is not None else None
+
+def configure_tracing(enabled=None, jsonl_path=None):
+    """Switch tracing on or off and choose a JSONL file that receives every finished span."""
+    global _enabled, _jsonl
+    if enabled is not None:
+        _enabled = enabled
+    if jsonl_path is not None:
+        with _jsonl_lock:
+            if _jsonl is not None:
+                _jsonl.close()
+            directory = os.path.dirname(jsonl_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            _jsonl = open(jsonl_path, "a", encoding="utf-8")
+
+def tracing_enabled():
+    return _enabled
+
+# Aggregates behind the Prometheus export
+_metrics_lock = threading.Lock()
+_durations = {}   # (kind, name) -> [bucket counts..., count, sum]
+_tokens = Counter()   # (model, type) -> tokens
+_llm_calls = Counter()   # (model, cached) -> calls
+
+def _record(span):
+    with _metrics_lock:
+        key = (span.kind, span.name)
+        hist = _durations.get(key)
+        if hist is None:
+            hist = _durations[key] = [0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if span.duration <= bound:
+                hist[i] += 1
+        hist[-2] += 1
+        hist[-1] += span.duration
+        if span.kind == "llm":
+            model = span.attrs.get("model", "")
+            _llm_calls[(model, bool(span.attrs.get("cached")))] += 1
+            for kind in ("prompt_tokens", "completion_tokens"):
+                if span.attrs.get(kind):
+                    _tokens[(model, kind[:-len("_tokens")])] += span.attrs[kind]
+    if _jsonl is not None:
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n"
+        with _jsonl_lock:
+            _jsonl.write(line)
+            if span.root is span:
+                _jsonl.flush()
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(**labels):
+    return ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels.items())
+
+def export_prometheus():
+    """Return span durations, LLM calls and token usage in the Prometheus text format."""
+    lines = ["# HELP qa_span_duration_seconds Duration of traced flows, nodes, phases and LLM calls",
+             "# TYPE qa_span_duration_seconds histogram"]
+    with _metrics_lock:
+        durations = {key: list(hist) for key, hist in _durations.items()}
+        tokens = dict(_tokens)
+        calls = dict(_llm_calls)
+    for (kind, name), hist in sorted(durations.items()):
+        labels = _labels(kind=kind, name=name)
+        for bound, count in zip(BUCKETS, hist):
+            lines.append(f'qa_span_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f'qa_span_duration_seconds_bucket{{{labels},le="+Inf"}} {hist[-2]}')
+        lines.append(f"qa_span_duration_seconds_count{{{labels}}} {hist[-2]}")
+        lines.append(f"qa_span_duration_seconds_sum{{{labels}}} {hist[-1]:.6f}")
+    lines += ["# HELP qa_llm_calls_total LLM calls by model and whether the response cache answered",
+              "# TYPE qa_llm_calls_total counter"]
+    for (model, cached), count in sorted(calls.items()):
+        lines.append(f"qa_llm_calls_total{{{_labels(model=model, cached=str(cached).lower())}}} {count}")
+    lines += ["# HELP qa_llm_tokens_total Tokens reported by the API usage field",
+              "# TYPE qa_llm_tokens_total counter"]
+    for (model, kind), count in sorted(tokens.items()):
+        lines.append(f"qa_llm_tokens_total{{{_labels(model=model, type=kind)}}} {count}")
+    return "\n".join(lines) + "\n"
+
+def write_prometheus(path):
+    """Atomically write export_prometheus() to path (e.g. for the node_exporter textfile collector)."""
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(export_prometheus())
+    os.replace(tmp_path, path)
+
+def reset_metrics():
+    with _metrics_lock:
+        _durations.clear()
+        _tokens.clear()
+        _llm_calls.clear()
+
+def record_usage(span, usage):
+    """Copy token counts from an OpenAI-style `usage` object onto an LLM span."""
+    if usage is not None:
+        span.set(prompt_tokens=getattr(usage, "prompt_tokens", None),
+                 completion_tokens=getattr(usage, "completion_tokens", None))
+
+class TraceMixin:
+    """Node mixin that records a span for each run and for its prep, exec and post phases.
+
+    Put it before the PocketFlow base class: class MyNode(TraceMixin, Node).
+    """
+
+    def _run(self, shared):
+        if not _enabled:
+            return super()._run(shared)
+        name = type(self).__name__
+        with span(name, "node"):
+            with span(name + ".prep", "phase"):
+                prep_res = self.prep(shared)
+            with span(name + ".exec", "phase"):
+                exec_res = self._exec(prep_res)
+            with span(name + ".post", "phase"):
+                return self.post(shared, prep_res, exec_res)
+
+    async def _run_async(self, shared):
+        if not _enabled:
+            return await super()._run_async(shared)
+        name = type(self).__name__
+        with span(name, "node"):
+            with span(name + ".prep", "phase"):
+                prep_res = await self.prep_async(shared)
+            with span(name + ".exec", "phase"):
+                exec_res = await self._exec(prep_res)
+            with span(name + ".post", "phase"):
+                return await self.post_async(shared, prep_res, exec_res)
+
+class TraceIdFilter(logging.Filter):
+    """Adds the current trace id to log records as %(trace_id)s ("-" outside a trace)."""
+
+    def filter(self, record):
+        record.trace_id = current_trace_id() or "-"
+        return True
+
+class JsonLogFormatter(logging.Formatter):
+    """Formats log records as one JSON object per line, including the trace id."""
+
+    def format(self, record):
+        entry = {"time": record.created, "level": record.levelname, "logger": record.name,
+                 "trace_id": getattr(record, "trace_id", None) or current_trace_id(),
+                 "message": record.getMessage()}
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+if __name__ == "__main__":
+    import asyncio
+
+    class FakeUsage:
+        prompt_tokens, completion_tokens = 12, 30
+
+    async def llm_call(model):
+        with span("llm", "llm", model=model) as s:
+            await asyncio.sleep(0.01)
+            record_usage(s, FakeUsage())
+
+    async def question(n):
+        with trace(question_id=n) as root:
+            for _ in range(2):
+                with span("AnswerNode", "node"):
+                    await llm_call("deepseek-chat")
+            return root.trace_id
+
+    async def main():
+        return await asyncio.gather(*(question(n) for n in range(3)))
+
+    print(f"Trace ids: {asyncio.run(main())}")
+    print(export_prometheus())
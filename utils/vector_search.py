@@ -2,98 +2,290 @@ import numpy as np
 import faiss
 import os
 
-def create_index(vectors, save_path=None):
+INDEX_TYPES = ("flat", "ivf", "ivfpq", "hnsw")
+
+def _default_nlist(n):
+    # ~4*sqrt(n) lists, while keeping at least 39 training points per centroid
+    return max(1, min(int(4 * np.sqrt(n)), n // 39))
+
+def _default_pq_m(d):
+    # PQ sub-quantizer count must divide the dimension
+    for m in (64, 48, 32, 24, 16, 8, 4, 2):
+        if d % m == 0 and d // m >= 2:
+            return m
+    return 1
+
+def select_training_sample(vectors, nlist, pq_nbits=None, train_size=None, seed=0):
+    """Pick a random training subset large enough for k-means (and PQ codebooks).
+
+    Args:
+        vectors (numpy.ndarray): Normalized float32 vectors of shape (n, dim)
+        nlist (int): Number of IVF lists to train
+        pq_nbits (int, optional): Bits per PQ code, when training a PQ index
+        train_size (int, optional): Explicit sample size, overriding the heuristic
+        seed (int): Random seed for reproducible sampling
+
+    Returns:
+        numpy.ndarray: The training vectors
+    """
+    n = vectors.shape[0]
+    if train_size is None:
+        # FAISS k-means uses at most 256 points per centroid
+        train_size = 256 * nlist
+        if pq_nbits is not None:
+            train_size = max(train_size, 64 * 2 ** pq_nbits)
+    if train_size >= n:
+        return vectors
+    rows = np.random.default_rng(seed).choice(n, size=train_size, replace=False)
+    rows.sort()
+    return vectors[rows]
+
+def create_index(vectors, save_path=None, index_type="flat", nlist=None, pq_m=None, pq_nbits=8,
+                 hnsw_m=32, ef_construction=200, nprobe=None, ef_search=64, train_size=None):
     """Create a FAISS index from vectors.
-    
+
     Args:
         vectors (numpy.ndarray): Array of vectors to index (float32 type)
         save_path (str, optional): Path to save the index
-        
+        index_type (str): "flat" (exact), "ivf", "ivfpq" or "hnsw" (approximate)
+        nlist (int, optional): Number of IVF lists; defaults to ~4*sqrt(n)
+        pq_m (int, optional): PQ sub-quantizers for "ivfpq"; must divide the dimension
+        pq_nbits (int): Bits per PQ sub-quantizer code for "ivfpq"
+        hnsw_m (int): Graph neighbors per node for "hnsw"
+        ef_construction (int): HNSW build-time search depth
+        nprobe (int, optional): Default IVF lists probed per query; defaults to nlist // 16
+        ef_search (int): Default HNSW search depth per query
+        train_size (int, optional): Number of vectors sampled to train IVF/PQ
+
     Returns:
         faiss.Index: The created FAISS index
     """
-    # Convert to numpy array if not already
-    if not isinstance(vectors, np.ndarray):
-        vectors = np.array(vectors, dtype=np.float32)
-    else:
-        # Ensure vectors are float32 type as required by FAISS
-        vectors = vectors.astype(np.float32)
-    
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index_type {index_type!r}, expected one of {INDEX_TYPES}")
+
+    # Copy into a fresh float32 array: normalization below works in place
+    vectors = np.array(vectors, dtype=np.float32)
+
     # Make sure vectors is a 2D array with shape (n, dim)
     if len(vectors.shape) == 1:
         vectors = vectors.reshape(1, -1)
-    
+
     print(f"Vectors shape for index creation: {vectors.shape}")
-    
+
     # Normalize vectors for cosine similarity
     faiss.normalize_L2(vectors)
-    
-    # Get dimensions
-    d = vectors.shape[1]
-    
-    # Create index that uses inner product (for cosine similarity with normalized vectors)
-    index = faiss.IndexFlatIP(d)
-    
+
+    index = make_index(vectors, index_type=index_type, nlist=nlist, pq_m=pq_m, pq_nbits=pq_nbits,
+                       hnsw_m=hnsw_m, ef_construction=ef_construction, nprobe=nprobe,
+                       ef_search=ef_search, train_size=train_size)
+
     # Add vectors to index
     index.add(vectors)
     print(f"Added {index.ntotal} vectors to index")
-    
+
     # Save index if path provided
     if save_path:
         save_index(index, save_path)
-    
+
+    return index
+
+def make_index(vectors, index_type="flat", nlist=None, pq_m=None, pq_nbits=8, hnsw_m=32,
+               ef_construction=200, nprobe=None, ef_search=64, train_size=None):
+    """Create an empty index, trained on `vectors` when the index type needs training.
+
+    Args:
+        vectors (numpy.ndarray): L2-normalized float32 vectors of shape (n, dim)
+        Other arguments: see create_index
+
+    Returns:
+        faiss.Index: An empty index ready for add()
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index_type {index_type!r}, expected one of {INDEX_TYPES}")
+    n, d = vectors.shape
+
+    # All index types use inner product (cosine similarity with normalized vectors)
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(d)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(d, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = ef_construction
+        index.hnsw.efSearch = ef_search
+    else:
+        nlist = nlist or _default_nlist(n)
+        quantizer = faiss.IndexFlatIP(d)
+        if index_type == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, d, nlist, faiss.METRIC_INNER_PRODUCT)
+            sample = select_training_sample(vectors, nlist, train_size=train_size)
+        else:
+            pq_m = pq_m or _default_pq_m(d)
+            index = faiss.IndexIVFPQ(quantizer, d, nlist, pq_m, pq_nbits, faiss.METRIC_INNER_PRODUCT)
+            sample = select_training_sample(vectors, nlist, pq_nbits=pq_nbits, train_size=train_size)
+        # The index owns the quantizer once trained
+        index.own_fields = True
+        quantizer.this.disown()
+        print(f"Training {index_type} index (nlist={nlist}) on {sample.shape[0]} vectors")
+        index.train(sample)
+        index.nprobe = nprobe or max(1, nlist // 16)
+
+    return index
+
+def _base_index(index):
+    # Unwrap ID maps to reach the index that owns the search parameters
+    index = faiss.downcast_index(index)
+    while isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.downcast_index(index.index)
     return index
 
-def search_index(query_vector, index, top_k=5):
+def make_search_params(index, nprobe=None, ef_search=None, allow_ids=None):
+    """Build per-query FAISS search parameters for the given index.
+
+    Passing parameters per call (instead of mutating the index) keeps
+    concurrent searches with different settings thread-safe.
+
+    Args:
+        index (faiss.Index): Index that will be searched
+        nprobe (int, optional): IVF lists to probe
+        ef_search (int, optional): HNSW search depth
+        allow_ids (array-like, optional): Only these ids may be returned
+
+    Returns:
+        faiss.SearchParameters or None: Parameters for index.search
+    """
+    sel = None
+    if allow_ids is not None:
+        sel = faiss.IDSelectorBatch(np.ascontiguousarray(allow_ids, dtype=np.int64))
+    base = _base_index(index)
+    ivf = faiss.try_extract_index_ivf(base)
+    if ivf is not None and (nprobe is not None or sel is not None):
+        # Unset fields fall back to FAISS defaults, not the index's own settings
+        return faiss.SearchParametersIVF(sel=sel, nprobe=nprobe or ivf.nprobe)
+    if isinstance(base, faiss.IndexHNSW) and (ef_search is not None or sel is not None):
+        return faiss.SearchParametersHNSW(sel=sel, efSearch=ef_search or base.hnsw.efSearch)
+    if sel is not None:
+        return faiss.SearchParameters(sel=sel)
+    return None
+
+def ids_matching(metadata, predicate=None, **equals):
+    """Return the ids whose metadata passes a filter, for use as allow_ids.
+
+    Args:
+        metadata (dict): Mapping of id -> metadata dict
+        predicate (callable, optional): Function taking a metadata dict, returning bool
+        **equals: Metadata fields that must equal the given values
+
+    Returns:
+        numpy.ndarray: int64 array of matching ids
+    """
+    return np.fromiter(
+        (i for i, meta in metadata.items()
+         if all(meta.get(key) == value for key, value in equals.items())
+         and (predicate is None or predicate(meta))),
+        dtype=np.int64,
+    )
+
+def prepare_queries(query_vectors, normalized=False):
+    """Return queries as a C-contiguous float32 (n, dim) array, L2-normalized.
+
+    A float32 C-contiguous input that is already normalized is used as-is;
+    otherwise at most one copy is made, and the caller's array is never modified.
+
+    Args:
+        query_vectors (list/array): One query vector or an (n, dim) matrix
+        normalized (bool): Whether the queries are already unit length
+    """
+    queries = np.ascontiguousarray(query_vectors, dtype=np.float32)
+    if queries.ndim == 1:
+        queries = queries.reshape(1, -1)
+    if not normalized:
+        # normalize_L2 works in place, so never let it touch the caller's data
+        if isinstance(query_vectors, np.ndarray) and np.may_share_memory(queries, query_vectors):
+            queries = queries.copy()
+        faiss.normalize_L2(queries)
+    return queries
+
+def search_index_batch(query_vectors, index, top_k=5, nprobe=None, ef_search=None, allow_ids=None,
+                       normalized=False):
+    """Search the FAISS index for many queries in a single call.
+
+    Args:
+        query_vectors (array): Query embeddings of shape (n, dim)
+        index (faiss.Index): FAISS index to search
+        top_k (int): Number of top results to return per query
+        nprobe (int, optional): IVF lists to probe, overriding the index default
+        ef_search (int, optional): HNSW search depth, overriding the index default
+        allow_ids (array-like, optional): Restrict results to these ids, filtered
+            inside FAISS rather than by over-fetching; see ids_matching()
+        normalized (bool): Set when queries are already unit length to skip normalization
+
+    Returns:
+        tuple: (scores, indices) arrays of shape (n, top_k); missing results have index -1
+    """
+    queries = prepare_queries(query_vectors, normalized=normalized)
+    params = make_search_params(index, nprobe, ef_search, allow_ids)
+    return index.search(queries, top_k, params=params)
+
+def search_index(query_vector, index, top_k=5, nprobe=None, ef_search=None, allow_ids=None):
     """Search the FAISS index for similar vectors.
-    
+
     Args:
         query_vector (list/array): The query embedding vector
         index (faiss.Index): FAISS index to search
         top_k (int): Number of top results to return
-        
+        nprobe (int, optional): IVF lists to probe, overriding the index default
+        ef_search (int, optional): HNSW search depth, overriding the index default
+        allow_ids (array-like, optional): Restrict results to these ids
+
     Returns:
         tuple: (scores, indices) where scores contains similarity scores 
                and indices contains the corresponding indices in the original vector list
     """
-    # Convert to numpy array if not already
-    if not isinstance(query_vector, np.ndarray):
-        query_vector = np.array(query_vector, dtype=np.float32)
-    else:
-        # Ensure vector is float32 type as required by FAISS
-        query_vector = query_vector.astype(np.float32)
-    
-    # Make sure query_vector is a 2D array with shape (1, dim)
-    if len(query_vector.shape) == 1:
-        query_vector = query_vector.reshape(1, -1)
-    
-    # Normalize query vector for cosine similarity
-    faiss.normalize_L2(query_vector)
-    
-    # Search the index
-    scores, indices = index.search(query_vector, top_k)
-    
-    # Return raw scores and indices
+    scores, indices = search_index_batch(query_vector, index, top_k, nprobe=nprobe, ef_search=ef_search,
+                                         allow_ids=allow_ids)
     return scores[0], indices[0]
 
 def save_index(index, path):
     """Save a FAISS index to disk.
-    
+
+    The index is written to a temporary file in the same directory and then
+    renamed over `path`, so readers never see a partially written index.
+
     Args:
         index (faiss.Index): FAISS index to save
         path (str): Path to save the index
     """
-    faiss.write_index(index, path)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        faiss.write_index(index, tmp_path)
+        with open(tmp_path, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
-def load_index(path):
+def load_index(path, mmap=False):
     """Load a FAISS index from disk.
-    
+
     Args:
         path (str): Path to the saved index
-        
+        mmap (bool): Memory-map the index read-only instead of reading it into RAM.
+            Worker processes that map the same file share one page-cached copy.
+
     Returns:
         faiss.Index: The loaded FAISS index
     """
+    if mmap:
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+        ifc = getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+        if ifc:
+            # Zero-copy mapping works for flat and HNSW storage; IVF inverted
+            # lists reject it, so those fall back to the plain mmap reader
+            try:
+                return faiss.read_index(path, flags | ifc)
+            except RuntimeError:
+                pass
+        return faiss.read_index(path, flags)
     return faiss.read_index(path)
 
 if __name__ == "__main__":
@@ -139,6 +331,12 @@ if __name__ == "__main__":
         if idx >= 0:  # Valid index
             print(f"  Result {i+1}: Score: {loaded_scores[i]:.4f}, Index: {idx}")
             
+    # Batch search with an id allow-list
+    metadata = {i: {"source": "even" if i % 2 == 0 else "odd"} for i in range(num_vectors)}
+    batch_scores, batch_indices = search_index_batch(
+        sample_embeddings[:3], index, top_k=3, allow_ids=ids_matching(metadata, source="even"))
+    print(f"\nBatch search restricted to even ids: {batch_indices.tolist()}")
+
     # Example: Using search results to get original vectors
     print("\nRetrieving original vectors by index:")
     for i, idx in enumerate(indices[:3]):  # Just show first 3
@@ -1,47 +1,186 @@
+import bisect
+import json
+import os
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 from bs4 import BeautifulSoup
 from youtube_transcript_api import YouTubeTranscriptApi
 
+from utils.rate_limiter import bind_priority, get_limiter
+from utils.text_chunker import iter_chunk_spans
+
+CACHE_DIR = os.environ.get("YOUTUBE_CACHE_DIR", os.path.join(".cache", "youtube"))
+LANGUAGES = ['ar', 'en']
+OEMBED_URL = "https://www.youtube.com/oembed"
+# Requests per second and in flight to YouTube, shared by all threads
+RATE_LIMIT = float(os.environ.get("YOUTUBE_RATE_LIMIT", 5))
+MAX_CONCURRENCY = int(os.environ.get("YOUTUBE_MAX_CONCURRENCY", 8))
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """Process-wide session so page, oEmbed and transcript requests reuse connections."""
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        with _session_lock:
+            if _session is None or _session_pid != os.getpid():
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_maxsize=32)
+                session.mount("https://", adapter)
+                _session, _session_pid = session, os.getpid()
+    return _session
+
+def _limiter():
+    return get_limiter("youtube", rate=RATE_LIMIT, max_concurrency=MAX_CONCURRENCY)
+
+def _get(url, **kwargs):
+    response = get_session().get(url, timeout=10, **kwargs)
+    if response.status_code == 429:
+        response.raise_for_status()  # let the limiter back off and retry
+    return response
+
 def extract_video_id(url):
     """Extract YouTube video ID from URL"""
     pattern = r'(?:v=|\/)([0-9A-Za-z_-]{11})'
     match = re.search(pattern, url)
     return match.group(1) if match else None
 
-def get_video_info(url):
+def fetch_title(video_id):
+    """Get the video title from the small oEmbed JSON, falling back to the watch page"""
+    url = f"https://www.youtube.com/watch?v={video_id}"
+    response = _limiter().call(_get, OEMBED_URL, params={"url": url, "format": "json"})
+    if response.status_code == 200:
+        return response.json()["title"]
+    response = _limiter().call(_get, url)
+    soup = BeautifulSoup(response.text, 'html.parser')
+    title_tag = soup.find('title')
+    return title_tag.text.replace(" - YouTube", "")
+
+def fetch_segments(video_id, languages=LANGUAGES):
+    """Get the transcript as a list of {"text", "start", "duration"} segments"""
+    if hasattr(YouTubeTranscriptApi, "get_transcript"):
+        # youtube_transcript_api < 1.0
+        return _limiter().call(YouTubeTranscriptApi.get_transcript, video_id, languages=languages)
+    api = YouTubeTranscriptApi(http_client=get_session())
+    return _limiter().call(api.fetch, video_id, languages=languages).to_raw_data()
+
+class TranscriptCache:
+    """One JSON file per video ID holding its title and transcript segments."""
+
+    def __init__(self, directory=CACHE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, video_id):
+        return os.path.join(self.directory, f"{video_id}.json")
+
+    def get(self, video_id):
+        try:
+            with open(self._path(video_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, video_id, entry):
+        path = self._path(video_id)
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+_cache = None
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _session_lock:
+            if _cache is None:
+                _cache = TranscriptCache()
+    return _cache
+
+def _video_info(video_id, executor, use_cache):
+    cache = get_cache() if use_cache else None
+    entry = cache.get(video_id) if cache else None
+    if entry is None:
+        # Title and transcript are independent requests, so run them side by side
+        title = executor.submit(bind_priority(fetch_title), video_id)
+        segments = fetch_segments(video_id)
+        entry = {"title": title.result(), "segments": segments}
+        if cache:
+            cache.set(video_id, entry)
+    return {
+        "title": entry["title"],
+        "transcript": " ".join(segment["text"] for segment in entry["segments"]),
+        "segments": entry["segments"],
+        "thumbnail_url": f"https://img.youtube.com/vi/{video_id}/maxresdefault.jpg",
+        "video_id": video_id
+    }
+
+def get_video_info_many(urls, max_workers=8, use_cache=True):
+    """Get video info for many URLs concurrently, in input order.
+
+    Transcripts and titles are cached on disk by video ID, so reprocessing a
+    playlist only fetches the videos that are new. Each result has the same
+    keys as get_video_info(), or "error" on failure.
+    """
+    video_ids = [extract_video_id(url) for url in urls]
+    unique = list(dict.fromkeys(video_id for video_id in video_ids if video_id))
+    # Title lookups get their own pool so they never wait behind transcript tasks
+    with ThreadPoolExecutor(max_workers=max_workers) as title_executor, \
+            ThreadPoolExecutor(max_workers=max_workers) as executor:
+        def one(video_id):
+            try:
+                return _video_info(video_id, title_executor, use_cache)
+            except Exception as e:
+                return {"error": str(e)}
+        results = dict(zip(unique, executor.map(bind_priority(one), unique)))
+    return [results[video_id] if video_id else {"error": "Invalid YouTube URL"} for video_id in video_ids]
+
+def get_video_info(url, use_cache=True):
     """Get video title, transcript and thumbnail"""
-    video_id = extract_video_id(url)
-    if not video_id:
-        return {"error": "Invalid YouTube URL"}
-    
-    try:
-        # Get title using BeautifulSoup
-        response = requests.get(url)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        title_tag = soup.find('title')
-        title = title_tag.text.replace(" - YouTube", "")
-        
-        # Get thumbnail
-        thumbnail_url = f"https://img.youtube.com/vi/{video_id}/maxresdefault.jpg"
-        
-        # Get transcript
-        transcript_list = YouTubeTranscriptApi.get_transcript(video_id, languages=['ar', 'en'])
-        transcript = " ".join([entry["text"] for entry in transcript_list])
-        
-        return {
-            "title": title,
-            "transcript": transcript,
-            "thumbnail_url": thumbnail_url,
-            "video_id": video_id
-        }
-    except Exception as e:
-        return {"error": str(e)}
+    return get_video_info_many([url], max_workers=1, use_cache=use_cache)[0]
+
+def transcript_chunks(segments, chunk_size=2000, overlap=500, max_tokens=None):
+    """Split transcript segments into chunks that keep their timestamps.
+
+    The segments are joined with spaces and chunked with the text chunker;
+    each chunk reports the start of its first segment and the end of its
+    last one.
+
+    Returns:
+        list: {"text", "start", "end"} dicts
+    """
+    texts = [segment["text"] for segment in segments]
+    text = " ".join(texts)
+    offsets, pos = [], 0
+    for segment_text in texts:
+        offsets.append(pos)
+        pos += len(segment_text) + 1
+
+    chunks = []
+    for offset, length in iter_chunk_spans(text, chunk_size=chunk_size, overlap=overlap, max_tokens=max_tokens):
+        first = bisect.bisect_right(offsets, offset) - 1
+        last = bisect.bisect_right(offsets, offset + length - 1) - 1
+        chunks.append({
+            "text": text[offset:offset + length],
+            "start": segments[first]["start"],
+            "end": segments[last]["start"] + segments[last]["duration"],
+        })
+    return chunks
 
 if __name__ == "__main__":
     test_url = "https://www.youtube.com/watch?v=qSERnxerkc8"
     result = get_video_info(test_url)
     print(f"Title: {result.get('title')}")
-    print(f"Transcript: {result.get('transcript', '')[:150]}...") 
+    print(f"Transcript: {result.get('transcript', '')[:150]}...")
     print(f"Thumbnail URL: {result.get('thumbnail_url')}")
-    print(f"Video ID: {result.get('video_id')}")
\ No newline at end of file
+    print(f"Video ID: {result.get('video_id')}")
+    if "segments" in result:
+        chunks = transcript_chunks(result["segments"], chunk_size=1000, overlap=200)
+        print(f"{len(result['segments'])} segments -> {len(chunks)} chunks, "
+              f"first spans {chunks[0]['start']:.1f}s-{chunks[0]['end']:.1f}s")